@@ -0,0 +1,193 @@
+"""
+Benchmarks locais do verificador de prêmios (modal_scraper_v4).
+
+Não fazem parte do runtime: rodam fora do Modal, contra as funções do módulo.
+
+Uso:
+    python benchmarks/benchmark_verificacao.py matchers
+    python benchmarks/benchmark_verificacao.py payload
+    python benchmarks/benchmark_verificacao.py memoria
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modal_scraper_v4 as v4  # noqa: E402
+
+
+def benchmark_matchers(repeticoes: int = 100000) -> dict:
+    """
+    Micro-benchmark por modalidade do custo de despacho (ns por chamada):
+    - cadeia: achar o ramo testando os códigos na ordem da antiga cadeia if/elif
+    - registro: resolver_matcher (dict + lru_cache)
+    - plano: matcher já ligado no BetPlan (sem despacho)
+    e a chamada completa com matcher do plano vs verificar_modalidade.
+    """
+    import time
+
+    # Testes na ordem da antiga cadeia if/elif (só o despacho; o corpo do ramo não conta)
+    cadeia_antiga = (
+        lambda m: m == "milhar", lambda m: m == "milhar_ct", lambda m: m.startswith("milhar_inv"),
+        lambda m: m == "centena", lambda m: m == "centena_esquerda" or m == "centena_esq",
+        lambda m: m == "centena_3x", lambda m: m.startswith("centena_inv"),
+        lambda m: m == "dezena", lambda m: m == "dezena_esq", lambda m: m == "dezena_meio",
+        lambda m: m == "grupo", lambda m: m == "grupo_esq", lambda m: m == "grupo_meio",
+        lambda m: m == "unidade", lambda m: m.startswith("duque_dez"), lambda m: m.startswith("duque_gp"),
+        lambda m: m.startswith("terno_dez"), lambda m: m.startswith("terno_gp"),
+        lambda m: m.startswith("quadra_gp"), lambda m: m.startswith("quina_gp"),
+        lambda m: m.startswith("sena_gp"), lambda m: m == "passe_vai", lambda m: m == "passe_vai_vem",
+        lambda m: m == "palpitao",
+        lambda m: m.startswith("lotinha_") or m.startswith("quininha_") or m.startswith("seninha_"),
+    )
+
+    def despacho_cadeia(m):
+        for teste in cadeia_antiga:
+            if teste(m):
+                return teste
+        return None
+
+    def ns_por_chamada(funcao, *args) -> float:
+        inicio = time.perf_counter_ns()
+        for _ in range(repeticoes):
+            funcao(*args)
+        return (time.perf_counter_ns() - inicio) / repeticoes
+
+    resultado = {f"premio_{i}": f"{(i * 1237) % 10000:04d}" for i in range(1, 11)}
+    casos = {
+        "milhar": ["1237"], "centena": ["237"], "grupo": ["10"], "duque_dez_esq": ["24", "12"],
+        "terno_gp": ["1", "10", "20"], "quina_gp": [str(g) for g in range(1, 9)],
+        "passe_vai_vem": ["10", "25"], "palpitao": ["1237"], "seninha_14": ["01-02-03-37-49-61"],
+    }
+    relatorio = {}
+    for modalidade, palpites in casos.items():
+        plano = v4.BetPlan({"id": "bench", "modalidade": modalidade, "palpites": palpites, "colocacao": "1_ao_5_premio", "loterias": []})
+        features = v4.ResultadoFeatures(resultado, plano.posicoes)
+        matcher = plano.matcher
+        relatorio[modalidade] = {
+            "despacho_cadeia_ns": round(ns_por_chamada(despacho_cadeia, modalidade)),
+            "despacho_registro_ns": round(ns_por_chamada(v4.resolver_matcher, modalidade)),
+            "despacho_plano_ns": round(ns_por_chamada(lambda: matcher)),
+            "chamada_plano_ns": round(ns_por_chamada(v4.verificar_com_matcher, matcher, plano.palpites, features, plano.posicoes)),
+            "chamada_verificar_modalidade_ns": round(ns_por_chamada(v4.verificar_modalidade, modalidade, plano.palpites, features, plano.posicoes)),
+        }
+        print(f"  {modalidade:>14}: {relatorio[modalidade]}")
+    return relatorio
+
+
+def _apostas_sinteticas(n_apostas: int, semente: int) -> list:
+    """Apostas pendentes sintéticas com todas as colunas da tabela (formato do select("*"))"""
+    import random
+    import uuid
+
+    rnd = random.Random(semente)
+    loteria_ids = list(v4.LOTERIA_TO_BANCA)
+    completas = []
+    for n in range(n_apostas):
+        loterias = rnd.sample(loteria_ids, rnd.randint(1, 3))
+        completas.append({
+            "colocacao": rnd.choice(["1_premio", "1_ao_5_premio", "1_ao_10_premio"]),
+            "created_at": f"2026-01-29T{rnd.randrange(24):02d}:{rnd.randrange(60):02d}:{rnd.randrange(60):02d}.{rnd.randrange(10**6):06d}+00:00",
+            "data_jogo": "2026-01-29",
+            "horarios": sorted({v4.LOTERIA_TO_BANCA[lid][1] for lid in loterias}),
+            "id": str(uuid.UUID(int=rnd.getrandbits(128))),
+            "loterias": loterias,
+            "modalidade": rnd.choice(["milhar", "centena", "grupo", "dezena", "duque_gp", "terno_dez", "milhar_ct"]),
+            "multiplicador": rnd.choice([0, 4000, 600, 18]),
+            "palpites": [f"{rnd.randrange(10000):04d}" for _ in range(rnd.randint(1, 3))],
+            "platform_id": str(uuid.UUID(int=rnd.getrandbits(128) % 4)),
+            "premio_valor": None,
+            "pule": f"{rnd.randrange(10**8):08d}",
+            "status": "pendente",
+            "tipo": "bicho",
+            "user_id": str(uuid.UUID(int=rnd.getrandbits(128))),
+            "valor_total": 10.0,
+            "valor_unitario": 2.0,
+        })
+    return completas
+
+
+def benchmark_payload_apostas(n_apostas: int = 50000, semente: int = 7) -> dict:
+    """
+    Tamanho e custo de decode das apostas pendentes em três formatos (n_apostas sintéticas
+    com as colunas da tabela): select("*"), select projetado e o payload colunar da RPC.
+    ms = melhor de 3 (json.loads + linhas prontas para o BetPlan); memória = pico do tracemalloc.
+    """
+    import json
+    import time
+    import tracemalloc
+
+    completas = _apostas_sinteticas(n_apostas, semente)
+    projetadas = [{c: a[c] for c in v4.COLUNAS_APOSTAS_VERIFICACAO} for a in completas]
+    colunar = {c: [a[c] for a in completas] for c in v4.COLUNAS_APOSTAS_VERIFICACAO}
+
+    formatos = {
+        "completo": (json.dumps(completas), lambda corpo: json.loads(corpo)),
+        "projetado": (json.dumps(projetadas), lambda corpo: json.loads(corpo)),
+        "colunar": (json.dumps(colunar), lambda corpo: v4._linhas_colunares(json.loads(corpo))),
+    }
+    relatorio = {}
+    for nome, (corpo, decodificar) in formatos.items():
+        tempos = []
+        for _ in range(3):
+            inicio = time.perf_counter()
+            linhas = decodificar(corpo)
+            tempos.append(time.perf_counter() - inicio)
+            del linhas
+        tracemalloc.start()
+        linhas = decodificar(corpo)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del linhas
+        relatorio[nome] = {
+            "bytes": len(corpo.encode()),
+            "decode_ms": round(min(tempos) * 1000, 1),
+            "pico_memoria_mb": round(pico / 2**20, 1),
+        }
+    base = relatorio["completo"]
+    for nome in ("projetado", "colunar"):
+        relatorio[nome]["bytes_economizados"] = base["bytes"] - relatorio[nome]["bytes"]
+        relatorio[nome]["ms_economizados"] = round(base["decode_ms"] - relatorio[nome]["decode_ms"], 1)
+    for nome, linha in relatorio.items():
+        print(f"  {nome:>9}: {linha}")
+    return relatorio
+
+
+def benchmark_memoria_apostas(n_apostas: int = 200000, semente: int = 7) -> dict:
+    """
+    Memória do working set da verificação para n_apostas sintéticas (tracemalloc, MB):
+    linhas PostgREST (dicts projetados) vs v4.BetPlan compactos, e o pico de RSS do processo.
+    """
+    import gc
+    import json
+    import tracemalloc
+
+    linhas_json = json.dumps([{c: a[c] for c in v4.COLUNAS_APOSTAS_VERIFICACAO} for a in _apostas_sinteticas(n_apostas, semente)])
+    relatorio = {"apostas": n_apostas}
+    for nome, montar in (("linhas", lambda: json.loads(linhas_json)), ("planos", lambda: [v4.BetPlan(a) for a in json.loads(linhas_json)])):
+        gc.collect()
+        tracemalloc.start()
+        conjunto = montar()
+        atual, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del conjunto
+        relatorio[nome] = {"mb": round(atual / 2**20, 1), "bytes_por_aposta": round(atual / n_apostas), "pico_mb": round(pico / 2**20, 1)}
+    relatorio["pagina_planos_mb"] = round(relatorio["planos"]["bytes_por_aposta"] * v4.TAMANHO_PAGINA_APOSTAS / 2**20, 2)
+    relatorio["pico_rss_mb"] = round(v4.pico_rss_mb(), 1)
+    print(f"  {relatorio}")
+    return relatorio
+
+
+COMANDOS = {
+    "matchers": benchmark_matchers,
+    "payload": benchmark_payload_apostas,
+    "memoria": benchmark_memoria_apostas,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks locais do verificador de prêmios")
+    parser.add_argument("comando", choices=sorted(COMANDOS))
+    resultado = COMANDOS[parser.parse_args().comando]()
+    print(f"\nResultado: {resultado}")
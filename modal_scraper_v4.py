@@ -4,10 +4,14 @@ Correções: payout atômico via RPC, cron com timezone, parsing robusto
 """
 
 import modal
+from array import array
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial
 from typing import Optional
 import os
 import re
+import sys
+import threading
 
 # Fuso horário de Brasília (UTC-3)
 FUSO_BRASILIA = timezone(timedelta(hours=-3))
@@ -29,6 +33,7 @@ image = modal.Image.debian_slim(python_version="3.11").pip_install(
     "beautifulsoup4",
     "supabase",
     "requests",
+    "numpy",
 )
 
 # Secrets
@@ -190,6 +195,75 @@ def log_fallback(estado: str, de: str, para: str, motivo: str):
     print(f"[{estado}] 🔄 FALLBACK: {de} → {para} (motivo: {motivo})")
 
 
+# =============================================================================
+# RECURSOS DO CONTAINER (reaproveitados entre invocações)
+# =============================================================================
+
+HEADERS_HTTP = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept": "text/html,application/xhtml+xml",
+    "Accept-Language": "pt-BR,pt;q=0.9",
+}
+
+# Milhar isolada em célula de tabela (hot path dos parsers)
+RE_MILHAR = re.compile(r'\b(\d{4})\b')
+
+# requests.Session não é thread-safe: uma sessão por thread (modo batch usa um pool de threads)
+_sessoes_http = threading.local()
+_cliente_supabase = None
+
+
+def sessao_http():
+    """requests.Session da thread atual: pool de conexões keep-alive reaproveitado entre chamadas"""
+    sessao = getattr(_sessoes_http, "sessao", None)
+    if sessao is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        sessao = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8)
+        sessao.mount("https://", adapter)
+        sessao.mount("http://", adapter)
+        _sessoes_http.sessao = sessao
+    return sessao
+
+
+def cliente_supabase():
+    """Cliente Supabase do container (criado uma vez, reaproveitado nas chamadas quentes)"""
+    global _cliente_supabase
+    if _cliente_supabase is None:
+        from supabase import create_client
+
+        _cliente_supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_ROLE_KEY"])
+    return _cliente_supabase
+
+
+# Pool de processos para parse (só no modo batch - ver scrape_estado_batch)
+_pool_parse = None
+
+# CPUs reservadas para o ScraperWorker (cpu= do @app.cls) e tamanho do pool de parse.
+# os.cpu_count() enxerga o host, não a cota do container.
+CPU_WORKER = 2.0
+MAX_PROCESSOS_PARSE = 2
+
+
+def _parsear_html(html: str, data: str, banca: str, parser: str = "resultadofacil", estado: Optional[str] = None) -> list:
+    """Parse de HTML de uma fonte (top-level para rodar num processo do pool)"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    if parser == "portalbrasil":
+        return parse_portalbrasil(soup, data, banca, estado)
+    return parse_resultados(soup, data, banca)
+
+
+def parsear_html(html: str, data: str, banca: str, parser: str = "resultadofacil", estado: Optional[str] = None) -> list:
+    """Parse no pool de processos quando ativo (modo batch), senão inline"""
+    if _pool_parse is not None:
+        return _pool_parse.submit(_parsear_html, html, data, banca, parser, estado).result()
+    return _parsear_html(html, data, banca, parser, estado)
+
+
 # =============================================================================
 # FONTE 2: PORTALBRASIL.NET (BACKUP)
 # =============================================================================
@@ -198,9 +272,6 @@ def scrape_portalbrasil(estado: str, data: str, banca: str) -> list:
     """
     Scrape do PortalBrasil.net - fonte secundária com bicho incluso
     """
-    import requests
-    from bs4 import BeautifulSoup
-
     config = ESTADOS_CONFIG.get(estado)
     if not config or not config.get("portalbrasil_slug"):
         log_warning(estado, "PortalBrasil", "Estado não configurado para esta fonte")
@@ -210,20 +281,13 @@ def scrape_portalbrasil(estado: str, data: str, banca: str) -> list:
     log_info(estado, "PortalBrasil", f"Acessando: {url}")
 
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Accept": "text/html,application/xhtml+xml",
-            "Accept-Language": "pt-BR,pt;q=0.9",
-        }
-
-        response = requests.get(url, headers=headers, timeout=30)
+        response = sessao_http().get(url, headers=HEADERS_HTTP, timeout=30)
         response.raise_for_status()
 
         html = response.text
         log_info(estado, "PortalBrasil", f"HTML recebido: {len(html)} bytes")
 
-        soup = BeautifulSoup(html, "html.parser")
-        resultados = parse_portalbrasil(soup, data, banca, estado)
+        resultados = parsear_html(html, data, banca, "portalbrasil", estado)
 
         if resultados:
             log_success(estado, "PortalBrasil", f"Encontrados {len(resultados)} resultados")
@@ -232,14 +296,8 @@ def scrape_portalbrasil(estado: str, data: str, banca: str) -> list:
 
         return resultados
 
-    except requests.exceptions.Timeout:
-        log_error(estado, "PortalBrasil", "Timeout ao acessar")
-        return []
-    except requests.exceptions.RequestException as e:
-        log_error(estado, "PortalBrasil", f"Erro de conexão: {e}")
-        return []
     except Exception as e:
-        log_error(estado, "PortalBrasil", f"Erro inesperado: {e}")
+        log_error(estado, "PortalBrasil", f"Erro ({type(e).__name__}): {e}")
         return []
 
 
@@ -334,20 +392,13 @@ def scrape_federal_requests(data: str) -> list:
     que lista todos os resultados recentes (a pagina por data retorna vazio).
     Filtra pelo resultado da data solicitada.
     """
-    import requests
     from bs4 import BeautifulSoup
 
     url = "https://www.resultadofacil.com.br/ultimos-resultados-da-federal"
     log_info("FED", "Requests/Federal", f"Acessando: {url}")
 
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Accept": "text/html,application/xhtml+xml",
-            "Accept-Language": "pt-BR,pt;q=0.9",
-        }
-
-        response = requests.get(url, headers=headers, timeout=30)
+        response = sessao_http().get(url, headers=HEADERS_HTTP, timeout=30)
         response.raise_for_status()
 
         html = response.text
@@ -435,7 +486,6 @@ def scrape_boasorte_requests(data: str) -> list:
     URL: https://lookgoias.com/boa-sorte-loterias-DD-MM-YYYY
     Horarios: 09:20, 11:20, 14:20, 16:20, 18:20, 21:20
     """
-    import requests
     from bs4 import BeautifulSoup
 
     # Converter data de YYYY-MM-DD para DD-MM-YYYY
@@ -445,13 +495,7 @@ def scrape_boasorte_requests(data: str) -> list:
     log_info("BS", "Requests/BoaSorte", f"Acessando: {url}")
 
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Accept": "text/html,application/xhtml+xml",
-            "Accept-Language": "pt-BR,pt;q=0.9",
-        }
-
-        response = requests.get(url, headers=headers, timeout=30)
+        response = sessao_http().get(url, headers=HEADERS_HTTP, timeout=30)
         response.raise_for_status()
 
         html = response.text
@@ -503,7 +547,7 @@ def scrape_boasorte_requests(data: str) -> list:
                 # Busca célula com 4 dígitos (milhar)
                 for cell in cells:
                     text = cell.get_text(strip=True)
-                    milhar_match = re.search(r'\b(\d{4})\b', text)
+                    milhar_match = RE_MILHAR.search(text)
                     if milhar_match:
                         bicho = ""
                         if len(cells) > 2:
@@ -537,7 +581,7 @@ def scrape_boasorte_requests(data: str) -> list:
             try:
                 url_fallback = "https://hojenobicho.com/resultados/bs/"
                 log_fallback("BS", "lookgoias.com", "hojenobicho.com", "sem resultados")
-                resp2 = requests.get(url_fallback, headers=headers, timeout=30)
+                resp2 = sessao_http().get(url_fallback, headers=HEADERS_HTTP, timeout=30)
                 resp2.raise_for_status()
                 soup2 = BeautifulSoup(resp2.text, "html.parser")
 
@@ -564,7 +608,7 @@ def scrape_boasorte_requests(data: str) -> list:
                             continue
                         for cell in cells:
                             text = cell.get_text(strip=True)
-                            milhar_match = re.search(r'\b(\d{4})\b', text)
+                            milhar_match = RE_MILHAR.search(text)
                             if milhar_match:
                                 bicho = ""
                                 if len(cells) > 2:
@@ -614,26 +658,17 @@ def scrape_resultadofacil_requests(url: str, estado: str, data: str, banca: str)
     """
     Scrape ResultadoFacil usando requests direto (método primário)
     """
-    import requests
-    from bs4 import BeautifulSoup
 
     log_info(estado, "Requests", f"Acessando: {url}")
 
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Accept": "text/html,application/xhtml+xml",
-            "Accept-Language": "pt-BR,pt;q=0.9",
-        }
-
-        response = requests.get(url, headers=headers, timeout=30)
+        response = sessao_http().get(url, headers=HEADERS_HTTP, timeout=30)
         response.raise_for_status()
 
         html_content = response.text
         log_info(estado, "Requests", f"HTML recebido: {len(html_content)} bytes")
 
-        soup = BeautifulSoup(html_content, "html.parser")
-        resultados = parse_resultados(soup, data, banca)
+        resultados = parsear_html(html_content, data, banca)
 
         if resultados:
             log_success(estado, "Requests", f"Encontrados {len(resultados)} resultados")
@@ -651,13 +686,12 @@ def scrape_resultadofacil_requests(url: str, estado: str, data: str, banca: str)
 # FUNCAO PRINCIPAL v4: requests → PortalBrasil → Firecrawl (fallback)
 # =============================================================================
 
-@app.function(image=image, secrets=[supabase_secret, firecrawl_secret], timeout=300)
-def scrape_estado(estado: str, data: Optional[str] = None) -> dict:
+def scrape_estado(estado: str, data: Optional[str] = None, usar_firecrawl: bool = True) -> dict:
     """
     Scrape otimizado v4 - ordem invertida para economia de créditos:
     1. ResultadoFacil via requests (grátis)
     2. PortalBrasil via requests (grátis)
-    3. Firecrawl (fallback pago - só se os outros falharem)
+    3. Firecrawl (fallback pago - só se os outros falharem e usar_firecrawl=True)
     """
     config = ESTADOS_CONFIG.get(estado)
     if not config:
@@ -757,12 +791,15 @@ def scrape_estado(estado: str, data: Optional[str] = None) -> dict:
     # =========================================================================
     # TENTATIVA 3: Firecrawl (FALLBACK PAGO - só quando necessário)
     # =========================================================================
-    if not resultados:
+    if not resultados and not usar_firecrawl:
+        log_info(estado, "Firecrawl", "Fallback pago adiado (sorteio ainda dentro do limiar de atraso)")
+        tentativas.append({"fonte": "Firecrawl", "status": "adiado"})
+
+    elif not resultados:
         log_fallback(estado, "PortalBrasil", "Firecrawl", "sem resultados em fontes gratuitas")
 
         try:
             from firecrawl import Firecrawl
-            from bs4 import BeautifulSoup
 
             api_key = os.environ.get("FIRECRAWL_API_KEY")
             if not api_key:
@@ -784,8 +821,7 @@ def scrape_estado(estado: str, data: Optional[str] = None) -> dict:
                     log_info(estado, "Firecrawl", f"HTML: {len(html_content)} bytes (1 crédito gasto)")
 
                     if html_content:
-                        soup = BeautifulSoup(html_content, "html.parser")
-                        resultados = parse_resultados(soup, data_scrape, config['banca'])
+                        resultados = parsear_html(html_content, data_scrape, config['banca'])
 
                     if resultados:
                         log_success(estado, "Firecrawl", f"✓ {len(resultados)} resultados encontrados")
@@ -1144,7 +1180,7 @@ def extrair_premios_tabela(table) -> list:
         # Busca célula com 4 dígitos (milhar)
         for i, cell in enumerate(cells):
             text = cell.get_text(strip=True)
-            milhar_match = re.search(r'\b(\d{4})\b', text)
+            milhar_match = RE_MILHAR.search(text)
             if milhar_match:
                 bicho = ""
                 # Tenta pegar bicho da última célula
@@ -1179,7 +1215,6 @@ def scrape_caixa_loterias(data_alvo: str) -> list:
     Retorna lista de dicts prontos para upsert na tabela resultados.
     As dezenas são armazenadas como CSV em premio_1 (ex: "02,05,06,08,09,11,14,16,17,18,19,20,22,23,25").
     """
-    import requests
 
     resultados = []
     base_url = "https://servicebus2.caixa.gov.br/portaldeloterias/api"
@@ -1187,7 +1222,7 @@ def scrape_caixa_loterias(data_alvo: str) -> list:
     for jogo, config in CAIXA_LOTERIAS.items():
         try:
             url = f"{base_url}/{jogo}/"
-            resp = requests.get(url, timeout=15)
+            resp = sessao_http().get(url, timeout=15)
             resp.raise_for_status()
             data = resp.json()
 
@@ -1282,8 +1317,11 @@ def _upsert_resultados_caixa(supabase, resultados_caixa: list) -> int:
 # FUNCAO PRINCIPAL v4
 # =============================================================================
 
-def _upsert_resultados(supabase, todos_resultados: list) -> int:
-    """Salva resultados no Supabase, retorna quantidade upserted"""
+def _upsert_resultados(supabase, todos_resultados: list, rastreador: Optional["RastreadorSorteios"] = None) -> int:
+    """
+    Salva resultados no Supabase, retorna quantidade upserted.
+    Com rastreador, cada sorteio salvo sai imediatamente da fila de polling.
+    """
     upserted = 0
     for r in todos_resultados:
         premios = r.get("premios", [])
@@ -1317,51 +1355,85 @@ def _upsert_resultados(supabase, todos_resultados: list) -> int:
                 "bicho_10": premios[9].get("bicho", "") if len(premios) > 9 else None,
             }, on_conflict="data,horario,banca,loteria").execute()
             upserted += 1
+            if rastreador:
+                rastreador.retirar(r["data"], r["banca"], r["horario"])
         except Exception:
             pass
     return upserted
 
 
+def scrape_estado_batch(estados: list, data: Optional[str] = None, max_threads: int = 8, max_processos: Optional[int] = None) -> list:
+    """
+    Modo batch: roda o pipeline de todos os estados dentro de um único container.
+    Threads fazem o fetch (I/O), um pool de processos faz o parse (bs4, CPU).
+    Retorna a mesma lista de dicts por estado que o fan-out de scrape_estado.
+    """
+    global _pool_parse
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    data_scrape = data or hoje_brasilia()
+    respostas = []
+    # forkserver: os processos não herdam locks (urllib3/ssl) das threads de fetch
+    contexto = multiprocessing.get_context("forkserver")
+    with ProcessPoolExecutor(max_workers=max_processos or MAX_PROCESSOS_PARSE, mp_context=contexto) as pool:
+        _pool_parse = pool
+        try:
+            with ThreadPoolExecutor(max_workers=max_threads) as threads:
+                futures = [threads.submit(scrape_estado, estado, data_scrape) for estado in estados]
+                for estado, future in zip(estados, futures):
+                    try:
+                        respostas.append(future.result())
+                    except Exception as e:
+                        log_error(estado, "Batch", f"Exceção: {e}")
+                        respostas.append({"estado": estado, "error": str(e), "resultados": []})
+        finally:
+            _pool_parse = None
+    return respostas
+
+
 @app.function(image=image, secrets=[supabase_secret], timeout=900)
-def scrape_todos_v4(data: Optional[str] = None, estados: Optional[list] = None) -> dict:
+def scrape_todos_v4(data: Optional[str] = None, estados: Optional[list] = None, modo: str = "fanout") -> dict:
     """
     Scrape todos os estados usando v4 (requests primeiro)
+    modo="fanout": uma chamada scrape_estado.remote por estado
+    modo="batch": todos os estados num único container (scrape_estado_batch)
     """
-    from supabase import create_client
     import time
 
-    supabase_url = os.environ["SUPABASE_URL"]
-    supabase_key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-    supabase = create_client(supabase_url, supabase_key)
+    supabase = cliente_supabase()
 
     data_scrape = data or hoje_brasilia()
     estados_scrape = estados or list(ESTADOS_CONFIG.keys())
 
-    print(f"=== Scrape V4 (requests-first) iniciado: {data_scrape} ===")
+    print(f"=== Scrape V4 (requests-first, modo={modo}) iniciado: {data_scrape} ===")
     print(f"Estados: {estados_scrape}")
 
     todos_resultados = []
     erros = []
     total_creditos = 0
 
-    for estado in estados_scrape:
-        try:
-            resultado = scrape_estado.remote(estado, data_scrape)
-
-            if resultado.get("error"):
-                erros.append(f"{estado}: {resultado['error']}")
-                print(f"[{estado}] Erro: {resultado['error']}")
-            else:
-                todos_resultados.extend(resultado.get("resultados", []))
-                total_creditos += resultado.get("creditos_firecrawl", 0)
-                print(f"[{estado}] OK: {len(resultado.get('resultados', []))} resultados via {resultado.get('fonte_utilizada', 'N/A')}")
-
-            # Pequeno delay entre estados
-            time.sleep(1)
+    if modo == "batch":
+        respostas = ScraperWorker().scrape_estado_batch.remote(estados_scrape, data_scrape)
+    else:
+        respostas = []
+        for estado in estados_scrape:
+            try:
+                respostas.append(ScraperWorker().scrape_estado.remote(estado, data_scrape))
+                # Pequeno delay entre estados
+                time.sleep(1)
+            except Exception as e:
+                respostas.append({"estado": estado, "error": str(e), "resultados": []})
 
-        except Exception as e:
-            erros.append(f"{estado}: {str(e)}")
-            print(f"[{estado}] Exceção: {e}")
+    for resultado in respostas:
+        estado = resultado.get("estado")
+        if resultado.get("error"):
+            erros.append(f"{estado}: {resultado['error']}")
+            print(f"[{estado}] Erro: {resultado['error']}")
+        else:
+            todos_resultados.extend(resultado.get("resultados", []))
+            total_creditos += resultado.get("creditos_firecrawl", 0)
+            print(f"[{estado}] OK: {len(resultado.get('resultados', []))} resultados via {resultado.get('fonte_utilizada', 'N/A')}")
 
     print(f"\nTotal de resultados: {len(todos_resultados)}")
     print(f"💰 Total créditos Firecrawl gastos: {total_creditos}")
@@ -1382,6 +1454,60 @@ def scrape_todos_v4(data: Optional[str] = None, estados: Optional[list] = None)
     return resultado_final
 
 
+@app.function(image=image, secrets=[supabase_secret], timeout=1800)
+def benchmark_modos_scrape(data: Optional[str] = None, estados: Optional[list] = None, repeticoes: int = 2) -> dict:
+    """
+    Compara fan-out (1 chamada por estado) com batch (1 chamada, pools locais).
+    Custo medido em segundos de container ocupados: no fan-out cada chamada segura
+    um container pelo tempo dela; no batch é o tempo da chamada única.
+    A ordem dos modos alterna a cada rodada e cada (modo, rodada) usa um worker
+    novo (parâmetro rodada do ScraperWorker), então cache de página e container
+    quente não favorecem o modo que roda depois. Não grava no banco.
+    """
+    import time
+
+    data_scrape = data or hoje_brasilia()
+    estados_scrape = estados or list(ESTADOS_CONFIG.keys())
+    medidas = {"fanout": [], "batch": []}
+
+    def rodar_fanout(worker) -> tuple:
+        segundos_container = 0.0
+        total = 0
+        for estado in estados_scrape:
+            t0 = time.perf_counter()
+            try:
+                total += len(worker.scrape_estado.remote(estado, data_scrape).get("resultados", []))
+            except Exception as e:
+                print(f"[{estado}] Exceção no fan-out: {e}")
+            segundos_container += time.perf_counter() - t0
+        return segundos_container, total
+
+    def rodar_batch(worker) -> tuple:
+        t0 = time.perf_counter()
+        respostas = worker.scrape_estado_batch.remote(estados_scrape, data_scrape)
+        return time.perf_counter() - t0, sum(len(r.get("resultados", [])) for r in respostas)
+
+    for rodada in range(repeticoes):
+        ordem = ["fanout", "batch"] if rodada % 2 == 0 else ["batch", "fanout"]
+        for modo in ordem:
+            worker = ScraperWorker(rodada=f"bench-{modo}-{rodada}-{time.time_ns()}")
+            inicio = time.perf_counter()
+            segundos_container, total = rodar_fanout(worker) if modo == "fanout" else rodar_batch(worker)
+            wall = time.perf_counter() - inicio
+            medidas[modo].append({"wall_s": round(wall, 2), "container_s": round(segundos_container, 2), "resultados": total})
+            print(f"📊 rodada {rodada} {modo}: {medidas[modo][-1]}")
+
+    resumo = {"data": data_scrape, "estados": len(estados_scrape), "repeticoes": repeticoes}
+    for modo, lista in medidas.items():
+        resumo[modo] = {
+            "wall_s_medio": round(sum(m["wall_s"] for m in lista) / len(lista), 2),
+            "container_s_medio": round(sum(m["container_s"] for m in lista) / len(lista), 2),
+            "rodadas": lista,
+        }
+    print(f"📊 Benchmark fan-out vs batch: {resumo}")
+    return resumo
+
+
 # =============================================================================
 # MAPEAMENTO LOTERIAS -> RESULTADOS (para verificacao de apostas)
 # =============================================================================
@@ -1597,6 +1723,211 @@ LOTERIA_TO_BANCA = {
 }
 
 
+# =============================================================================
+# CALENDARIO DE SORTEIOS (agendamento orientado ao horário do sorteio)
+# =============================================================================
+
+# Dias da semana com sorteio (0=segunda ... 6=domingo). Estado ausente = todos os dias.
+DIAS_SORTEIO = {
+    "FED": (2, 5),  # FEDERAL: quarta e sábado
+}
+
+# Primeira consulta só depois deste atraso (fontes levam alguns minutos para publicar)
+ATRASO_MINIMO_POLLING_MIN = 2
+
+# Backoff exponencial por sorteio pendente (min entre consultas); o último valor é o teto
+BACKOFF_POLLING_MIN = (1, 2, 4, 8, 16, 30)
+
+# Desiste de consultar um sorteio depois desta janela (reembolso cobre após 12h)
+JANELA_POLLING_MIN = 720
+
+# Firecrawl (pago) só para sorteios atrasados além deste limiar
+LIMIAR_FIRECRAWL_MIN = 45
+
+
+def _minutos(horario: str) -> int:
+    """Converte "HH:MM" em minutos desde 00:00"""
+    hora, minuto = horario.split(":")[:2]
+    return int(hora) * 60 + int(minuto)
+
+
+def _montar_calendario_sorteios() -> dict:
+    """
+    Calendário por estado com os horários exatos de LOTERIA_TO_BANCA: são os valores
+    gravados em resultados.horario e usados na verificação das apostas, então cada
+    sorteio casa 1:1 com a linha do DB (DF 18:40 e 19:00 são sorteios distintos).
+    """
+    estado_por_banca = {cfg["banca"]: estado for estado, cfg in ESTADOS_CONFIG.items()}
+    calendario = {estado: set() for estado in ESTADOS_CONFIG}
+    for banca, horario, _loteria in LOTERIA_TO_BANCA.values():
+        estado = estado_por_banca.get(banca)
+        if estado:
+            calendario[estado].add(horario)
+    return {estado: sorted(horarios, key=_minutos) for estado, horarios in calendario.items()}
+
+
+CALENDARIO_SORTEIOS = _montar_calendario_sorteios()
+
+
+def calendario_do_dia(data: str) -> dict:
+    """Retorna {estado: [horarios]} aplicando as regras de dia da semana"""
+    dia_semana = datetime.strptime(data, "%Y-%m-%d").weekday()
+    return {
+        estado: horarios
+        for estado, horarios in CALENDARIO_SORTEIOS.items()
+        if dia_semana in DIAS_SORTEIO.get(estado, range(7))
+    }
+
+
+def sorteios_pendentes(data: str, horarios_db: dict, agora: datetime) -> dict:
+    """
+    Sorteios do calendário que já aconteceram e ainda não têm resultado no DB.
+
+    Args:
+        data: dia dos sorteios (YYYY-MM-DD)
+        horarios_db: {banca: [horarios]} dos resultados já salvos para a data
+        agora: datetime de Brasília
+
+    Returns:
+        {estado: [(horario, minutos_desde_sorteio)]}
+    """
+    base = datetime.strptime(data, "%Y-%m-%d").replace(tzinfo=FUSO_BRASILIA)
+    pendentes = {}
+    for estado, horarios in calendario_do_dia(data).items():
+        salvos = {h[:5] for h in horarios_db.get(ESTADOS_CONFIG[estado]["banca"], [])}
+        for horario in horarios:
+            decorridos = (agora - base).total_seconds() / 60 - _minutos(horario)
+            if decorridos < 0 or horario in salvos:
+                continue
+            pendentes.setdefault(estado, []).append((horario, decorridos))
+    return pendentes
+
+
+class RastreadorSorteios:
+    """
+    Sorteios pendentes (data, estado, horario) com backoff exponencial por sorteio.
+    O estado fica num modal.Dict para sobreviver entre execuções do cron.
+    """
+
+    CHAVE = "pendentes"
+
+    def __init__(self, store, backoff_min: tuple = BACKOFF_POLLING_MIN, limiar_firecrawl_min: int = LIMIAR_FIRECRAWL_MIN):
+        self.store = store
+        self.backoff_min = backoff_min
+        self.limiar_firecrawl_min = limiar_firecrawl_min
+        self.pendentes = dict(store.get(self.CHAVE) or {})
+
+    def sincronizar(self, pendentes_por_data: dict, agora: datetime) -> None:
+        """
+        Registra sorteios que passaram a estar pendentes e descarta os que saíram
+        (resultado no DB) ou ficaram fora da janela de polling.
+
+        Args:
+            pendentes_por_data: {data: {estado: [(horario, minutos_desde_sorteio)]}}
+        """
+        atuais = set()
+        for data, por_estado in pendentes_por_data.items():
+            for estado, pendentes in por_estado.items():
+                for horario, decorridos in pendentes:
+                    if decorridos > JANELA_POLLING_MIN:
+                        continue
+                    chave = f"{data}|{estado}|{horario}"
+                    atuais.add(chave)
+                    if chave not in self.pendentes:
+                        sorteio = agora - timedelta(minutes=decorridos)
+                        self.pendentes[chave] = {
+                            "sorteio": sorteio.isoformat(),
+                            "tentativas": 0,
+                            "proximo_poll": (sorteio + timedelta(minutes=ATRASO_MINIMO_POLLING_MIN)).isoformat(),
+                        }
+        for chave in [c for c in self.pendentes if c not in atuais]:
+            del self.pendentes[chave]
+
+    def _do_estado(self, data: str, estado: str) -> list:
+        prefixo = f"{data}|{estado}|"
+        return [(c, info) for c, info in self.pendentes.items() if c.startswith(prefixo)]
+
+    def devidos(self, agora: datetime) -> dict:
+        """{(data, estado): [horarios]} com consulta vencida"""
+        devidos = {}
+        for chave, info in self.pendentes.items():
+            if datetime.fromisoformat(info["proximo_poll"]) <= agora:
+                data, estado, horario = chave.split("|")
+                devidos.setdefault((data, estado), []).append(horario)
+        return devidos
+
+    def registrar_consulta(self, data: str, estado: str, agora: datetime) -> None:
+        """Uma consulta ao estado cobre todos os sorteios pendentes dele: avança o backoff de cada um"""
+        for _chave, info in self._do_estado(data, estado):
+            passo = self.backoff_min[min(info["tentativas"], len(self.backoff_min) - 1)]
+            info["tentativas"] += 1
+            info["proximo_poll"] = (agora + timedelta(minutes=passo)).isoformat()
+
+    def usar_firecrawl(self, data: str, estado: str, agora: datetime) -> bool:
+        """Firecrawl só quando algum sorteio do estado está atrasado além do limiar"""
+        for _chave, info in self._do_estado(data, estado):
+            decorridos = (agora - datetime.fromisoformat(info["sorteio"])).total_seconds() / 60
+            if decorridos >= self.limiar_firecrawl_min:
+                return True
+        return False
+
+    def retirar(self, data: str, banca: str, horario: str) -> None:
+        """Remove o sorteio atendido por um resultado recém-salvo (horário exato)"""
+        estado = next((e for e, cfg in ESTADOS_CONFIG.items() if cfg["banca"] == banca), None)
+        if not estado or not horario:
+            return
+        self.pendentes.pop(f"{data}|{estado}|{horario[:5]}", None)
+
+    def salvar(self) -> None:
+        self.store[self.CHAVE] = self.pendentes
+
+
+# Sorteios pendentes do cron - persiste entre execuções
+polling_state = modal.Dict.from_name("ultra-banca-scraper-polling", create_if_missing=True)
+
+# Lease do cron: execuções sobrepostas (cron a cada minuto, timeout 900s) carregariam
+# e regravariam a fila inteira, desfazendo backoff e retiradas uma da outra
+CHAVE_LEASE_POLLING = "lease"
+LEASE_POLLING_S = 900
+
+# Varredura (Caixa + verificação de hoje/ontem) por tempo decorrido desde a última,
+# não por minuto exato: um tick atrasado ou pulado não perde a varredura
+CHAVE_ULTIMA_VARREDURA = "ultima_varredura"
+INTERVALO_VARREDURA_MIN = 30
+
+
+def adquirir_lease(store, dono: str, agora: datetime) -> bool:
+    """Single-flight: só uma execução do cron mexe na fila por vez. Lease vencido é tomado."""
+    lease = {"dono": dono, "expira": (agora + timedelta(seconds=LEASE_POLLING_S)).isoformat()}
+    if store.put(CHAVE_LEASE_POLLING, lease, skip_if_exists=True):
+        return True
+    atual = store.get(CHAVE_LEASE_POLLING)
+    if atual and datetime.fromisoformat(atual["expira"]) > agora:
+        return False
+    # Dono anterior morreu sem liberar (timeout/crash)
+    try:
+        store.pop(CHAVE_LEASE_POLLING)
+    except KeyError:
+        pass
+    return store.put(CHAVE_LEASE_POLLING, lease, skip_if_exists=True)
+
+
+def liberar_lease(store, dono: str) -> None:
+    atual = store.get(CHAVE_LEASE_POLLING)
+    if atual and atual.get("dono") == dono:
+        try:
+            store.pop(CHAVE_LEASE_POLLING)
+        except KeyError:
+            pass
+
+
+def varredura_devida(store, agora: datetime) -> bool:
+    ultima = store.get(CHAVE_ULTIMA_VARREDURA)
+    if not ultima:
+        return True
+    return (agora - datetime.fromisoformat(ultima)).total_seconds() / 60 >= INTERVALO_VARREDURA_MIN
+
+
 # =============================================================================
 # FUNCAO AGENDADA (CRON) - COM SKIP INTELIGENTE
 # =============================================================================
@@ -1606,13 +1937,12 @@ def check_pending_payments(supabase_url: str, supabase_key: str):
     Verifica pagamentos PENDING via polling nas APIs BSPay/WashPay.
     Chamado ao final de cada scrape_scheduled (a cada 30 min).
     """
-    import requests
 
     print(f"\n💳 Verificando pagamentos pendentes via polling...")
 
     try:
         url = f"{supabase_url}/functions/v1/check-pending-payments"
-        resp = requests.post(
+        resp = sessao_http().post(
             url,
             headers={
                 "Authorization": f"Bearer {supabase_key}",
@@ -1646,77 +1976,108 @@ def reconcile_payments():
     Verifica pagamentos PENDING via API BSPay/WashPay.
     Padrão: Event-Driven (webhook) + Reconciliation (este cron).
     """
-    from supabase import create_client
-
-    supabase_url = os.environ["SUPABASE_URL"]
-    supabase_key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-
-    check_pending_payments(supabase_url, supabase_key)
+    check_pending_payments(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_ROLE_KEY"])
 
 
 @app.function(
     image=image,
     secrets=[supabase_secret, firecrawl_secret],
     timeout=900,  # 15 min
-    schedule=modal.Cron("*/30 1,7-23 * * *", timezone="America/Sao_Paulo"),
+    schedule=modal.Cron("* * * * *", timezone="America/Sao_Paulo"),
 )
 def scrape_scheduled():
     """
-    Scrape agendado v4 - roda a cada 30 minutos nos horários relevantes (BRT).
-    Otimizações:
+    Scrape agendado v4 - orientado ao calendário de sorteios (BRT).
+    Roda a cada minuto, mas só consulta um estado quando algum sorteio dele
+    já aconteceu e o resultado ainda não está no DB:
+    - Calendário por estado: horários exatos de LOTERIA_TO_BANCA + regras de dia da semana
+    - RastreadorSorteios: backoff exponencial por sorteio pendente (BACKOFF_POLLING_MIN),
+      Firecrawl só após LIMIAR_FIRECRAWL_MIN de atraso, sorteio sai da fila ao ser salvo
     - Skip inteligente: pula estados que já têm todos os resultados do dia
     - requests primeiro: Firecrawl só como fallback (economia de créditos)
+    - Varredura a cada 30 min: Caixa (após 20h) + verificação de hoje e ontem (reembolsos)
+    - Single-flight: execução que não pega o lease sai sem tocar na fila
     """
-    from supabase import create_client
-    import time
+    import uuid
+
+    agora = agora_brasilia()
+    print(f"=== Scrape V4 agendado: {agora.strftime('%Y-%m-%d %H:%M:%S')} BRT ===")
+
+    dono = uuid.uuid4().hex
+    if not adquirir_lease(polling_state, dono, agora):
+        print("⏭️ Outra execução do cron ainda está rodando - pulando este tick")
+        return {"total": 0, "upserted": 0, "consultados": 0, "skipped": 0, "creditos_firecrawl": 0, "em_execucao": True}
+    try:
+        return _ciclo_agendado(agora)
+    finally:
+        liberar_lease(polling_state, dono)
 
-    print(f"=== Scrape V4 agendado: {agora_brasilia().strftime('%Y-%m-%d %H:%M:%S')} BRT ===")
 
-    supabase_url = os.environ["SUPABASE_URL"]
-    supabase_key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-    supabase = create_client(supabase_url, supabase_key)
+def _ciclo_agendado(agora: datetime) -> dict:
+    """Um tick do scrape_scheduled (roda com o lease do polling_state)"""
+    supabase = cliente_supabase()
 
-    data_scrape = hoje_brasilia()
-    estados_scrape = list(ESTADOS_CONFIG.keys())
+    data_hoje = agora.strftime("%Y-%m-%d")
+    # Ontem entra no calendário para cobrir sorteios da noite publicados após 00:00
+    data_ontem = (agora - timedelta(days=1)).strftime("%Y-%m-%d")
+    varredura = varredura_devida(polling_state, agora)
 
     todos_resultados = []
     erros = []
     total_creditos = 0
     skipped = []
+    consultados = []
 
     # =========================================================================
-    # CONSULTA DB: quais estados já estão completos?
+    # CONSULTA DB: horários já salvos por banca (hoje e ontem)
     # =========================================================================
-    resultados_existentes = {}
+    horarios_db = {data_hoje: {}, data_ontem: {}}
+    consulta_ok = True
     try:
-        resp = supabase.table("resultados").select("banca").eq("data", data_scrape).execute()
-        if resp.data:
-            for row in resp.data:
-                b = row.get("banca", "")
-                resultados_existentes[b] = resultados_existentes.get(b, 0) + 1
-        print(f"Resultados já no DB para {data_scrape}: {resultados_existentes}")
+        resp = supabase.table("resultados").select("data, banca, horario").in_("data", [data_hoje, data_ontem]).execute()
+        for row in resp.data or []:
+            por_banca = horarios_db.setdefault(row.get("data"), {})
+            por_banca.setdefault(row.get("banca", ""), []).append(row.get("horario") or "00:00")
+        contagem_hoje = {b: len(h) for b, h in horarios_db[data_hoje].items()}
+        print(f"Resultados já no DB para {data_hoje}: {contagem_hoje}")
     except Exception as e:
-        print(f"Erro ao consultar DB para skip: {e}")
-
-    for estado in estados_scrape:
-        config = ESTADOS_CONFIG.get(estado)
-        if not config:
-            continue
-
-        banca = config["banca"]
-        esperados = HORARIOS_ESPERADOS.get(estado, 0)
-        existentes = resultados_existentes.get(banca, 0)
+        # Sem saber o que já está salvo, todo sorteio pareceria pendente: não consulta
+        # nem mexe na fila neste tick (backoff e retiradas ficam como estavam)
+        consulta_ok = False
+        print(f"Erro ao consultar DB para agendamento - polling pulado neste tick: {e}")
 
-        # Skip inteligente: se já tem todos os resultados esperados, pula
-        if esperados > 0 and existentes >= esperados:
-            print(f"[{estado}] ⏭️  SKIP: {banca} já completo ({existentes}/{esperados} resultados)")
-            skipped.append(estado)
-            continue
-
-        print(f"[{estado}] 🔍 Scrapando: {banca} ({existentes}/{esperados} resultados no DB)")
+    # =========================================================================
+    # SORTEIOS PENDENTES: calendário do dia menos o que já está no DB
+    # =========================================================================
+    pendentes_por_data = {}
+    for data_scrape in ((data_ontem, data_hoje) if consulta_ok else ()):
+        pendentes_por_estado = sorteios_pendentes(data_scrape, horarios_db.get(data_scrape, {}), agora)
+        for estado in list(pendentes_por_estado):
+            banca = ESTADOS_CONFIG[estado]["banca"]
+            esperados = HORARIOS_ESPERADOS.get(estado, 0)
+            existentes = len(horarios_db.get(data_scrape, {}).get(banca, []))
+
+            # Skip inteligente: se já tem todos os resultados esperados, pula
+            if esperados > 0 and existentes >= esperados:
+                skipped.append(f"{estado}@{data_scrape}")
+                del pendentes_por_estado[estado]
+        pendentes_por_data[data_scrape] = pendentes_por_estado
+
+    rastreador = RastreadorSorteios(polling_state)
+    if consulta_ok:
+        rastreador.sincronizar(pendentes_por_data, agora)
+    devidos = rastreador.devidos(agora) if consulta_ok else {}
+
+    for (data_scrape, estado), horarios in sorted(devidos.items()):
+        banca = ESTADOS_CONFIG[estado]["banca"]
+        usar_firecrawl = rastreador.usar_firecrawl(data_scrape, estado, agora)
+        print(f"[{estado}] 🔍 Scrapando {banca} {data_scrape}: sorteios pendentes {', '.join(sorted(horarios))}"
+              + (" (Firecrawl liberado: atraso acima do limiar)" if usar_firecrawl else ""))
+        rastreador.registrar_consulta(data_scrape, estado, agora)
+        consultados.append(f"{estado}@{data_scrape}")
 
         try:
-            resultado = scrape_estado.remote(estado, data_scrape)
+            resultado = ScraperWorker().scrape_estado.remote(estado, data_scrape, usar_firecrawl)
 
             if resultado.get("error"):
                 erros.append(f"{estado}: {resultado['error']}")
@@ -1726,35 +2087,47 @@ def scrape_scheduled():
                 total_creditos += resultado.get("creditos_firecrawl", 0)
                 print(f"[{estado}] OK: {len(resultado.get('resultados', []))} resultados via {resultado.get('fonte_utilizada', 'N/A')}")
 
-            # Delay de 2 segundos entre estados (requests não precisa de 6s como Firecrawl)
-            time.sleep(2)
-
         except Exception as e:
             erros.append(f"{estado}: {str(e)}")
             print(f"[{estado}] Exceção: {e}")
 
-    # Salvar no Supabase
-    upserted = _upsert_resultados(supabase, todos_resultados)
+    # Salvar no Supabase (sorteios salvos saem da fila de polling)
+    upserted = _upsert_resultados(supabase, todos_resultados, rastreador)
+    if consulta_ok:
+        rastreador.salvar()
 
     # Scrape loterias da Caixa (Lotofácil, Quina, Mega-Sena) para Lotinha/Quininha/Seninha
-    print(f"\n🎰 Scraping Loterias Caixa...")
-    resultados_caixa = scrape_caixa_loterias(data_scrape)
-    upserted_caixa = _upsert_resultados_caixa(supabase, resultados_caixa)
-    print(f"  Caixa: {len(resultados_caixa)} resultados, {upserted_caixa} upserted")
+    # Sorteios às 20:00: só consulta na varredura e depois do horário
+    resultados_caixa = []
+    upserted_caixa = 0
+    caixa_salvos = len(horarios_db.get(data_hoje, {}).get("CAIXA", []))
+    if varredura and agora.hour >= 20 and caixa_salvos < len(CAIXA_LOTERIAS):
+        print(f"\n🎰 Scraping Loterias Caixa...")
+        resultados_caixa = scrape_caixa_loterias(data_hoje)
+        upserted_caixa = _upsert_resultados_caixa(supabase, resultados_caixa)
+        print(f"  Caixa: {len(resultados_caixa)} resultados, {upserted_caixa} upserted")
 
     print(f"\n📊 RESUMO V4:")
+    print(f"  Consultados: {len(consultados)} ({', '.join(consultados) if consultados else 'nenhum sorteio pendente devido'})")
     print(f"  Scraped: {len(todos_resultados)} resultados bicho + {len(resultados_caixa)} Caixa, {upserted + upserted_caixa} upserted total")
     print(f"  Skipped: {len(skipped)} estados ({', '.join(skipped) if skipped else 'nenhum'})")
     print(f"  💰 Créditos Firecrawl gastos: {total_creditos}")
 
-    # Verificar apostas pendentes (hoje)
-    verificar_premios_v2.remote(data_scrape)
-
-    # Verificar apostas pendentes de ontem (cobre lotinha/quininha/seninha e resultados tardios)
-    data_ontem = (agora_brasilia() - timedelta(days=1)).strftime("%Y-%m-%d")
-    verificar_premios_v2.remote(data_ontem)
+    # Verificar apostas pendentes: logo que chega resultado novo, e na varredura
+    # (cobre reembolsos por expiração, lotinha/quininha/seninha e resultados tardios de ontem)
+    if upserted or upserted_caixa or varredura:
+        ScraperWorker().verificar_premios_v2.remote(data_hoje)
+    if varredura:
+        ScraperWorker().verificar_premios_v2.remote(data_ontem)
+        polling_state[CHAVE_ULTIMA_VARREDURA] = agora.isoformat()
 
-    return {"total": len(todos_resultados), "upserted": upserted, "skipped": len(skipped), "creditos_firecrawl": total_creditos}
+    return {
+        "total": len(todos_resultados),
+        "upserted": upserted,
+        "consultados": len(consultados),
+        "skipped": len(skipped),
+        "creditos_firecrawl": total_creditos,
+    }
 
 
 # =============================================================================
@@ -1765,34 +2138,111 @@ def scrape_scheduled():
 # FUNÇÕES AUXILIARES PARA VERIFICAÇÃO DE MODALIDADES
 # -----------------------------------------------------------------------------
 
+# Tabela estática das 10.000 milhares (0000-9999), montada uma vez no import:
+# derivações por índice em vez de fatiar string + int() por prêmio por aposta
+DEZENAS_STR = tuple(f"{i:02d}" for i in range(100))
+CENTENAS_STR = tuple(f"{i:03d}" for i in range(1000))
+
+
+def _grupo_da_dezena(dez: int) -> int:
+    return 25 if dez == 0 else ((dez - 1) // 4) + 1
+
+
+# Grupo (1-25) de cada dezena 00-99
+GRUPO_DA_DEZENA = array("B", (_grupo_da_dezena(d) for d in range(100)))
+
+
+def _montar_tabela_milhares() -> dict:
+    tabela = {nome: array(tipo) for nome, tipo in (
+        ("centena", "H"), ("centena_esq", "H"),
+        ("dezena", "B"), ("dezena_esq", "B"), ("dezena_meio", "B"), ("unidade", "B"),
+        ("grupo", "B"), ("grupo_esq", "B"), ("grupo_meio", "B"), ("assinatura", "H"),
+    )}
+    for n in range(10000):
+        d1, d2, d3, d4 = n // 1000, n // 100 % 10, n // 10 % 10, n % 10
+        tabela["centena"].append(n % 1000)
+        tabela["centena_esq"].append(n // 10)
+        tabela["dezena"].append(n % 100)
+        tabela["dezena_esq"].append(n // 100)
+        tabela["dezena_meio"].append(d2 * 10 + d3)
+        tabela["unidade"].append(d4)
+        tabela["grupo"].append(GRUPO_DA_DEZENA[n % 100])
+        tabela["grupo_esq"].append(GRUPO_DA_DEZENA[n // 100])
+        tabela["grupo_meio"].append(GRUPO_DA_DEZENA[d2 * 10 + d3])
+        # Dígitos ordenados lidos como número de 4 dígitos: "3120" -> "0123" -> 123
+        a, b, c, d = sorted((d1, d2, d3, d4))
+        tabela["assinatura"].append(a * 1000 + b * 100 + c * 10 + d)
+    return tabela
+
+
+TABELA_MILHARES = _montar_tabela_milhares()
+MILHAR_CENTENA = TABELA_MILHARES["centena"]
+MILHAR_CENTENA_ESQ = TABELA_MILHARES["centena_esq"]
+MILHAR_DEZENA = TABELA_MILHARES["dezena"]
+MILHAR_DEZENA_ESQ = TABELA_MILHARES["dezena_esq"]
+MILHAR_DEZENA_MEIO = TABELA_MILHARES["dezena_meio"]
+MILHAR_UNIDADE = TABELA_MILHARES["unidade"]
+MILHAR_GRUPO = TABELA_MILHARES["grupo"]
+MILHAR_GRUPO_ESQ = TABELA_MILHARES["grupo_esq"]
+MILHAR_GRUPO_MEIO = TABELA_MILHARES["grupo_meio"]
+MILHAR_ASSINATURA = TABELA_MILHARES["assinatura"]
+
+
+def indice_milhar(premio: str) -> int:
+    """Índice na tabela para milhar de exatamente 4 dígitos ASCII; -1 fora do formato"""
+    if len(premio) == 4 and premio.isascii() and premio.isdigit():
+        return int(premio)
+    return -1
+
+
 def extrair_dezena(premio: str) -> str:
     """Extrai os últimos 2 dígitos (dezena direita)"""
+    i = indice_milhar(premio)
+    if i >= 0:
+        return DEZENAS_STR[MILHAR_DEZENA[i]]
     return premio[-2:] if len(premio) >= 2 else premio.zfill(2)
 
 def extrair_dezena_esq(premio: str) -> str:
     """Extrai os primeiros 2 dígitos (dezena esquerda)"""
+    i = indice_milhar(premio)
+    if i >= 0:
+        return DEZENAS_STR[MILHAR_DEZENA_ESQ[i]]
     return premio[:2] if len(premio) >= 2 else premio.zfill(2)
 
 def extrair_dezena_meio(premio: str) -> str:
     """Extrai os 2 dígitos do meio (posições 1 e 2 em milhar de 4 dígitos)"""
+    i = indice_milhar(premio)
+    if i >= 0:
+        return DEZENAS_STR[MILHAR_DEZENA_MEIO[i]]
     if len(premio) >= 4:
         return premio[1:3]
     return premio[-2:] if len(premio) >= 2 else premio.zfill(2)
 
 def extrair_centena(premio: str) -> str:
     """Extrai os últimos 3 dígitos (centena direita)"""
+    i = indice_milhar(premio)
+    if i >= 0:
+        return CENTENAS_STR[MILHAR_CENTENA[i]]
     return premio[-3:] if len(premio) >= 3 else premio.zfill(3)
 
 def extrair_centena_esq(premio: str) -> str:
     """Extrai os primeiros 3 dígitos (centena esquerda)"""
+    i = indice_milhar(premio)
+    if i >= 0:
+        return CENTENAS_STR[MILHAR_CENTENA_ESQ[i]]
     return premio[:3] if len(premio) >= 3 else premio.zfill(3)
 
 def extrair_unidade(premio: str) -> str:
     """Extrai o último dígito"""
+    i = indice_milhar(premio)
+    if i >= 0:
+        return DEZENAS_STR[MILHAR_UNIDADE[i]][1]
     return premio[-1] if premio else "0"
 
 def dezena_to_grupo(dezena: str) -> int:
     """Converte dezena (00-99) para grupo (1-25)"""
+    if len(dezena) == 2 and dezena.isascii() and dezena.isdigit():
+        return GRUPO_DA_DEZENA[int(dezena)]
     try:
         dez = int(dezena)
         if dez == 0:
@@ -1801,471 +2251,890 @@ def dezena_to_grupo(dezena: str) -> int:
     except:
         return 0
 
+def assinatura_digitos(digitos: str) -> str:
+    """Dígitos em ordem crescente: duas strings são permutação uma da outra se têm a mesma assinatura"""
+    return "".join(sorted(digitos))
+
 def is_invertido(palpite: str, premio: str, n_digitos: int) -> bool:
     """Verifica se palpite é uma permutação dos últimos N dígitos do prêmio"""
-    from itertools import permutations
-
     palpite_digits = palpite[-n_digitos:].zfill(n_digitos)
     premio_digits = premio[-n_digitos:].zfill(n_digitos)
-
-    # Gera todas as permutações dos dígitos do prêmio
-    for perm in permutations(premio_digits):
-        if ''.join(perm) == palpite_digits:
-            return True
-    return False
+    return assinatura_digitos(palpite_digits) == assinatura_digitos(premio_digits)
 
 def is_invertido_esq(palpite: str, premio: str, n_digitos: int) -> bool:
     """Verifica se palpite é uma permutação dos primeiros N dígitos do prêmio"""
-    from itertools import permutations
-
     palpite_digits = palpite[:n_digitos].zfill(n_digitos)
     premio_digits = premio[:n_digitos].zfill(n_digitos)
+    return assinatura_digitos(palpite_digits) == assinatura_digitos(premio_digits)
 
-    for perm in permutations(premio_digits):
-        if ''.join(perm) == palpite_digits:
-            return True
-    return False
+def _bit_dezena(dezena: str) -> int:
+    """Bit 0-99 da dezena de 2 dígitos ASCII; -1 fora do formato"""
+    if len(dezena) == 2 and dezena.isascii() and dezena.isdigit():
+        return int(dezena)
+    return -1
 
-def verificar_modalidade(modalidade: str, palpites: list, resultado: dict, posicoes_validas: list) -> bool:
-    """
-    Verifica se a aposta ganhou baseado na modalidade.
+def _bit_grupo(grupo: int) -> int:
+    """Bit 0-25 do grupo (0 = dezena inválida no caminho de fallback); -1 fora da faixa"""
+    return grupo if 0 <= grupo <= 25 else -1
 
-    Args:
-        modalidade: código da modalidade (ex: "milhar", "centena_inv", "duque_gp")
-        palpites: lista de palpites do apostador
-        resultado: dict com premio_1..premio_10
-        posicoes_validas: lista de posições a verificar (ex: ["premio_1", "premio_2"...])
 
-    Returns:
-        True se ganhou, False caso contrário
+class ConjuntoBits:
+    """
+    Conjunto de dezenas (bits 0-99) ou grupos (bits 0-25) como bitmask inteiro.
+    Valores fora do formato (token "100" ou "٥" num palpite, prêmio não numérico) ficam num
+    set de resto, mantendo exatamente a semântica das comparações de string/int.
     """
-    modalidade = modalidade.lower().strip()
 
-    # Extrai todos os prêmios das posições válidas
-    premios = []
-    for pos in posicoes_validas:
-        premio = str(resultado.get(pos, "") or "").strip()
-        if premio and len(premio) >= 2:
-            premios.append(premio.zfill(4))
+    __slots__ = ("mascara", "resto")
 
-    if not premios:
-        return False
+    def __init__(self, valores, bit):
+        mascara = 0
+        resto = set()
+        for valor in valores:
+            b = bit(valor)
+            if b >= 0:
+                mascara |= 1 << b
+            else:
+                resto.add(valor)
+        self.mascara = mascara
+        self.resto = frozenset(resto)
 
-    # Extrai dezenas e grupos dos prêmios
-    dezenas = [extrair_dezena(p) for p in premios]
-    dezenas_esq = [extrair_dezena_esq(p) for p in premios]
-    dezenas_meio = [extrair_dezena_meio(p) for p in premios]
-    grupos = [dezena_to_grupo(d) for d in dezenas]
-    grupos_esq = [dezena_to_grupo(d) for d in dezenas_esq]
-    grupos_meio = [dezena_to_grupo(d) for d in dezenas_meio]
+    def __len__(self) -> int:
+        return self.mascara.bit_count() + len(self.resto)
 
-    # Normaliza palpites
-    palpites_norm = [str(p).strip() for p in palpites if p]
-    if not palpites_norm:
-        return False
+    def __repr__(self) -> str:
+        bits = [f"{b:02d}" for b in range(self.mascara.bit_length()) if self.mascara >> b & 1]
+        return "{" + ", ".join(bits + sorted(str(v) for v in self.resto)) + "}"
 
-    # =========================================================================
-    # MILHAR (4 dígitos)
-    # =========================================================================
-    if modalidade == "milhar":
-        for palpite in palpites_norm:
-            for premio in premios:
-                if palpite.zfill(4) == premio.zfill(4):
-                    return True
-
-    elif modalidade == "milhar_ct":
-        # Milhar e Centena - ganha se acertar milhar OU centena
-        for palpite in palpites_norm:
-            for premio in premios:
-                if palpite.zfill(4) == premio.zfill(4):  # Milhar exata
-                    return True
-                if len(palpite) >= 3 and premio.endswith(palpite[-3:]):  # Centena
-                    return True
-
-    elif modalidade.startswith("milhar_inv"):
-        # Milhar invertida (permutações)
-        for palpite in palpites_norm:
-            for premio in premios:
-                if is_invertido(palpite, premio, 4):
-                    return True
+    def contem_todos(self, outro: "ConjuntoBits") -> bool:
+        return not (outro.mascara & ~self.mascara) and outro.resto <= self.resto
 
-    # =========================================================================
-    # CENTENA (3 dígitos)
-    # =========================================================================
-    elif modalidade == "centena":
-        for palpite in palpites_norm:
-            for premio in premios:
-                if len(palpite) >= 3 and premio.endswith(palpite[-3:]):
-                    return True
-
-    elif modalidade == "centena_esquerda" or modalidade == "centena_esq":
-        for palpite in palpites_norm:
-            for premio in premios:
-                if len(palpite) >= 3 and premio.startswith(palpite[:3]):
-                    return True
-
-    elif modalidade == "centena_3x":
-        # Centena em qualquer posição (esq, meio, dir)
-        for palpite in palpites_norm:
-            palpite_3 = palpite[-3:].zfill(3) if len(palpite) >= 3 else palpite.zfill(3)
-            for premio in premios:
-                # Direita
-                if premio.endswith(palpite_3):
-                    return True
-                # Esquerda (em milhar de 4 dígitos)
-                if len(premio) >= 4 and premio[:3] == palpite_3:
-                    return True
-                # Meio (posições 1-3 em milhar)
-                if len(premio) >= 4 and premio[1:4] == palpite_3:
-                    return True
-
-    elif modalidade.startswith("centena_inv"):
-        # Centena invertida
-        is_esq = "esq" in modalidade
-        for palpite in palpites_norm:
-            for premio in premios:
-                if is_esq:
-                    if is_invertido_esq(palpite, premio, 3):
-                        return True
-                else:
-                    if is_invertido(palpite, premio, 3):
-                        return True
+    def acertos(self, outro: "ConjuntoBits") -> int:
+        return (self.mascara & outro.mascara).bit_count() + len(self.resto & outro.resto)
 
-    # =========================================================================
-    # DEZENA (2 dígitos)
-    # =========================================================================
-    elif modalidade == "dezena":
-        for palpite in palpites_norm:
-            palpite_dez = palpite[-2:].zfill(2)
-            if palpite_dez in dezenas:
-                return True
 
-    elif modalidade == "dezena_esq":
-        for palpite in palpites_norm:
-            palpite_dez = palpite[-2:].zfill(2)
-            if palpite_dez in dezenas_esq:
-                return True
+def dezenas_palpite_caixa(palpite_str: str) -> ConjuntoBits:
+    """Dezenas de um palpite Lotinha/Quininha/Seninha (formato: "03-06-13-18-24-28-30-...")"""
+    dezenas = []
+    for part in palpite_str.replace(" ", "").split("-"):
+        part = part.strip()
+        if part and part.isdigit():
+            dezenas.append(part.zfill(2))
+    return ConjuntoBits(dezenas, _bit_dezena)
 
-    elif modalidade == "dezena_meio":
-        for palpite in palpites_norm:
-            palpite_dez = palpite[-2:].zfill(2)
-            if palpite_dez in dezenas_meio:
-                return True
+def dezenas_resultado_caixa(dezenas_csv: str) -> ConjuntoBits:
+    """Dezenas de um resultado CAIXA (formato CSV em premio_1: "02,05,06,08,...")"""
+    dezenas = []
+    for d in dezenas_csv.split(","):
+        d = d.strip()
+        if d and d.isdigit():
+            dezenas.append(d.zfill(2))
+    return ConjuntoBits(dezenas, _bit_dezena)
 
-    # =========================================================================
-    # GRUPO (bicho 1-25)
-    # =========================================================================
-    elif modalidade == "grupo":
-        for palpite in palpites_norm:
-            try:
-                palpite_grupo = int(palpite)
-                if palpite_grupo in grupos:
-                    return True
-            except:
-                pass
 
-    elif modalidade == "grupo_esq":
-        for palpite in palpites_norm:
-            try:
-                palpite_grupo = int(palpite)
-                if palpite_grupo in grupos_esq:
-                    return True
-            except:
-                pass
+class Acerto:
+    """
+    Detalhe de uma vitória: loteria, posição e prêmio que casaram e a faixa de pagamento
+    (ex: "milhar" ou "centena" no milhar_ct). Modalidades combinadas não têm posição única.
+    """
 
-    elif modalidade == "grupo_meio":
-        for palpite in palpites_norm:
-            try:
-                palpite_grupo = int(palpite)
-                if palpite_grupo in grupos_meio:
-                    return True
-            except:
-                pass
+    __slots__ = ("loteria", "posicao", "premio", "faixa")
 
-    # =========================================================================
-    # UNIDADE (1 dígito)
-    # =========================================================================
-    elif modalidade == "unidade":
-        for palpite in palpites_norm:
-            palpite_un = palpite[-1] if palpite else ""
-            for premio in premios:
-                if palpite_un == extrair_unidade(premio):
-                    return True
+    def __init__(self, posicao: Optional[str] = None, premio: Optional[str] = None,
+                 faixa: Optional[str] = None, loteria: Optional[str] = None):
+        self.loteria = loteria
+        self.posicao = posicao
+        self.premio = premio
+        self.faixa = faixa
 
-    # =========================================================================
-    # DUQUE DEZENA (2 dezenas devem aparecer nos prêmios)
-    # =========================================================================
-    elif modalidade.startswith("duque_dez"):
-        if len(palpites_norm) < 2:
-            return False
+    def __repr__(self) -> str:
+        return f"Acerto(loteria={self.loteria}, {self.descricao()})"
 
-        # Determina qual conjunto de dezenas usar
-        if "esq" in modalidade:
-            dezenas_check = dezenas_esq
-        elif "meio" in modalidade:
-            dezenas_check = dezenas_meio
-        else:
-            dezenas_check = dezenas
+    def descricao(self) -> str:
+        """posicao/premio/faixa para os logs (a loteria já aparece na linha)"""
+        partes = [f"{k}={v}" for k, v in self.como_dict().items() if v is not None and k != "loteria"]
+        return ", ".join(partes) or "sem detalhe"
 
-        # Os 2 palpites devem estar nas dezenas dos prêmios
-        palpite1 = palpites_norm[0][-2:].zfill(2)
-        palpite2 = palpites_norm[1][-2:].zfill(2)
+    def como_dict(self) -> dict:
+        """Para logs e metadata da transação de prêmio"""
+        return {"loteria": self.loteria, "posicao": self.posicao, "premio": self.premio, "faixa": self.faixa}
 
-        if palpite1 in dezenas_check and palpite2 in dezenas_check:
-            return True
 
-    # =========================================================================
-    # DUQUE GRUPO (2 grupos devem aparecer nos prêmios)
-    # =========================================================================
-    elif modalidade.startswith("duque_gp"):
-        if len(palpites_norm) < 2:
-            return False
+class ResultadoFeatures:
+    """
+    Derivações de um resultado para um range de posições: calculadas uma vez e
+    compartilhadas por todas as apostas que olham o mesmo (resultado, posições).
+    """
 
-        if "esq" in modalidade:
-            grupos_check = grupos_esq
-        elif "meio" in modalidade:
-            grupos_check = grupos_meio
+    __slots__ = (
+        "premios", "posicoes", "premios_int", "centenas", "centenas_esq",
+        "dezenas", "dezenas_esq", "dezenas_meio",
+        "grupos", "grupos_esq", "grupos_meio", "assinaturas", "_vencedores",
+        "_conjuntos",
+    )
+
+    def __init__(self, resultado: dict, posicoes_validas: list):
+        # Prêmios das posições válidas (mesma normalização de sempre: >= 2 chars, zfill(4))
+        premios, posicoes = [], []
+        for pos in posicoes_validas:
+            premio = str(resultado.get(pos, "") or "").strip()
+            if premio and len(premio) >= 2:
+                premios.append(premio.zfill(4))
+                posicoes.append(pos)
+
+        self.premios = premios
+        # Posição de origem de cada prêmio (para o detalhe do acerto)
+        self.posicoes = posicoes
+        # Índice na TABELA_MILHARES; -1 marca prêmio fora do formato 4 dígitos (derivado por fatia)
+        self.premios_int = [indice_milhar(p) for p in premios]
+        if all(i >= 0 for i in self.premios_int):
+            indices = self.premios_int
+            self.centenas = [CENTENAS_STR[MILHAR_CENTENA[i]] for i in indices]
+            self.centenas_esq = [CENTENAS_STR[MILHAR_CENTENA_ESQ[i]] for i in indices]
+            self.dezenas = [DEZENAS_STR[MILHAR_DEZENA[i]] for i in indices]
+            self.dezenas_esq = [DEZENAS_STR[MILHAR_DEZENA_ESQ[i]] for i in indices]
+            self.dezenas_meio = [DEZENAS_STR[MILHAR_DEZENA_MEIO[i]] for i in indices]
+            self.grupos = [MILHAR_GRUPO[i] for i in indices]
+            self.grupos_esq = [MILHAR_GRUPO_ESQ[i] for i in indices]
+            self.grupos_meio = [MILHAR_GRUPO_MEIO[i] for i in indices]
         else:
-            grupos_check = grupos
+            self.centenas = [extrair_centena(p) for p in premios]
+            self.centenas_esq = [extrair_centena_esq(p) for p in premios]
+            self.dezenas = [extrair_dezena(p) for p in premios]
+            self.dezenas_esq = [extrair_dezena_esq(p) for p in premios]
+            self.dezenas_meio = [extrair_dezena_meio(p) for p in premios]
+            self.grupos = [dezena_to_grupo(d) for d in self.dezenas]
+            self.grupos_esq = [dezena_to_grupo(d) for d in self.dezenas_esq]
+            self.grupos_meio = [dezena_to_grupo(d) for d in self.dezenas_meio]
+        # Assinatura por dígitos ordenados da milhar (base do invertido)
+        self.assinaturas = [assinatura_digitos(p[-4:]) for p in premios]
+        self._vencedores = {}
+        self._conjuntos = {}
+
+    def vencedores(self, familia: str) -> dict:
+        """
+        Chaves de palpite vencedoras de uma família de número único (montadas uma vez),
+        cada uma com o índice do primeiro prêmio que a gera
+        """
+        indice = self._vencedores.get(familia)
+        if indice is None:
+            indice = self._vencedores[familia] = {}
+            for i, chave in _VENCEDORES_POR_FAMILIA[familia](self):
+                indice.setdefault(chave, i)
+        return indice
+
+    def acerto(self, indice: int, faixa: str) -> Acerto:
+        """Acerto no prêmio `indice` de self.premios"""
+        return Acerto(self.posicoes[indice], self.premios[indice], faixa)
+
+    def conjunto(self, nome: str, limite: Optional[int] = None) -> ConjuntoBits:
+        """Bitmask de dezenas*/grupos* (opcionalmente só os `limite` primeiros prêmios), montada uma vez"""
+        chave = (nome, limite)
+        conjunto = self._conjuntos.get(chave)
+        if conjunto is None:
+            bit = _bit_grupo if nome.startswith("grupos") else _bit_dezena
+            conjunto = self._conjuntos[chave] = ConjuntoBits(getattr(self, nome)[:limite], bit)
+        return conjunto
+
+
+def _chave_grupo(palpite: str) -> tuple:
+    try:
+        return (int(palpite),)
+    except ValueError:
+        return ()
+
+
+# Índice invertido das modalidades de número único: por família, as chaves que um palpite
+# gera e os pares (índice do prêmio, chave vencedora) de um resultado. Ganha se alguma chave do
+# palpite estiver no índice - mesma regra das comparações palpite × prêmio da cadeia de verificar_modalidade.
+_CHAVES_PALPITE = {
+    "milhar": lambda p: (p.zfill(4),),
+    "milhar_ct": lambda p: (("m", p.zfill(4)), ("c", p[-3:])) if len(p) >= 3 else (("m", p.zfill(4)),),
+    "milhar_inv": lambda p: (assinatura_digitos(p[-4:].zfill(4)),),
+    "centena": lambda p: (p[-3:],) if len(p) >= 3 else (),
+    "centena_esq": lambda p: (p[:3],) if len(p) >= 3 else (),
+    "centena_3x": lambda p: (p[-3:].zfill(3) if len(p) >= 3 else p.zfill(3),),
+    "centena_inv": lambda p: (assinatura_digitos(p[-3:].zfill(3)),),
+    "centena_inv_esq": lambda p: (assinatura_digitos(p[:3].zfill(3)),),
+    "dezena": lambda p: (p[-2:].zfill(2),),
+    "dezena_esq": lambda p: (p[-2:].zfill(2),),
+    "dezena_meio": lambda p: (p[-2:].zfill(2),),
+    "grupo": _chave_grupo,
+    "grupo_esq": _chave_grupo,
+    "grupo_meio": _chave_grupo,
+    "unidade": lambda p: (p[-1],) if p else ("",),
+}
 
-        try:
-            palpite1 = int(palpites_norm[0])
-            palpite2 = int(palpites_norm[1])
-            if palpite1 in grupos_check and palpite2 in grupos_check:
-                return True
-        except:
-            pass
+_VENCEDORES_POR_FAMILIA = {
+    "milhar": lambda f: enumerate(f.premios),
+    "milhar_ct": lambda f: [(i, ("m", p)) for i, p in enumerate(f.premios)] + [(i, ("c", p[-3:])) for i, p in enumerate(f.premios)],
+    "milhar_inv": lambda f: enumerate(f.assinaturas),
+    "centena": lambda f: ((i, p[-3:]) for i, p in enumerate(f.premios)),
+    "centena_esq": lambda f: ((i, p[:3]) for i, p in enumerate(f.premios)),
+    "centena_3x": lambda f: ((i, c) for i, p in enumerate(f.premios) for c in (p[-3:], p[:3], p[1:4])),
+    "centena_inv": lambda f: ((i, assinatura_digitos(p[-3:].zfill(3))) for i, p in enumerate(f.premios)),
+    "centena_inv_esq": lambda f: ((i, assinatura_digitos(p[:3].zfill(3))) for i, p in enumerate(f.premios)),
+    "dezena": lambda f: enumerate(f.dezenas),
+    "dezena_esq": lambda f: enumerate(f.dezenas_esq),
+    "dezena_meio": lambda f: enumerate(f.dezenas_meio),
+    "grupo": lambda f: enumerate(f.grupos),
+    "grupo_esq": lambda f: enumerate(f.grupos_esq),
+    "grupo_meio": lambda f: enumerate(f.grupos_meio),
+    "unidade": lambda f: ((i, extrair_unidade(p)) for i, p in enumerate(f.premios)),
+}
 
-    # =========================================================================
-    # TERNO DEZENA (3 dezenas devem aparecer)
-    # =========================================================================
-    elif modalidade.startswith("terno_dez"):
-        if len(palpites_norm) < 3:
-            return False
 
-        is_seco = "seco" in modalidade
+def familia_numero_unico(modalidade: str) -> Optional[str]:
+    """Família do índice invertido para a modalidade (mesma precedência da cadeia), ou None"""
+    if modalidade in ("milhar", "palpitao"):
+        return "milhar"
+    if modalidade in ("milhar_ct", "centena", "centena_3x", "dezena", "dezena_esq", "dezena_meio",
+                      "grupo", "grupo_esq", "grupo_meio", "unidade"):
+        return modalidade
+    if modalidade in ("centena_esquerda", "centena_esq"):
+        return "centena_esq"
+    if modalidade.startswith("milhar_inv"):
+        return "milhar_inv"
+    if modalidade.startswith("centena_inv"):
+        return "centena_inv_esq" if "esq" in modalidade else "centena_inv"
+    return None
 
-        if "esq" in modalidade:
-            dezenas_check = dezenas_esq[:3] if is_seco else dezenas_esq
-        elif "meio" in modalidade:
-            dezenas_check = dezenas_meio[:3] if is_seco else dezenas_meio
-        else:
-            dezenas_check = dezenas[:3] if is_seco else dezenas
 
-        palpites_dez = [p[-2:].zfill(2) for p in palpites_norm[:3]]
+# -----------------------------------------------------------------------------
+# REGISTRO DE MATCHERS POR MODALIDADE
+# Cada código de modalidade resolve uma vez para uma função (palpites, features) -> Acerto | None com
+# os parâmetros (lado esq/meio, seco, quantidades) já ligados. Mesma precedência da antiga
+# cadeia if/elif: nomes exatos primeiro, depois prefixos na ordem em que a cadeia os testava.
+# -----------------------------------------------------------------------------
 
-        # Todos os 3 palpites devem estar nas dezenas
-        if all(p in dezenas_check for p in palpites_dez):
-            return True
+def _lado(modalidade: str) -> str:
+    """Sufixo do conjunto de dezenas/grupos: esquerda, meio ou direita (padrão)"""
+    if "esq" in modalidade:
+        return "_esq"
+    if "meio" in modalidade:
+        return "_meio"
+    return ""
+
+# =========================================================================
+# NÚMERO ÚNICO (milhar, centena, dezena, grupo, unidade e invertidos)
+# Lookup no conjunto vencedor do resultado (índice invertido por família)
+# =========================================================================
+def _casar_numero_unico(familia: str, palpites: list, features: ResultadoFeatures) -> Optional[Acerto]:
+    vencedores = features.vencedores(familia)
+    chaves = _CHAVES_PALPITE[familia]
+    consolacao = None
+    for palpite in palpites:
+        for chave in chaves(palpite):
+            indice = vencedores.get(chave)
+            if indice is None:
+                continue
+            if familia != "milhar_ct":
+                return features.acerto(indice, familia)
+            if chave[0] == "m":
+                return features.acerto(indice, "milhar")
+            if consolacao is None:
+                consolacao = indice
+    # milhar_ct sem milhar exata em nenhum palpite: centena (consolação)
+    return None if consolacao is None else features.acerto(consolacao, "centena")
+
+# =========================================================================
+# DUQUE / TERNO DEZENA (2 ou 3 dezenas devem aparecer nos prêmios)
+# =========================================================================
+def _casar_dezenas_todas(quantidade: int, conjunto: str, limite: Optional[int], palpites: list, features: ResultadoFeatures) -> Optional[Acerto]:
+    if len(palpites) < quantidade:
+        return None
+    palpites_dez = ConjuntoBits((p[-2:].zfill(2) for p in palpites[:quantidade]), _bit_dezena)
+    return Acerto() if features.conjunto(conjunto, limite).contem_todos(palpites_dez) else None
+
+# =========================================================================
+# DUQUE / TERNO / QUADRA GRUPO (2, 3 ou 4 grupos devem aparecer)
+# =========================================================================
+def _casar_grupos_todos(quantidade: int, conjunto: str, palpites: list, features: ResultadoFeatures) -> Optional[Acerto]:
+    if len(palpites) < quantidade:
+        return None
+    try:
+        palpites_gp = ConjuntoBits([int(p) for p in palpites[:quantidade]], _bit_grupo)
+    except ValueError:
+        return None
+    return Acerto() if features.conjunto(conjunto).contem_todos(palpites_gp) else None
+
+# =========================================================================
+# QUINA GRUPO (5 de 8 escolhidos nos 5 primeiros prêmios)
+# SENA GRUPO (6 de 10 escolhidos nos 6 primeiros prêmios)
+# =========================================================================
+def _casar_grupos_minimo(escolhidos: int, acertos_necessarios: int, conjunto: str, palpites: list, features: ResultadoFeatures) -> Optional[Acerto]:
+    if len(palpites) < escolhidos:
+        return None
+    try:
+        palpites_gp = ConjuntoBits([int(p) for p in palpites[:escolhidos]], _bit_grupo)
+    except ValueError:
+        return None
+    acertos = palpites_gp.acertos(features.conjunto(conjunto, acertos_necessarios))
+    return Acerto(faixa=f"{acertos} acertos") if acertos >= acertos_necessarios else None
+
+# =========================================================================
+# PASSE (combinação de 2 grupos em sequência)
+# =========================================================================
+def _casar_passe(vai_vem: bool, palpites: list, features: ResultadoFeatures) -> Optional[Acerto]:
+    # vai: grupo do 1º prêmio = palpite1 e do 2º = palpite2; vai-vem: qualquer ordem
+    grupos = features.grupos
+    if len(palpites) < 2 or len(grupos) < 2:
+        return None
+    try:
+        p1, p2 = int(palpites[0]), int(palpites[1])
+    except ValueError:
+        return None
+    g1, g2 = grupos[0], grupos[1]
+    if g1 == p1 and g2 == p2:
+        return Acerto(faixa="vai")
+    if vai_vem and g1 == p2 and g2 == p1:
+        return Acerto(faixa="vem")
+    return None
 
-    # =========================================================================
-    # TERNO GRUPO (3 grupos devem aparecer)
-    # =========================================================================
-    elif modalidade.startswith("terno_gp"):
-        if len(palpites_norm) < 3:
-            return False
+# =========================================================================
+# LOTINHA / QUININHA / SENINHA (jogos de dezenas acumuladas)
+# O jogador escolhe N dezenas (ex: "03-06-13-18-24-28") e precisa acertar 4 / 5 / 6.
+# NOTA: A verificação completa é feita no loop principal (verificar_premios_v2)
+# pois usa o resultado dedicado da CAIXA. Este matcher é fallback para resultado único.
+# =========================================================================
+def _casar_dezenas_caixa(acertos_necessarios: int, palpites: list, features: ResultadoFeatures) -> Optional[Acerto]:
+    dezenas_palpite = dezenas_palpite_caixa(palpites[0])
+    if not dezenas_palpite:
+        return None
+    # Dezenas dos prêmios disponíveis (direita - últimos 2 dígitos)
+    acertos = dezenas_palpite.acertos(features.conjunto("dezenas"))
+    return Acerto(faixa=f"{acertos} acertos") if acertos >= acertos_necessarios else None
+
+# =========================================================================
+# FALLBACK - Modalidade não reconhecida
+# =========================================================================
+def _casar_desconhecida(modalidade: str, palpites: list, features: ResultadoFeatures) -> Optional[Acerto]:
+    print(f"  [AVISO] Modalidade não reconhecida: {modalidade}")
+    # Tenta verificação básica como milhar
+    return _casar_numero_unico("milhar", palpites, features)
+
+
+MATCHERS_EXATOS = {
+    modalidade: partial(_casar_numero_unico, familia_numero_unico(modalidade))
+    for modalidade in (
+        "milhar", "milhar_ct", "centena", "centena_esquerda", "centena_esq", "centena_3x",
+        "dezena", "dezena_esq", "dezena_meio", "grupo", "grupo_esq", "grupo_meio", "unidade",
+        # PALPITÃO: por ora verificado como milhar (regras específicas dependem da banca)
+        "palpitao",
+    )
+}
+MATCHERS_EXATOS["passe_vai"] = partial(_casar_passe, False)
+MATCHERS_EXATOS["passe_vai_vem"] = partial(_casar_passe, True)
+
+# (prefixo, fábrica do matcher a partir do código completo), na ordem da cadeia original
+MATCHERS_PREFIXO = (
+    ("milhar_inv", lambda m: partial(_casar_numero_unico, "milhar_inv")),
+    ("centena_inv", lambda m: partial(_casar_numero_unico, familia_numero_unico(m))),
+    ("duque_dez", lambda m: partial(_casar_dezenas_todas, 2, "dezenas" + _lado(m), None)),
+    ("duque_gp", lambda m: partial(_casar_grupos_todos, 2, "grupos" + _lado(m))),
+    ("terno_dez", lambda m: partial(_casar_dezenas_todas, 3, "dezenas" + _lado(m), 3 if "seco" in m else None)),
+    ("terno_gp", lambda m: partial(_casar_grupos_todos, 3, "grupos" + _lado(m))),
+    ("quadra_gp", lambda m: partial(_casar_grupos_todos, 4, "grupos" + _lado(m))),
+    ("quina_gp", lambda m: partial(_casar_grupos_minimo, 8, 5, "grupos" + _lado(m))),
+    ("sena_gp", lambda m: partial(_casar_grupos_minimo, 10, 6, "grupos" + _lado(m))),
+    ("lotinha_", lambda m: partial(_casar_dezenas_caixa, 4)),
+    ("quininha_", lambda m: partial(_casar_dezenas_caixa, 5)),
+    ("seninha_", lambda m: partial(_casar_dezenas_caixa, 6)),
+)
 
-        if "esq" in modalidade:
-            grupos_check = grupos_esq
-        elif "meio" in modalidade:
-            grupos_check = grupos_meio
-        else:
-            grupos_check = grupos
 
-        try:
-            palpites_gp = [int(p) for p in palpites_norm[:3]]
-            if all(p in grupos_check for p in palpites_gp):
-                return True
-        except:
-            pass
+@lru_cache(maxsize=512)
+def resolver_matcher(modalidade: str):
+    """Matcher da modalidade (código já normalizado), resolvido uma vez por código"""
+    matcher = MATCHERS_EXATOS.get(modalidade)
+    if matcher is not None:
+        return matcher
+    for prefixo, fabrica in MATCHERS_PREFIXO:
+        if modalidade.startswith(prefixo):
+            return fabrica(modalidade)
+    return partial(_casar_desconhecida, modalidade)
 
-    # =========================================================================
-    # QUADRA GRUPO (4 grupos devem aparecer)
-    # =========================================================================
-    elif modalidade.startswith("quadra_gp"):
-        if len(palpites_norm) < 4:
-            return False
 
-        if "esq" in modalidade:
-            grupos_check = grupos_esq
-        elif "meio" in modalidade:
-            grupos_check = grupos_meio
-        else:
-            grupos_check = grupos
+def verificar_com_matcher(matcher, palpites: list, resultado, posicoes_validas: list) -> Optional[Acerto]:
+    """verificar_modalidade com o matcher já resolvido (ex: BetPlan.matcher)"""
+    features = resultado if isinstance(resultado, ResultadoFeatures) else ResultadoFeatures(resultado, posicoes_validas)
+    if not features.premios:
+        return None
 
-        try:
-            palpites_gp = [int(p) for p in palpites_norm[:4]]
-            if all(p in grupos_check for p in palpites_gp):
-                return True
-        except:
-            pass
+    # Normaliza palpites
+    palpites_norm = [str(p).strip() for p in palpites if p]
+    if not palpites_norm:
+        return None
 
-    # =========================================================================
-    # QUINA GRUPO (5 grupos de 8 escolhidos devem aparecer em 5 prêmios)
-    # =========================================================================
-    elif modalidade.startswith("quina_gp"):
-        if len(palpites_norm) < 8:
-            return False
+    return matcher(palpites_norm, features)
 
-        if "esq" in modalidade:
-            grupos_check = set(grupos_esq[:5])  # Usa 5 primeiros prêmios
-        elif "meio" in modalidade:
-            grupos_check = set(grupos_meio[:5])
-        else:
-            grupos_check = set(grupos[:5])
 
-        try:
-            palpites_gp = set(int(p) for p in palpites_norm[:8])
-            # Pelo menos 5 dos 8 palpites devem estar nos grupos dos prêmios
-            acertos = palpites_gp.intersection(grupos_check)
-            if len(acertos) >= 5:
-                return True
-        except:
-            pass
+def verificar_modalidade(modalidade: str, palpites: list, resultado, posicoes_validas: list) -> Optional[Acerto]:
+    """
+    Verifica se a aposta ganhou baseado na modalidade.
 
-    # =========================================================================
-    # SENA GRUPO (6 grupos de 10 escolhidos devem aparecer em 6 prêmios)
-    # =========================================================================
-    elif modalidade.startswith("sena_gp"):
-        if len(palpites_norm) < 10:
-            return False
+    Args:
+        modalidade: código da modalidade (ex: "milhar", "centena_inv", "duque_gp")
+        palpites: lista de palpites do apostador
+        resultado: ResultadoFeatures já montado para posicoes_validas, ou dict com premio_1..premio_10
+        posicoes_validas: lista de posições a verificar (ex: ["premio_1", "premio_2"...])
+
+    Returns:
+        Acerto (posição, prêmio e faixa; loteria fica a cargo de quem chama) se ganhou, None caso contrário
+    """
+    return verificar_com_matcher(resolver_matcher(modalidade.lower().strip()), palpites, resultado, posicoes_validas)
+
+
+# -----------------------------------------------------------------------------
+# PLANOS DE APOSTA: cada linha de apostas é compilada uma vez num registro compacto
+# (modalidade, palpites, posições, loterias já resolvidas); parsers memoizados por formato
+# -----------------------------------------------------------------------------
+
+@lru_cache(maxsize=1024)
+def posicoes_da_colocacao(posicao: str) -> tuple:
+    """(posicoes_validas, máscara de bits com bit 0 = premio_1) de um formato de colocacao"""
+    # FIX: parser robusto para todos os formatos de colocacao
+    posicoes_validas = []
+    if posicao == "geral":
+        posicoes_validas = ["premio_1", "premio_2", "premio_3", "premio_4", "premio_5", "premio_6", "premio_7", "premio_8", "premio_9", "premio_10"]
+    elif "_e_" in posicao:
+        # Combo format: "1_e_1_5_premio" → pega o range mais amplo
+        parts = posicao.replace("_premio", "").split("_e_")
+        for part in parts:
+            nums = [int(x) for x in part.split("_") if x.isdigit()]
+            if len(nums) == 1:
+                pos_key = f"premio_{min(nums[0], 10)}"
+                if pos_key not in posicoes_validas:
+                    posicoes_validas.append(pos_key)
+            elif len(nums) >= 2:
+                for i in range(nums[0], min(nums[-1] + 1, 11)):
+                    pos_key = f"premio_{i}"
+                    if pos_key not in posicoes_validas:
+                        posicoes_validas.append(pos_key)
+    elif "_premio" in posicao:
+        nums = [int(x) for x in posicao.replace("_premio", "").replace("_ao_", "_").split("_") if x.isdigit()]
+        if len(nums) == 1:
+            posicoes_validas = [f"premio_{min(nums[0], 10)}"]
+        elif len(nums) >= 2:
+            posicoes_validas = [f"premio_{i}" for i in range(nums[0], min(nums[-1] + 1, 11))]
+    if not posicoes_validas:
+        posicoes_validas = ["premio_1"]
+
+    mascara = 0
+    for pos in posicoes_validas:
+        n = int(pos[len("premio_"):])
+        if 1 <= n <= 10:
+            mascara |= 1 << (n - 1)
+    return tuple(posicoes_validas), mascara
+
+
+@lru_cache(maxsize=256)
+def modalidade_da_aposta(modalidade) -> str:
+    """Código normalizado da modalidade gravada na aposta (ausente = milhar)"""
+    modalidade_raw = (modalidade or "milhar").strip().upper()
+    # FIX: NÃO converter milhar_ct para centena - deixar verificar_modalidade tratar
+    return modalidade_raw.lower() if isinstance(modalidade, str) else "milhar"
+
+
+def chave_maluca(key: str, variante: str) -> str:
+    """Chave do resultado MALUCA pré-invertido em resultados_map"""
+    return f"{key}|maluca_{variante}"
+
+
+@lru_cache(maxsize=None)
+def destino_loteria(loteria_id: str) -> Optional[tuple]:
+    """
+    (banca, horario, loteria, chave do resultado, variante MALUCA, chave a verificar) da loteria,
+    ou None se não mapeada. Nas MALUCA a chave a verificar aponta para o resultado pré-invertido.
+    """
+    mapping = LOTERIA_TO_BANCA.get(loteria_id)
+    if not mapping:
+        return None
+    banca, horario, loteria = mapping
+    # MALUCA não-BAHIA verifica contra o resultado invertido (BAHIA MALUCA tem resultado próprio)
+    variante = None
+    if loteria_id.endswith("_maluca") and not loteria_id.startswith("ba_maluca"):
+        variante = "lotece" if loteria_id.startswith("ce_") else "padrao"
+    key = f"{horario}_{banca}_{loteria}"
+    return banca, horario, loteria, key, variante, chave_maluca(key, variante) if variante else key
+
+
+def _interno(valor):
+    """Strings repetidas entre apostas (ids de usuário/plataforma, palpites) viram um objeto só"""
+    return sys.intern(valor) if isinstance(valor, str) else valor
+
+
+@lru_cache(maxsize=1024)
+def _valor(valor) -> float:
+    """Valores monetários/multiplicadores se repetem: um float por valor distinto"""
+    return float(valor or 0)
+
+
+@lru_cache(maxsize=4096)
+def loterias_da_aposta(loteria_ids: tuple) -> tuple:
+    """((loteria_id, destino), ...) e os ids internados: tuplas compartilhadas por todas as apostas iguais"""
+    ids = tuple(_interno(loteria_id) for loteria_id in loteria_ids)
+    return tuple((loteria_id, destino_loteria(loteria_id)) for loteria_id in ids), ids
+
+
+@lru_cache(maxsize=8192)
+def chaves_lote_palpites(familia: Optional[str], palpites: tuple) -> Optional[array]:
+    """
+    Chaves inteiras do motor em lote, achatadas em array("q") [código, chave, código, chave, ...]
+    (None: modalidade combinada ou palpite fora do formato)
+    """
+    if familia is None:
+        return None
+    chaves_lote = array("q")
+    for palpite in palpites:
+        chaves_palpite = _chaves_palpite_lote(familia, palpite.strip())
+        if chaves_palpite is None:
+            return None
+        for codigo, chave in chaves_palpite:
+            chaves_lote.append(codigo)
+            chaves_lote.append(chave)
+    return chaves_lote or None
+
+
+class BetPlan:
+    """
+    Aposta compilada para a verificação: só os campos usados, já normalizados.
+    Tuplas de loterias/posições/chaves e strings repetidas são compartilhadas entre apostas.
+    """
+
+    __slots__ = (
+        "id", "user_id", "platform_id", "modalidade", "familia", "matcher", "palpites", "posicoes",
+        "mascara", "loterias", "forma", "chaves_lote", "valor_unitario", "valor_total", "multiplicador",
+    )
 
-        if "esq" in modalidade:
-            grupos_check = set(grupos_esq[:6])
-        elif "meio" in modalidade:
-            grupos_check = set(grupos_meio[:6])
+    def __init__(self, aposta: dict):
+        self.id = aposta["id"]
+        self.user_id = _interno(aposta.get("user_id"))
+        self.platform_id = _interno(aposta.get("platform_id"))
+
+        palpites_raw = aposta.get("palpites") or aposta.get("palpite")
+        if isinstance(palpites_raw, list):
+            palpites = tuple(sys.intern(str(p).strip()) for p in palpites_raw if p is not None and str(p).strip())
         else:
-            grupos_check = set(grupos[:6])
+            palpites = (sys.intern(str(palpites_raw).strip()),) if palpites_raw else ()
+        self.palpites = palpites or ("",)
 
-        try:
-            palpites_gp = set(int(p) for p in palpites_norm[:10])
-            acertos = palpites_gp.intersection(grupos_check)
-            if len(acertos) >= 6:
-                return True
-        except:
-            pass
+        self.modalidade = modalidade_da_aposta(aposta.get("modalidade"))
+        self.familia = familia_numero_unico(self.modalidade.lower().strip())
+        self.matcher = resolver_matcher(self.modalidade.lower().strip())
+        # FIX: campo correto é "colocacao", não "posicao"
+        self.posicoes, self.mascara = posicoes_da_colocacao(aposta.get("colocacao", "1_premio"))
+        self.loterias, loteria_ids = loterias_da_aposta(tuple(aposta.get("loterias", [])))
+        # Chave canônica da forma: apostas iguais nela têm o mesmo desfecho contra os resultados
+        self.forma = (self.modalidade, self.palpites, self.posicoes, loteria_ids)
 
-    # =========================================================================
-    # PASSE (combinação de 2 grupos em sequência)
-    # =========================================================================
-    elif modalidade == "passe_vai":
-        # Grupo do 1º prêmio = palpite1, Grupo do 2º prêmio = palpite2
-        if len(palpites_norm) < 2 or len(grupos) < 2:
-            return False
-        try:
-            p1, p2 = int(palpites_norm[0]), int(palpites_norm[1])
-            if grupos[0] == p1 and grupos[1] == p2:
-                return True
-        except:
-            pass
+        self.chaves_lote = chaves_lote_palpites(self.familia, self.palpites)
 
-    elif modalidade == "passe_vai_vem":
-        # Qualquer ordem: (p1,p2) ou (p2,p1) nos 2 primeiros grupos
-        if len(palpites_norm) < 2 or len(grupos) < 2:
-            return False
-        try:
-            p1, p2 = int(palpites_norm[0]), int(palpites_norm[1])
-            g1, g2 = grupos[0], grupos[1]
-            if (g1 == p1 and g2 == p2) or (g1 == p2 and g2 == p1):
-                return True
-        except:
-            pass
+        # FIX: usar valor_unitario (por palpite), não valor_total (soma de todos)
+        self.valor_unitario = _valor(aposta.get("valor_unitario", 0) or aposta.get("valor_total", 0))
+        self.valor_total = _valor(aposta.get("valor_total", 0))
+        self.multiplicador = _valor(aposta.get("multiplicador", 0))
 
-    # =========================================================================
-    # PALPITÃO (jogo especial - verificar regras específicas)
-    # =========================================================================
-    elif modalidade == "palpitao":
-        # Palpitão geralmente é uma combinação especial
-        # Implementação depende das regras específicas da banca
-        # Por ora, assume que é uma milhar especial
-        for palpite in palpites_norm:
-            for premio in premios:
-                if palpite.zfill(4) == premio.zfill(4):
-                    return True
 
-    # =========================================================================
-    # LOTINHA / QUININHA / SENINHA (jogos de dezenas acumuladas)
-    # O jogador escolhe N dezenas (ex: "03-06-13-18-24-28")
-    # Precisa acertar X dezenas nos resultados do dia:
-    # - Lotinha: 4 acertos
-    # - Quininha: 5 acertos
-    # - Seninha: 6 acertos
-    # NOTA: A verificação completa é feita no loop principal (verificar_premios_v2)
-    # pois precisa de TODOS os resultados do dia, não apenas um.
-    # Esta seção é fallback caso seja chamada com resultado único.
-    # =========================================================================
-    elif modalidade.startswith("lotinha_") or modalidade.startswith("quininha_") or modalidade.startswith("seninha_"):
-        # Determina quantos acertos são necessários
-        if modalidade.startswith("lotinha_"):
-            acertos_necessarios = 4
-        elif modalidade.startswith("quininha_"):
-            acertos_necessarios = 5
-        elif modalidade.startswith("seninha_"):
-            acertos_necessarios = 6
+def _resultado_maluca(resultado: dict, is_lotece: bool) -> dict:
+    """
+    Cópia do resultado com a inversão MALUCA (não-BAHIA) aplicada.
+    Ex: resultado "1234" → maluca "4321" (str[::-1])
+    """
+    resultado_verificar = dict(resultado)
+    if is_lotece:
+        # Padrão B: TODOS os prêmios recebem inversão completa da milhar
+        for pos in ["premio_1", "premio_2", "premio_3", "premio_4", "premio_5", "premio_6", "premio_7", "premio_8", "premio_9", "premio_10"]:
+            val = str(resultado_verificar.get(pos, "") or "").strip()
+            if val and len(val) >= 4:
+                resultado_verificar[pos] = val[::-1]
+    else:
+        # Padrão A: P1-P7 = inversão completa da milhar, P8-P10 = None (derivam de prêmios além do range)
+        for pos in ["premio_1", "premio_2", "premio_3", "premio_4", "premio_5", "premio_6", "premio_7"]:
+            val = str(resultado_verificar.get(pos, "") or "").strip()
+            if val and len(val) >= 4:
+                resultado_verificar[pos] = val[::-1]
+        # P8-P10 da MALUCA derivam de prêmios além do range normal, então anulamos
+        resultado_verificar["premio_8"] = None
+        resultado_verificar["premio_9"] = None
+        resultado_verificar["premio_10"] = None
+    return resultado_verificar
+
+
+# (chave do resultado, variante) de todas as loterias MALUCA não-BAHIA
+VARIANTES_MALUCA = frozenset(
+    (destino[3], destino[4]) for destino in map(destino_loteria, LOTERIA_TO_BANCA) if destino and destino[4]
+)
+
+
+def montar_resultados_map(resultados: list) -> dict:
+    """
+    Indexa resultados por horario+banca+loteria (evita colisão GERAL vs MALUCA etc) e materializa,
+    uma vez por resultado, as variantes MALUCA invertidas (chave_maluca) que as apostas verificam.
+    """
+    resultados_map = {}
+    for r in resultados:
+        key = f"{r['horario']}_{r['banca']}_{r['loteria']}"
+        resultados_map[key] = r
+        # BAHIA: em dias de Federal (qua/sab), o horario 19:00/20:00 tem loteria="FEDERAL"
+        # mas as apostas mapeiam para "GERAL". Duplica a chave para garantir match.
+        if r['banca'] == 'BAHIA' and r['loteria'] == 'FEDERAL':
+            key_geral = f"{r['horario']}_{r['banca']}_GERAL"
+            if key_geral not in resultados_map:
+                resultados_map[key_geral] = r
+
+    # MALUCA (não-BAHIA): inversão COMPLETA da milhar, uma cópia por resultado e padrão
+    # (BAHIA MALUCA já tem resultados separados, não precisa inverter)
+    for key, variante in sorted(VARIANTES_MALUCA):
+        resultado = resultados_map.get(key)
+        if resultado:
+            resultados_map[chave_maluca(key, variante)] = _resultado_maluca(resultado, variante == "lotece")
+            print(f"  MALUCA: Invertendo milhar ({'LOTECE' if variante == 'lotece' else 'padrao'}) para {key}")
+    return resultados_map
+
+
+# -----------------------------------------------------------------------------
+# MOTOR EM LOTE (NumPy) PARA MODALIDADES DE NÚMERO ÚNICO
+# verificar_modalidade segue como implementação de referência: o motor decide em bloco
+# os pares (aposta, loteria) que sabe representar e devolve o resto para ela.
+# -----------------------------------------------------------------------------
+
+# Valores da matriz de resultados: posição ignorada (vazia ou < 2 chars, como no
+# ResultadoFeatures) e prêmio fora do formato 4 dígitos (só a referência decide)
+PREMIO_VAZIO = -1
+PREMIO_FORA_FORMATO = -2
+
+# Famílias do motor; milhar_ct vira uma linha de milhar + uma de centena
+FAMILIAS_LOTE = tuple(f for f in _VENCEDORES_POR_FAMILIA if f != "milhar_ct")
+CODIGO_FAMILIA_LOTE = {familia: codigo for codigo, familia in enumerate(FAMILIAS_LOTE)}
+
+# Palpites mais longos que isso não cabem na chave int64 (e nunca ganham): ficam com a referência
+MAX_DIGITOS_PALPITE_LOTE = 8
+
+_tabelas_lote = None
+
+
+def _tabelas_familias_lote() -> list:
+    """Por código de família: (10000, 2) com o(s) valor(es) derivado(s) de cada milhar 0000-9999"""
+    global _tabelas_lote
+    if _tabelas_lote is None:
+        import numpy as np
+
+        m = np.arange(10000, dtype=np.int64)
+        digitos = np.stack([m // 1000, m // 100 % 10, m // 10 % 10, m % 10], axis=1)
+        grupo = np.frombuffer(GRUPO_DA_DEZENA, dtype=np.uint8).astype(np.int64)
+
+        def assinatura(d):
+            # Dígitos ordenados lidos como número (mesma chave do índice invertido)
+            d = np.sort(d, axis=1)
+            return d @ (10 ** np.arange(d.shape[1] - 1, -1, -1))
+
+        colunas = {
+            "milhar": [m],
+            "milhar_inv": [assinatura(digitos)],
+            "centena": [m % 1000],
+            "centena_esq": [m // 10],
+            "centena_3x": [m % 1000, m // 10],
+            "centena_inv": [assinatura(digitos[:, 1:])],
+            "centena_inv_esq": [assinatura(digitos[:, :3])],
+            "dezena": [m % 100],
+            "dezena_esq": [m // 100],
+            "dezena_meio": [m // 10 % 100],
+            "grupo": [grupo[m % 100]],
+            "grupo_esq": [grupo[m // 100]],
+            "grupo_meio": [grupo[m // 10 % 100]],
+            "unidade": [m % 10],
+        }
+        # Famílias com um valor só repetem a coluna (comparação sempre em (k, 10, 2))
+        _tabelas_lote = [np.stack((colunas[f] * 2)[:2], axis=1) for f in FAMILIAS_LOTE]
+    return _tabelas_lote
+
+
+def verificar_lote_numpy(familias, chaves, mascaras, linhas, matriz) -> tuple:
+    """
+    Avalia em bloco linhas (palpite × loteria), agrupadas por família.
+
+    Args:
+        familias: código da família (CODIGO_FAMILIA_LOTE) por linha
+        chaves: chave inteira do palpite (mesma chave do índice invertido) por linha
+        mascaras: bits das posições válidas por linha (bit 0 = premio_1)
+        linhas: índice do resultado em `matriz` por linha
+        matriz: (n_resultados, 10) com a milhar 0-9999 de cada posição ou PREMIO_VAZIO
+
+    Returns:
+        (ganhou, posicao): máscara de vitória e primeira posição premiada (0-9; -1 se não ganhou)
+    """
+    import numpy as np
+
+    familias = np.asarray(familias, dtype=np.int64)
+    chaves = np.asarray(chaves, dtype=np.int64)
+    mascaras = np.asarray(mascaras, dtype=np.int64)
+    linhas = np.asarray(linhas, dtype=np.int64)
+    matriz = np.asarray(matriz, dtype=np.int64).reshape(-1, 10)
+
+    ganhou = np.zeros(len(familias), dtype=bool)
+    posicao = np.full(len(familias), -1, dtype=np.int8)
+    bits = 1 << np.arange(10)
+    tabelas = _tabelas_familias_lote()
+    for codigo in np.unique(familias):
+        sel = np.flatnonzero(familias == codigo)
+        premios = matriz[linhas[sel]]
+        validos = (premios >= 0) & ((mascaras[sel, None] & bits) != 0)
+        derivados = tabelas[codigo][np.where(validos, premios, 0)]
+        acertos = (derivados == chaves[sel, None, None]).any(axis=2) & validos
+        venceu = acertos.any(axis=1)
+        ganhou[sel] = venceu
+        posicao[sel] = np.where(venceu, acertos.argmax(axis=1), -1)
+    return ganhou, posicao
+
+
+class MatrizResultadosLote:
+    """Linhas da matriz do motor, uma por chave verificada (MALUCA já invertida), montadas sob demanda"""
+
+    __slots__ = ("indices", "linhas", "fora_formato")
+
+    def __init__(self):
+        self.indices = {}
+        self.linhas = []
+        self.fora_formato = []
+
+    def linha(self, chave: str, resultado: dict) -> int:
+        indice = self.indices.get(chave)
+        if indice is None:
+            valores, fora = [], 0
+            for i in range(10):
+                premio = str(resultado.get(f"premio_{i + 1}", "") or "").strip()
+                if len(premio) < 2:
+                    valores.append(PREMIO_VAZIO)
+                    continue
+                milhar = indice_milhar(premio.zfill(4))
+                if milhar < 0:
+                    fora |= 1 << i
+                    milhar = PREMIO_FORA_FORMATO
+                valores.append(milhar)
+            indice = self.indices[chave] = len(self.linhas)
+            self.linhas.append(valores)
+            self.fora_formato.append(fora)
+        return indice
+
+
+def _chaves_palpite_lote(familia: str, palpite: str) -> Optional[list]:
+    """[(código da família, chave int)] do palpite no motor, ou None se só a referência decide"""
+    if not (palpite.isascii() and palpite.isdigit()) or len(palpite) > MAX_DIGITOS_PALPITE_LOTE:
+        return None
+    chaves = []
+    for chave in _CHAVES_PALPITE[familia](palpite):
+        marca = None
+        if familia == "milhar_ct":
+            marca, chave = chave
+        # Derivados do prêmio têm no máximo 4 dígitos: chave maior nunca casa na referência
+        # (comparação de strings), mas int() descartaria os zeros à esquerda ("01234" -> 1234)
+        if isinstance(chave, str) and len(chave) > 4:
+            return None
+        if marca is not None:
+            chaves.append((CODIGO_FAMILIA_LOTE["milhar" if marca == "m" else "centena"], int(chave)))
         else:
-            return False
+            chaves.append((CODIGO_FAMILIA_LOTE[familia], int(chave)))
+    return chaves
 
-        # Pega o primeiro palpite (formato: "03-06-13-18-24-28-30-...")
-        if not palpites_norm:
-            return False
 
-        palpite_str = palpites_norm[0]
+def _decidir_pagina_lote(planos: list, resultados_map: dict, matriz: MatrizResultadosLote) -> dict:
+    """
+    Decide em bloco os pares (aposta, loteria) de modalidades de número único.
 
-        # Separa as dezenas do palpite
-        dezenas_palpite = set()
-        for part in palpite_str.replace(" ", "").split("-"):
-            part = part.strip()
-            if part and part.isdigit():
-                dezenas_palpite.add(part.zfill(2))
+    Returns:
+        {(índice da aposta na página, loteria_id): Acerto ou None}. Pares ausentes (modalidade combinada,
+        palpite ou prêmio fora do formato, loteria sem resultado) ficam com verificar_modalidade.
+    """
+    familias, chaves, mascaras, linhas, par_da_linha, pares = [], [], [], [], [], []
+    for indice_aposta, plano in enumerate(planos):
+        if plano.chaves_lote is None:
+            continue
+        for loteria_id, destino in plano.loterias:
+            if destino is None:
+                continue
+            resultado = resultados_map.get(destino[5])
+            if not resultado:
+                continue
+            linha = matriz.linha(destino[5], resultado)
+            if matriz.fora_formato[linha] & plano.mascara:
+                continue
+            par = len(pares)
+            pares.append((indice_aposta, loteria_id))
+            chaves_lote = plano.chaves_lote
+            for codigo, chave in zip(chaves_lote[::2], chaves_lote[1::2]):
+                familias.append(codigo)
+                chaves.append(chave)
+                mascaras.append(plano.mascara)
+                linhas.append(linha)
+                par_da_linha.append(par)
+
+    if not pares:
+        return {}
+    import numpy as np
+
+    ganhou, posicao = verificar_lote_numpy(familias, chaves, mascaras, linhas, matriz.linhas)
+    # Linha que decide cada par: a primeira vencedora, ou a primeira de milhar (milhar_ct paga a milhar)
+    milhar = CODIGO_FAMILIA_LOTE["milhar"]
+    decisiva = {}
+    for i in np.flatnonzero(ganhou).tolist():
+        par = par_da_linha[i]
+        atual = decisiva.get(par)
+        if atual is None or (familias[atual] != milhar and familias[i] == milhar):
+            decisiva[par] = i
+
+    decisoes = dict.fromkeys(pares)
+    for par, i in decisiva.items():
+        p = int(posicao[i])
+        decisoes[pares[par]] = Acerto(
+            f"premio_{p + 1}", f"{matriz.linhas[linhas[i]][p]:04d}", FAMILIAS_LOTE[familias[i]], pares[par][1]
+        )
+    return decisoes
 
-        if not dezenas_palpite:
-            return False
 
-        # Extrai dezenas dos prêmios disponíveis (direita - últimos 2 dígitos)
-        dezenas_resultado = set()
-        for premio in premios:
-            if len(premio) >= 2:
-                dez = premio[-2:].zfill(2)
-                dezenas_resultado.add(dez)
+def pico_rss_mb() -> float:
+    """Pico de memória residente do processo (getrusage; ru_maxrss em KB no Linux)"""
+    import resource
 
-        # Conta quantas dezenas do palpite aparecem no resultado
-        acertos = len(dezenas_palpite & dezenas_resultado)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
-        if acertos >= acertos_necessarios:
-            return True
 
-    # =========================================================================
-    # FALLBACK - Modalidade não reconhecida
-    # =========================================================================
-    else:
-        print(f"  [AVISO] Modalidade não reconhecida: {modalidade}")
-        # Tenta verificação básica como milhar
-        for palpite in palpites_norm:
-            for premio in premios:
-                if palpite.zfill(4) == premio.zfill(4):
-                    return True
+# Horas após o sorteio sem resultado até a aposta ser reembolsada
+HORAS_LIMITE_REEMBOLSO = 12
 
-    return False
 
+def instante_epoch(momento: Optional[datetime] = None) -> int:
+    """Segundos desde a época (agora, se não informado): capturado uma vez por execução"""
+    return int((momento or agora_brasilia()).timestamp())
 
-def horario_expirou(data_jogo: str, horario: str, horas_limite: int = 1) -> bool:
+
+@lru_cache(maxsize=1024)
+def prazo_expiracao(data_jogo: str, horario: str, horas_limite: int) -> Optional[int]:
     """
-    Verifica se passou X horas do horário do sorteio
+    Instante (segundos desde a época) em que o sorteio de data_jogo/horario (Brasília) expira,
+    ou None se data/horário não parseiam (nunca expira). Calculado uma vez por (data, horário, limite).
     """
     try:
-        # Monta datetime do sorteio
         hora, minuto = horario.split(":")
         sorteio_dt = datetime.strptime(f"{data_jogo} {hora}:{minuto}", "%Y-%m-%d %H:%M")
+    except (AttributeError, ValueError):
+        return None
+    return instante_epoch((sorteio_dt + timedelta(hours=horas_limite)).replace(tzinfo=FUSO_BRASILIA))
 
-        # Adiciona horas de tolerância
-        limite_dt = sorteio_dt + timedelta(hours=horas_limite)
 
-        # Compara com agora (Brasília)
-        now_brt = agora_brasilia().replace(tzinfo=None)
+def expirou(prazo: Optional[int], agora: int) -> bool:
+    """
+    Decisão de expiração: só comparação de inteiros, sem relógio.
+    Ex: expirou(prazo_expiracao("2024-02-03", "14:00", 12), instante_epoch(datetime(2024, 2, 4, 2, 1, tzinfo=FUSO_BRASILIA))) -> True
+    """
+    return prazo is not None and agora > prazo
 
-        return now_brt > limite_dt
-    except Exception:
-        return False
+
+def horario_expirou(data_jogo: str, horario: str, horas_limite: int = 1) -> bool:
+    """
+    Verifica se passou X horas do horário do sorteio
+    """
+    return expirou(prazo_expiracao(data_jogo, horario, horas_limite), instante_epoch())
 
 
 def _enviar_alerta_scraper(titulo: str, mensagem: str, exc: Optional[Exception] = None) -> None:
@@ -2278,8 +3147,7 @@ def _enviar_alerta_scraper(titulo: str, mensagem: str, exc: Optional[Exception]
     webhook_url = os.environ.get("SCRAPER_ALERT_WEBHOOK_URL") or os.environ.get("ADMIN_ALERT_WEBHOOK_URL")
     if webhook_url:
         try:
-            import requests
-            requests.post(
+            sessao_http().post(
                 webhook_url,
                 json={"title": titulo, "message": mensagem, "source": "ultra-banca-scraper", "exception": str(exc) if exc else None},
                 timeout=10
@@ -2288,21 +3156,294 @@ def _enviar_alerta_scraper(titulo: str, mensagem: str, exc: Optional[Exception]
             print(f"CRITICAL: Falha ao enviar webhook de alerta: {e}")
 
 
-@app.function(image=image, secrets=[supabase_secret], timeout=300)
+# Apostas pendentes por página (keyset em id): memória constante por página,
+# sem teto de apostas por dia
+TAMANHO_PAGINA_APOSTAS = 1000
+
+# Desfechos por forma guardados entre páginas (acima disso o cache recomeça)
+LIMITE_FORMAS_MEMORIZADAS = 200000
+
+# Colunas que a verificação lê (BetPlan + keyset): sem created_at, horarios, pule, tipo etc
+COLUNAS_APOSTAS_VERIFICACAO = (
+    "id", "user_id", "platform_id", "modalidade", "palpites", "colocacao", "loterias",
+    "valor_unitario", "valor_total", "multiplicador",
+)
+COLUNAS_RESULTADOS_VERIFICACAO = ("horario", "banca", "loteria") + tuple(f"premio_{i}" for i in range(1, 11))
+
+
+def _linhas_colunares(colunas: dict, nomes: tuple = COLUNAS_APOSTAS_VERIFICACAO) -> list:
+    """Linhas (dicts) de um payload colunar {coluna: [valores...]} com arrays paralelos"""
+    return [dict(zip(nomes, valores)) for valores in zip(*(colunas.get(nome) or [] for nome in nomes))]
+
+
+def _paginas_apostas_pendentes(supabase, data: str, tamanho_pagina: int = TAMANHO_PAGINA_APOSTAS):
+    """
+    Gera páginas de apostas pendentes do dia em ordem de id (keyset: id > último id visto,
+    estável mesmo com as apostas mudando de status durante a verificação).
+    A próxima página é buscada em background enquanto a atual é verificada.
+    Lê só COLUNAS_APOSTAS_VERIFICACAO, em formato colunar via fn_apostas_pendentes_colunar;
+    se a RPC falhar (ex: migration ainda não aplicada), segue com select projetado.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    colunar = True
+
+    def buscar(apos_id: Optional[str]) -> list:
+        nonlocal colunar
+        if colunar:
+            try:
+                rpc = supabase.rpc("fn_apostas_pendentes_colunar", {
+                    "p_data": data, "p_apos_id": apos_id, "p_limite": tamanho_pagina,
+                }).execute()
+                raw = getattr(rpc, "data", None)
+                colunas = (raw[0] if isinstance(raw, list) and raw else raw) or {}
+                if not isinstance(colunas, dict):
+                    raise Exception(f"payload inesperado: {type(colunas).__name__}")
+                return _linhas_colunares(colunas)
+            except Exception as e:
+                print(f"  [AVISO] fn_apostas_pendentes_colunar falhou ({e}); usando select projetado")
+                colunar = False
+        query = supabase.table("apostas").select(", ".join(COLUNAS_APOSTAS_VERIFICACAO))
+        query = query.eq("data_jogo", data).eq("status", "pendente")
+        if apos_id is not None:
+            query = query.gt("id", apos_id)
+        return query.order("id").limit(tamanho_pagina).execute().data or []
+
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        futuro = prefetch.submit(buscar, None)
+        while futuro is not None:
+            pagina = futuro.result()
+            futuro = prefetch.submit(buscar, pagina[-1]["id"]) if len(pagina) == tamanho_pagina else None
+            if pagina:
+                yield pagina
+
+
+def _marcar_apostas_perdeu(supabase, ids_perdeu: list) -> None:
+    """fn_mark_bets_lost em lote; se a RPC falhar, marca uma a uma"""
+    if not ids_perdeu:
+        return
+    try:
+        rpc = supabase.rpc("fn_mark_bets_lost", {"p_bet_ids": ids_perdeu}).execute()
+        raw = getattr(rpc, "data", None)
+        res = (raw[0] if isinstance(raw, list) and raw else raw) or {}
+        n = res.get("updated", 0) if isinstance(res, dict) else 0
+        print(f"  Batch perdeu: {len(ids_perdeu)} IDs enviados, {n} atualizados")
+    except Exception as e:
+        print(f"  [AVISO] Batch perdeu falhou: {e}; marcando uma a uma")
+        for bid in ids_perdeu:
+            try:
+                supabase.table("apostas").update({"status": "perdeu"}).eq("id", bid).execute()
+            except Exception:
+                pass
+
+
+# Prêmios por chamada do fn_process_payouts_batch
+TAMANHO_LOTE_PAGAMENTO = 200
+
+
+def _pagar_premio_individual(supabase, item: dict) -> dict:
+    """Caminho antigo (3 round trips por prêmio): fallback quando a RPC em lote falha"""
+    bet_id = item["bet_id"]
+    try:
+        # 1. Creditar saldo via RPC atômico (FOR UPDATE + ledger)
+        rpc_result = supabase.rpc("fn_change_balance", {
+            "p_user_id": item["user_id"],
+            "p_amount": item["amount"],
+            "p_type": "premio",
+            "p_wallet": "saldo",
+            "p_reference_id": bet_id,
+            "p_description": f"Premio {item['modalidade']} aposta {bet_id[:8]}",
+        }).execute()
+        rpc_data = getattr(rpc_result, "data", None)
+        if isinstance(rpc_data, dict) and rpc_data.get("error"):
+            raise Exception(f"fn_change_balance error: {rpc_data['error']}")
+        novo_saldo = rpc_data.get("balance_after", 0) if isinstance(rpc_data, dict) else 0
+        # 2. SÓ DEPOIS do crédito: marcar aposta como premiada
+        supabase.table("apostas").update({
+            "status": "premiada",
+            "premio_valor": item["amount"]
+        }).eq("id", bet_id).execute()
+        # 3. Registrar transação
+        supabase.table("transactions").insert({
+            "user_id": item["user_id"],
+            "platform_id": item["platform_id"],
+            "tipo": "prize",
+            "amount": item["amount"],
+            "status": "completed",
+            "external_id": f"payout_{bet_id}",
+            "metadata": {"modalidade": item["modalidade"], "description": f"Premio de aposta: {bet_id}", "acerto": item.get("acerto")},
+        }).execute()
+        return {"bet_id": bet_id, "status": "paid", "amount": item["amount"], "balance_after": novo_saldo}
+    except Exception as e:
+        print(f"  ERRO payout {bet_id[:8]}: {type(e).__name__}: {e}")
+        return {"bet_id": bet_id, "status": "error", "error": str(e)}
+
+
+def _pagar_premios_lote(supabase, pagamentos: list, tamanho_lote: int = TAMANHO_LOTE_PAGAMENTO) -> list:
+    """
+    Paga prêmios via fn_process_payouts_batch, um round trip por lote.
+    Retorna o status de cada item na mesma ordem de `pagamentos`
+    ({"bet_id", "status": paid|skipped|not_found|error, ...}).
+    Se a RPC falhar, reconfere quais apostas ainda estão pendentes (a chamada pode ter
+    sido aplicada antes do erro de rede) e paga só essas pelo caminho individual.
+    """
+    status_por_aposta = {}
+    for inicio in range(0, len(pagamentos), tamanho_lote):
+        lote = pagamentos[inicio:inicio + tamanho_lote]
+        try:
+            rpc = supabase.rpc("fn_process_payouts_batch", {
+                "p_items": [
+                    {"bet_id": p["bet_id"], "amount": p["amount"], "modalidade": p["modalidade"], "acerto": p.get("acerto")}
+                    for p in lote
+                ],
+            }).execute()
+            raw = getattr(rpc, "data", None)
+            res = (raw[0] if isinstance(raw, list) and raw else raw) or {}
+            if not isinstance(res, dict) or not res.get("success"):
+                raise Exception(f"fn_process_payouts_batch error: {res}")
+            for item in res.get("items", []):
+                status_por_aposta[str(item.get("bet_id"))] = item
+            print(f"  Batch prêmios: {len(lote)} enviados, {res.get('paid', 0)} pagos, {res.get('skipped', 0)} ignorados, {res.get('errors', 0)} erros")
+        except Exception as e:
+            print(f"  [AVISO] Batch prêmios falhou: {e}; pagando uma a uma")
+            ids = [p["bet_id"] for p in lote]
+            try:
+                resp = supabase.table("apostas").select("id, status").in_("id", ids).execute()
+                pendentes = {r["id"] for r in resp.data or [] if r.get("status") == "pendente"}
+            except Exception as e_status:
+                print(f"  [AVISO] Não foi possível reconferir status ({e_status}); lote fica para a próxima verificação")
+                continue
+            for p in lote:
+                if p["bet_id"] in pendentes:
+                    status_por_aposta[p["bet_id"]] = _pagar_premio_individual(supabase, p)
+                else:
+                    status_por_aposta[p["bet_id"]] = {"bet_id": p["bet_id"], "status": "skipped"}
+
+    retorno = []
+    for p in pagamentos:
+        status = status_por_aposta.get(p["bet_id"], {"bet_id": p["bet_id"], "status": "error", "error": "sem status"})
+        if status.get("status") == "paid":
+            print(f"  Aposta {p['bet_id'][:8]} PAGA! Novo saldo: R${float(status.get('balance_after') or 0):.2f}")
+        elif status.get("status") == "error":
+            print(f"  ERRO payout {p['bet_id'][:8]}: {status.get('error')}")
+        retorno.append(status)
+    return retorno
+
+
+# Reembolsos por chamada do fn_process_refunds_batch
+TAMANHO_LOTE_REEMBOLSO = 200
+
+
+def _reembolsar_aposta_individual(supabase, item: dict) -> dict:
+    """Caminho antigo (até 3 round trips por aposta): fallback quando a RPC em lote falha"""
+    bet_id = item["bet_id"]
+    valor_reembolso = item["valor"]
+    try:
+        if valor_reembolso > 0:
+            # 1. Creditar saldo via RPC atômico
+            rpc_result = supabase.rpc("fn_change_balance", {
+                "p_user_id": item["user_id"],
+                "p_amount": valor_reembolso,
+                "p_type": "reembolso",
+                "p_wallet": "saldo",
+                "p_reference_id": bet_id,
+                "p_description": f"Reembolso: resultado indisponivel apos 12h",
+            }).execute()
+            rpc_data = getattr(rpc_result, "data", None)
+            if isinstance(rpc_data, dict) and rpc_data.get("error"):
+                raise Exception(f"fn_change_balance error: {rpc_data['error']}")
+            # 2. Registrar transação
+            supabase.table("transactions").insert({
+                "user_id": item["user_id"],
+                "platform_id": item["platform_id"],
+                "tipo": "refund",
+                "amount": valor_reembolso,
+                "status": "completed",
+                "external_id": f"refund_{bet_id}",
+                "metadata": {"reason": item["reason"], "bet_id": bet_id},
+            }).execute()
+        # 3. SÓ DEPOIS do crédito: marcar aposta como reembolsada (valor 0: sem crédito)
+        supabase.table("apostas").update({
+            "status": "reembolsado"
+        }).eq("id", bet_id).execute()
+        return {"bet_id": bet_id, "status": "refunded", "refund": valor_reembolso}
+    except Exception as e:
+        return {"bet_id": bet_id, "status": "error", "error": str(e)}
+
+
+def _reembolsar_apostas_lote(supabase, reembolsos: list, tamanho_lote: int = TAMANHO_LOTE_REEMBOLSO) -> list:
+    """
+    Reembolsa apostas via fn_process_refunds_batch, um round trip por lote.
+    Retorna o status de cada item na mesma ordem de `reembolsos`
+    ({"bet_id", "status": refunded|skipped|not_found|error, ...}).
+    Fallback igual ao de _pagar_premios_lote: reconfere pendentes e faz uma a uma.
+    """
+    status_por_aposta = {}
+    for inicio in range(0, len(reembolsos), tamanho_lote):
+        lote = reembolsos[inicio:inicio + tamanho_lote]
+        try:
+            rpc = supabase.rpc("fn_process_refunds_batch", {
+                "p_items": [{"bet_id": r["bet_id"], "reason": r["reason"]} for r in lote],
+            }).execute()
+            raw = getattr(rpc, "data", None)
+            res = (raw[0] if isinstance(raw, list) and raw else raw) or {}
+            if not isinstance(res, dict) or not res.get("success"):
+                raise Exception(f"fn_process_refunds_batch error: {res}")
+            for item in res.get("items", []):
+                status_por_aposta[str(item.get("bet_id"))] = item
+            print(f"  Batch reembolsos: {len(lote)} enviados, {res.get('refunded', 0)} reembolsados, {res.get('skipped', 0)} ignorados, {res.get('errors', 0)} erros")
+        except Exception as e:
+            print(f"  [AVISO] Batch reembolsos falhou: {e}; reembolsando uma a uma")
+            ids = [r["bet_id"] for r in lote]
+            try:
+                resp = supabase.table("apostas").select("id, status").in_("id", ids).execute()
+                pendentes = {r["id"] for r in resp.data or [] if r.get("status") == "pendente"}
+            except Exception as e_status:
+                print(f"  [AVISO] Não foi possível reconferir status ({e_status}); lote fica para a próxima verificação")
+                continue
+            for r in lote:
+                if r["bet_id"] in pendentes:
+                    status_por_aposta[r["bet_id"]] = _reembolsar_aposta_individual(supabase, r)
+                else:
+                    status_por_aposta[r["bet_id"]] = {"bet_id": r["bet_id"], "status": "skipped"}
+
+    retorno = []
+    for r in reembolsos:
+        status = status_por_aposta.get(r["bet_id"], {"bet_id": r["bet_id"], "status": "error", "error": "sem status"})
+        if status.get("status") == "refunded":
+            print(f"  Aposta {r['bet_id'][:8]} REEMBOLSADA (R${float(status.get('refund') or 0):.2f})")
+        elif status.get("status") == "error":
+            print(f"  Erro ao reembolsar {r['bet_id'][:8]}: {status.get('error')}")
+        else:
+            print(f"  Reembolso de {r['bet_id'][:8]} ignorado ({status.get('status')}): aposta já resolvida ou inexistente")
+        retorno.append(status)
+    return retorno
+
+
+def _carregar_odds_plataformas(supabase, platform_ids: set) -> dict:
+    """
+    {(platform_id, codigo): multiplicador} de platform_modalidades ativas com multiplicador > 0,
+    numa única query para todas as plataformas (substitui o lookup por aposta ganhadora)
+    """
+    resp = supabase.table("platform_modalidades").select("platform_id, codigo, multiplicador").in_("platform_id", list(platform_ids)).eq("ativo", True).execute()
+    odds = {}
+    for item in resp.data or []:
+        mult = float(item.get("multiplicador", 0) or 0)
+        if mult > 0:
+            odds[(item["platform_id"], item["codigo"])] = mult
+    return odds
+
+
 def verificar_premios_v2(data: Optional[str] = None) -> dict:
     """
     Verifica apostas pendentes contra resultados (Versão Otimizada)
     - Busca Odds Dinâmicas no banco
-    - Paginação de apostas
+    - Paginação keyset de apostas com prefetch da próxima página
     - Filtra por data e loterias com resultado
-    - Premiação via RPC fn_process_payout (atômico)
+    - Premiação em lote via RPC fn_process_payouts_batch (atômico por item)
     """
-    from supabase import create_client
-
     try:
-        supabase_url = os.environ["SUPABASE_URL"]
-        supabase_key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-        supabase = create_client(supabase_url, supabase_key)
+        supabase = cliente_supabase()
     except Exception as e:
         _enviar_alerta_scraper("Erro de conexão com o banco", "Falha ao criar cliente Supabase.", e)
         return {"verificadas": 0, "ganhou": 0, "perdeu": 0, "reembolsado": 0, "error": str(e)}
@@ -2312,7 +3453,7 @@ def verificar_premios_v2(data: Optional[str] = None) -> dict:
 
     try:
         # 1. Busca resultados do dia (ANTES das apostas para saber o que validar)
-        resultados_resp = supabase.table("resultados").select("*").eq("data", data_verificar).execute()
+        resultados_resp = supabase.table("resultados").select(", ".join(COLUNAS_RESULTADOS_VERIFICACAO)).eq("data", data_verificar).execute()
         resultados = resultados_resp.data or []
     except Exception as e:
         _enviar_alerta_scraper("Erro ao buscar resultados", f"data={data_verificar}", e)
@@ -2326,41 +3467,41 @@ def verificar_premios_v2(data: Optional[str] = None) -> dict:
     ganhou = 0
     perdeu = 0
     reembolsado = 0
+    reembolso_ignorado = 0
     ainda_pendente = 0
+    notificacoes_enfileiradas = 0
     try:
-        # Indexa resultados por horario+banca+loteria (evita colisão GERAL vs MALUCA etc)
-        resultados_map = {}
-        loterias_com_resultado = set()
-        for r in resultados:
-            key = f"{r['horario']}_{r['banca']}_{r['loteria']}"
-            resultados_map[key] = r
-            loterias_com_resultado.add(r['banca'])
-            # BAHIA: em dias de Federal (qua/sab), o horario 19:00/20:00 tem loteria="FEDERAL"
-            # mas as apostas mapeiam para "GERAL". Duplica a chave para garantir match.
-            if r['banca'] == 'BAHIA' and r['loteria'] == 'FEDERAL':
-                key_geral = f"{r['horario']}_{r['banca']}_GERAL"
-                if key_geral not in resultados_map:
-                    resultados_map[key_geral] = r
+        # Indexa resultados por horario+banca+loteria, com as variantes MALUCA já invertidas
+        resultados_map = montar_resultados_map(resultados)
+        loterias_com_resultado = {r['banca'] for r in resultados}
         print(f"  Resultados disponíveis: {len(resultados)} ({len(loterias_com_resultado)} bancas)")
 
+        # ResultadoFeatures por (chave verificada, posições)
+        features_cache = {}
+        # Matriz de resultados do motor em lote, uma linha por chave verificada
+        resultados_lote = MatrizResultadosLote()
+        # Dezenas dos resultados CAIXA (bitmask) por chave: parse do CSV uma vez por dia
+        dezenas_caixa = {}
+
         # 2. Odds por plataforma (multi-tenant): platform_modalidades primeiro, fallback para modalidades_config
+        # platform_modalidades é pré-carregado por página (uma query para todas as plataformas novas)
+        odds_plataforma = {}
+        plataformas_carregadas = set()
+
         def get_multiplicador_platform(platform_id: Optional[str], modalidade: str, aposta_multiplicador: float, dynamic: dict) -> float:
             # Se a aposta já tem multiplicador definido, usar esse
             if aposta_multiplicador and aposta_multiplicador > 0:
                 return float(aposta_multiplicador)
 
-            # Primeiro tenta buscar da tabela platform_modalidades (config por banca)
-            if platform_id:
-                try:
-                    r = supabase.table("platform_modalidades").select("multiplicador").eq("platform_id", platform_id).eq("codigo", modalidade).eq("ativo", True).execute()
-                    if r.data and len(r.data) > 0:
-                        mult = float(r.data[0].get("multiplicador", 0) or 0)
-                        if mult > 0:
-                            return mult
-                except Exception as e:
-                    print(f"  [AVISO] Falha ao buscar multiplicador platform_modalidades: {e}")
+            # Primeiro tenta a tabela platform_modalidades (config por banca, pré-carregada)
+            if platform_id in plataformas_carregadas:
+                mult = odds_plataforma.get((platform_id, modalidade))
+                if mult:
+                    return mult
+                # Mesmo fallback do fn_get_multiplicador: modalidades_config ativo
+                return float(dynamic.get(modalidade, 0))
 
-            # Fallback: usa RPC fn_get_multiplicador que faz a lógica de fallback no banco
+            # Pré-carga falhou para esta plataforma: RPC fn_get_multiplicador faz o fallback no banco
             if platform_id:
                 try:
                     rpc = supabase.rpc("fn_get_multiplicador", {"p_platform_id": platform_id, "p_codigo": modalidade}).execute()
@@ -2383,72 +3524,64 @@ def verificar_premios_v2(data: Optional[str] = None) -> dict:
         except Exception as e:
             print(f"  [AVISO] Falha ao buscar odds dinâmicas: {e}")
 
-        loteria_ids_com_resultado = set()
-        for lid, (mb, mh, ml) in LOTERIA_TO_BANCA.items():
-            key = f"{mh}_{mb}_{ml}"
-            if key in resultados_map:
-                loteria_ids_com_resultado.add(lid)
-
-        # Buscar todas as pendentes do dia (limite 50k) e processar em memoria para evitar loop de paginacao
-        MAX_APOSTAS = 50000
-        print(f"  Buscando apostas pendentes para {data_verificar} (limite {MAX_APOSTAS})...")
-        query = supabase.table("apostas").select("*").eq("data_jogo", data_verificar).eq("status", "pendente").order("id").limit(MAX_APOSTAS)
-        apostas_resp = query.execute()
-        apostas_lote = apostas_resp.data or []
-        total_verificadas = len(apostas_lote)
-        print(f"  Total pendentes no dia: {len(apostas_lote)}")
-        ids_perdeu_batch = []
-
-        for aposta in apostas_lote:
-            loterias = aposta.get("loterias", [])
-            palpites_raw = aposta.get("palpites") or aposta.get("palpite")
-            if isinstance(palpites_raw, list):
-                palpites_lista = [str(p).strip() for p in palpites_raw if p is not None and str(p).strip()]
-            else:
-                palpites_lista = [str(palpites_raw).strip()] if palpites_raw else []
-            if not palpites_lista:
-                palpites_lista = [""]
-            modalidade_raw = (aposta.get("modalidade") or "milhar").strip().upper()
-            # FIX: NÃO converter milhar_ct para centena - deixar verificar_modalidade tratar
-            modalidade = modalidade_raw.lower() if isinstance(aposta.get("modalidade"), str) else "milhar"
-            # FIX: campo correto é "colocacao", não "posicao"
-            posicao = aposta.get("colocacao", "1_premio")
-            # FIX: usar valor_unitario (por palpite), não valor_total (soma de todos)
-            valor_aposta = float(aposta.get("valor_unitario", 0) or aposta.get("valor_total", 0) or 0)
-            user_id = aposta.get("user_id")
-            platform_id = aposta.get("platform_id")
-
-            # FIX: parser robusto para todos os formatos de colocacao
-            posicoes_validas = []
-            if posicao == "geral":
-                posicoes_validas = ["premio_1", "premio_2", "premio_3", "premio_4", "premio_5", "premio_6", "premio_7", "premio_8", "premio_9", "premio_10"]
-            elif "_e_" in posicao:
-                # Combo format: "1_e_1_5_premio" → pega o range mais amplo
-                parts = posicao.replace("_premio", "").split("_e_")
-                for part in parts:
-                    nums = [int(x) for x in part.split("_") if x.isdigit()]
-                    if len(nums) == 1:
-                        pos_key = f"premio_{min(nums[0], 10)}"
-                        if pos_key not in posicoes_validas:
-                            posicoes_validas.append(pos_key)
-                    elif len(nums) >= 2:
-                        for i in range(nums[0], min(nums[-1] + 1, 11)):
-                            pos_key = f"premio_{i}"
-                            if pos_key not in posicoes_validas:
-                                posicoes_validas.append(pos_key)
-            elif "_premio" in posicao:
-                nums = [int(x) for x in posicao.replace("_premio", "").replace("_ao_", "_").split("_") if x.isdigit()]
-                if len(nums) == 1:
-                    posicoes_validas = [f"premio_{min(nums[0], 10)}"]
-                elif len(nums) >= 2:
-                    posicoes_validas = [f"premio_{i}" for i in range(nums[0], min(nums[-1] + 1, 11))]
-            if not posicoes_validas:
-                posicoes_validas = ["premio_1"]
-
-            aposta_ganhou = False
-            todos_resultados_saiu = True
-            loterias_sem_resultado = []
-            horario_mais_tardio = None
+        # Apostas com a mesma forma (modalidade, palpites, colocacao, loterias) têm o mesmo
+        # desfecho contra os resultados: cada forma é avaliada uma vez por execução e o
+        # desfecho é repassado a todas as apostas do grupo. Passando de LIMITE_FORMAS_MEMORIZADAS
+        # o cache é zerado (só custa reavaliar), então milhões de formas distintas não estouram a memória
+        avaliacoes_forma = {}
+
+        def avaliar_pares_por_resultado(planos_forma: list) -> dict:
+            """
+            Hash-join das formas com os resultados: pares (forma, loteria) agrupados por chave
+            verificada (MALUCA já invertida) e decididos balde a balde. Baldes cuja chave não
+            tem resultado são pulados inteiros (essas apostas só ficam pendentes ou expiram).
+            """
+            baldes = {}
+            for indice_lote, plano in enumerate(planos_forma):
+                if plano.modalidade.startswith(("lotinha_", "quininha_", "seninha_")):
+                    continue  # resultado dedicado da CAIXA, fora do join
+                for loteria_id, destino in plano.loterias:
+                    if destino:
+                        baldes.setdefault(destino[5], []).append((indice_lote, loteria_id))
+
+            # Modalidades de número único decididas em bloco (motor NumPy); o resto cai na referência
+            ganhos = _decidir_pagina_lote(planos_forma, resultados_map, resultados_lote)
+            # Baldes em sequência de propósito: o que sobra aqui é Python puro preso à CPU
+            # (matchers e features, sem I/O), então threads só disputariam a GIL; o volume
+            # paralelizável (número único) já vai vetorizado no motor NumPy acima
+            for chave, pares in baldes.items():
+                resultado = resultados_map.get(chave)
+                if not resultado:
+                    continue
+                for indice_lote, loteria_id in pares:
+                    if (indice_lote, loteria_id) in ganhos:
+                        continue
+                    plano = planos_forma[indice_lote]
+                    # Features do (resultado, posições): montadas uma vez por execução
+                    chave_features = (chave, plano.posicoes)
+                    features = features_cache.get(chave_features)
+                    if features is None:
+                        features = features_cache[chave_features] = ResultadoFeatures(resultado, plano.posicoes)
+
+                    # Matcher da modalidade já resolvido no plano (registro por código)
+                    acerto = verificar_com_matcher(
+                        plano.matcher,
+                        palpites=plano.palpites,
+                        resultado=features,
+                        posicoes_validas=plano.posicoes
+                    )
+                    if acerto is not None:
+                        acerto.loteria = loteria_id
+                    ganhos[(indice_lote, loteria_id)] = acerto
+            return ganhos
+
+        # Desfecho mais comum: um dict só, compartilhado por todas as formas que perderam
+        AVALIACAO_PERDEU = {"status": "perdeu"}
+
+        def avaliar_forma(plano: BetPlan, indice_lote: int, ganhos_pares: dict) -> dict:
+            modalidade = plano.modalidade
+            palpites_lista = plano.palpites
+            posicoes_validas = plano.posicoes
 
             # =========================================================================
             # TRATAMENTO ESPECIAL: LOTINHA / QUININHA / SENINHA
@@ -2458,9 +3591,7 @@ def verificar_premios_v2(data: Optional[str] = None) -> dict:
             # - Seninha: Mega-Sena (6 dezenas), precisa acertar 6+
             # Resultados armazenados em resultados com banca='CAIXA', dezenas CSV em premio_1
             # =========================================================================
-            is_lotinha_quininha_seninha = modalidade.startswith("lotinha_") or modalidade.startswith("quininha_") or modalidade.startswith("seninha_")
-
-            if is_lotinha_quininha_seninha:
+            if modalidade.startswith("lotinha_") or modalidade.startswith("quininha_") or modalidade.startswith("seninha_"):
                 # Mapeia modalidade para loteria da Caixa
                 if modalidade.startswith("lotinha_"):
                     acertos_necessarios = 4
@@ -2475,305 +3606,215 @@ def verificar_premios_v2(data: Optional[str] = None) -> dict:
                 # Busca resultado da Caixa no resultados_map (chave: "20:00_CAIXA_LOTO_FACIL" etc)
                 caixa_key = f"20:00_CAIXA_{caixa_loteria}"
                 resultado_caixa = resultados_map.get(caixa_key)
-
                 if not resultado_caixa:
-                    todos_resultados_saiu = False
-                    ainda_pendente += 1
-                    print(f"  Aposta {aposta['id'][:8]} ({modalidade}) - Aguardando resultado CAIXA/{caixa_loteria}")
-                    continue
+                    return {"status": "aguardando_caixa", "caixa_loteria": caixa_loteria}
 
                 # Pega o palpite (formato: "03-06-13-18-24-28-30-...")
                 palpite_str = palpites_lista[0] if palpites_lista else ""
 
-                # Separa as dezenas do palpite
-                dezenas_palpite = set()
-                for part in palpite_str.replace(" ", "").split("-"):
-                    part = part.strip()
-                    if part and part.isdigit():
-                        dezenas_palpite.add(part.zfill(2))
-
+                # Separa as dezenas do palpite (bitmask)
+                dezenas_palpite = dezenas_palpite_caixa(palpite_str)
                 if not dezenas_palpite:
-                    print(f"  Aposta {aposta['id'][:8]} ({modalidade}) - Palpite inválido: {palpite_str}")
-                    ids_perdeu_batch.append(aposta["id"])
-                    perdeu += 1
-                    continue
-
-                # Extrair dezenas do resultado Caixa (formato CSV em premio_1: "02,05,06,08,...")
-                dezenas_csv = str(resultado_caixa.get("premio_1", "") or "").strip()
-                dezenas_resultado = set()
-                for d in dezenas_csv.split(","):
-                    d = d.strip()
-                    if d and d.isdigit():
-                        dezenas_resultado.add(d.zfill(2))
+                    return {"status": "palpite_invalido", "palpite": palpite_str}
 
+                # Dezenas do resultado Caixa (CSV em premio_1: "02,05,06,08,..."): parse uma vez por dia
+                dezenas_resultado = dezenas_caixa.get(caixa_key)
+                if dezenas_resultado is None:
+                    dezenas_csv = str(resultado_caixa.get("premio_1", "") or "").strip()
+                    dezenas_resultado = dezenas_caixa[caixa_key] = dezenas_resultado_caixa(dezenas_csv)
                 if not dezenas_resultado:
-                    print(f"  Aposta {aposta['id'][:8]} ({modalidade}) - Resultado CAIXA/{caixa_loteria} sem dezenas válidas: {dezenas_csv}")
-                    ainda_pendente += 1
-                    continue
-
-                # Conta quantas dezenas do palpite aparecem no resultado
-                acertos = len(dezenas_palpite & dezenas_resultado)
-                print(f"  Aposta {aposta['id'][:8]} ({modalidade}) - CAIXA/{caixa_loteria}: Palpite {dezenas_palpite} vs Resultado {dezenas_resultado} = {acertos}/{acertos_necessarios} acertos")
+                    dezenas_csv = str(resultado_caixa.get("premio_1", "") or "").strip()
+                    return {"status": "caixa_sem_dezenas", "caixa_loteria": caixa_loteria, "dezenas_csv": dezenas_csv}
 
+                # Conta quantas dezenas do palpite aparecem no resultado (popcount de a & b)
+                acertos = dezenas_palpite.acertos(dezenas_resultado)
+                print(f"  Forma {plano.id[:8]} ({modalidade}) - CAIXA/{caixa_loteria}: Palpite {dezenas_palpite} vs Resultado {dezenas_resultado} = {acertos}/{acertos_necessarios} acertos")
                 if acertos >= acertos_necessarios:
-                    aposta_ganhou = True
-                    print(f"  Aposta {aposta['id'][:8]} ({modalidade}) - GANHOU! Acertos: {acertos}")
-                else:
-                    ids_perdeu_batch.append(aposta["id"])
-                    perdeu += 1
-                    print(f"  Aposta {aposta['id'][:8]} ({modalidade}) - Perdeu ({acertos} acertos, precisava {acertos_necessarios})")
-
-                # Continua para próxima aposta se não ganhou
-                if not aposta_ganhou:
-                    continue
+                    return {"status": "ganhou", "acerto": Acerto(faixa=f"{acertos} acertos", loteria=f"CAIXA/{caixa_loteria}")}
+                return AVALIACAO_PERDEU
 
             # =========================================================================
             # VERIFICAÇÃO PADRÃO (para jogos normais com loterias específicas)
             # =========================================================================
-            if not is_lotinha_quininha_seninha:
-                for loteria_id in loterias:
-                    mapping = LOTERIA_TO_BANCA.get(loteria_id)
-                    if not mapping:
-                        print(f"  Comparando Aposta {aposta['id'][:8]} - Loteria na aposta: {loteria_id} | Resultado no scraper: (nao mapeada)")
-                        continue
-                    banca, horario, loteria = mapping
-                    key = f"{horario}_{banca}_{loteria}"
-                    resultado = resultados_map.get(key)
-                    print(f"  Comparando Aposta {aposta['id'][:8]} - Loteria na aposta: {loteria_id} (banca={banca}, horario={horario}, loteria={loteria}) | Resultado no scraper: key={key!r} | Existe: {'sim' if resultado else 'nao'}")
-                    if horario_mais_tardio is None or horario > horario_mais_tardio:
-                        horario_mais_tardio = horario
-                    if not resultado:
-                        todos_resultados_saiu = False
-                        loterias_sem_resultado.append((loteria_id, banca, horario))
-                        continue
+            loterias_sem_resultado = []
+            for loteria_id, destino in plano.loterias:
+                if not destino:
+                    print(f"  Comparando Forma {plano.id[:8]} - Loteria na aposta: {loteria_id} | Resultado no scraper: (nao mapeada)")
+                    continue
+                banca, horario, loteria, key, variante, _ = destino
+                existe = bool(resultados_map.get(key))
+                print(f"  Comparando Forma {plano.id[:8]} - Loteria na aposta: {loteria_id} (banca={banca}, horario={horario}, loteria={loteria}) | Resultado no scraper: key={key!r} | Existe: {'sim' if existe else 'nao'}")
+                if not existe:
+                    loterias_sem_resultado.append((loteria_id, banca, horario))
+                    continue
 
-                    # MALUCA (não-BAHIA): inversão COMPLETA da milhar (4 dígitos revertidos)
-                    # Ex: resultado "1234" → maluca "4321" (str[::-1])
-                    # BAHIA MALUCA já tem resultados separados, não precisa inverter
-                    # Padrão A (RIO, NAC, LOOK, LOTEP, SP, RS, MG, BOASORTE): inversão milhar P1-P5, P6-P7 = None (derivam de P8-P9 que não temos no DB)
-                    # Padrão B (LOTECE): inversão milhar em TODOS os prêmios (P1-P7)
-                    is_maluca_nao_bahia = loteria_id.endswith("_maluca") and not loteria_id.startswith("ba_maluca")
-                    if is_maluca_nao_bahia and resultado:
-                        resultado_verificar = dict(resultado)
-                        is_lotece = loteria_id.startswith("ce_")
-
-                        if is_lotece:
-                            # Padrão B: TODOS os prêmios recebem inversão completa da milhar
-                            for pos in ["premio_1", "premio_2", "premio_3", "premio_4", "premio_5", "premio_6", "premio_7", "premio_8", "premio_9", "premio_10"]:
-                                val = str(resultado_verificar.get(pos, "") or "").strip()
-                                if val and len(val) >= 4:
-                                    resultado_verificar[pos] = val[::-1]
-                        else:
-                            # Padrão A: P1-P7 = inversão completa da milhar, P8-P10 = None (derivam de prêmios além do range)
-                            for pos in ["premio_1", "premio_2", "premio_3", "premio_4", "premio_5", "premio_6", "premio_7"]:
-                                val = str(resultado_verificar.get(pos, "") or "").strip()
-                                if val and len(val) >= 4:
-                                    resultado_verificar[pos] = val[::-1]
-                            # P8-P10 da MALUCA derivam de prêmios além do range normal, então anulamos
-                            resultado_verificar["premio_8"] = None
-                            resultado_verificar["premio_9"] = None
-                            resultado_verificar["premio_10"] = None
-
-                        print(f"  MALUCA: Invertendo milhar ({'LOTECE' if is_lotece else 'padrao'}) para {loteria_id}")
-                    else:
-                        resultado_verificar = resultado
-
-                    # Usa a função de verificação completa para todas as modalidades
-                    aposta_ganhou = verificar_modalidade(
-                        modalidade=modalidade,
-                        palpites=palpites_lista,
-                        resultado=resultado_verificar,
-                        posicoes_validas=posicoes_validas
-                    )
+                # Par já decidido no join por chave de resultado (Acerto ou None)
+                acerto = ganhos_pares[(indice_lote, loteria_id)]
+                if acerto:
+                    if modalidade == "milhar_ct" and acerto.faixa != "milhar":
+                        # Só centena aqui: milhar exata em outra loteria da aposta paga o rate alto
+                        for outra_id, outro_destino in plano.loterias:
+                            outro = ganhos_pares.get((indice_lote, outra_id)) if outro_destino else None
+                            if outro and outro.faixa == "milhar":
+                                acerto = outro
+                                break
+                    print(f"  Forma {plano.id[:8]} - Modalidade {modalidade} - GANHOU na loteria {acerto.loteria} ({acerto.descricao()})")
+                    return {"status": "ganhou", "acerto": acerto}
+
+            if not loterias_sem_resultado:
+                return AVALIACAO_PERDEU
+            todas_expiraram = all(expirou(prazos.get(horario), agora) for _, _, horario in loterias_sem_resultado)
+            return {"status": "sem_resultado", "loterias_sem_resultado": loterias_sem_resultado, "expiradas": todas_expiraram}
+
+        # Prazos de reembolso por horário do dia, contra um único "agora" da execução
+        agora = instante_epoch()
+        prazos = {
+            horario: prazo_expiracao(data_verificar, horario, HORAS_LIMITE_REEMBOLSO)
+            for _, horario, _ in LOTERIA_TO_BANCA.values()
+        }
 
-                    if aposta_ganhou:
-                        print(f"  Aposta {aposta['id'][:8]} - Modalidade {modalidade} - GANHOU na loteria {loteria_id}")
-                        break
+        print(f"  Buscando apostas pendentes para {data_verificar} (páginas de {TAMANHO_PAGINA_APOSTAS}, keyset em id)...")
+        for apostas_lote in _paginas_apostas_pendentes(supabase, data_verificar):
+            total_verificadas += len(apostas_lote)
+            print(f"  Página: {len(apostas_lote)} apostas (acumulado {total_verificadas})")
+            ids_perdeu_batch = []
+            pagamentos_lote = []
+            reembolsos_lote = []
 
-            if aposta_ganhou:
-                # FIX: Para milhar_ct, determinar se acertou milhar (rate alto) ou só centena (consolação)
-                if modalidade == "milhar_ct" and not is_lotinha_quininha_seninha:
-                    is_milhar_match = False
-                    for palpite in palpites_lista:
-                        palpite_4 = palpite.zfill(4)
-                        for loteria_id_chk in loterias:
-                            mapping_chk = LOTERIA_TO_BANCA.get(loteria_id_chk)
-                            if not mapping_chk:
-                                continue
-                            banca_chk, horario_chk, loteria_chk = mapping_chk
-                            key_chk = f"{horario_chk}_{banca_chk}_{loteria_chk}"
-                            res_chk = resultados_map.get(key_chk)
-                            if not res_chk:
-                                continue
-                            for pos_chk in posicoes_validas:
-                                premio_chk = str(res_chk.get(pos_chk, "") or "").strip()
-                                if premio_chk and palpite_4 == premio_chk.zfill(4):
-                                    is_milhar_match = True
-                                    break
-                            if is_milhar_match:
-                                break
-                        if is_milhar_match:
-                            break
-                    if is_milhar_match:
+            novas_plataformas = {a.get("platform_id") for a in apostas_lote if a.get("platform_id")} - plataformas_carregadas
+            if novas_plataformas:
+                try:
+                    odds_plataforma.update(_carregar_odds_plataformas(supabase, novas_plataformas))
+                    plataformas_carregadas.update(novas_plataformas)
+                except Exception as e:
+                    print(f"  [AVISO] Falha ao pré-carregar platform_modalidades: {e}")
+
+            # Cada aposta é compilada uma vez; o loop trabalha só com os planos
+            planos = [BetPlan(aposta) for aposta in apostas_lote]
+            del apostas_lote
+
+            if len(avaliacoes_forma) > LIMITE_FORMAS_MEMORIZADAS:
+                print(f"  {len(avaliacoes_forma)} formas memorizadas: limpando o cache de desfechos")
+                avaliacoes_forma.clear()
+
+            # Formas ainda não avaliadas nesta execução (um representante por forma)
+            novos = {}
+            for plano in planos:
+                if plano.forma not in avaliacoes_forma:
+                    novos.setdefault(plano.forma, plano)
+            novos = list(novos.values())
+            if len(novos) < len(planos):
+                print(f"  {len(planos)} apostas, {len(novos)} formas novas a avaliar")
+
+            ganhos_pares = avaliar_pares_por_resultado(novos)
+            for indice_lote, plano in enumerate(novos):
+                avaliacoes_forma[plano.forma] = avaliar_forma(plano, indice_lote, ganhos_pares)
+
+            for plano in planos:
+                modalidade = plano.modalidade
+                valor_aposta = plano.valor_unitario
+                user_id = plano.user_id
+                platform_id = plano.platform_id
+                avaliacao = avaliacoes_forma[plano.forma]
+                status = avaliacao["status"]
+
+                if status == "aguardando_caixa":
+                    ainda_pendente += 1
+                    print(f"  Aposta {plano.id[:8]} ({modalidade}) - Aguardando resultado CAIXA/{avaliacao['caixa_loteria']}")
+                elif status == "palpite_invalido":
+                    print(f"  Aposta {plano.id[:8]} ({modalidade}) - Palpite inválido: {avaliacao['palpite']}")
+                    ids_perdeu_batch.append(plano.id)
+                    perdeu += 1
+                elif status == "caixa_sem_dezenas":
+                    print(f"  Aposta {plano.id[:8]} ({modalidade}) - Resultado CAIXA/{avaliacao['caixa_loteria']} sem dezenas válidas: {avaliacao['dezenas_csv']}")
+                    ainda_pendente += 1
+
+                elif status == "ganhou":
+                    acerto = avaliacao["acerto"]
+                    # FIX: Para milhar_ct, a faixa do acerto diz se foi milhar (rate alto) ou só centena (consolação)
+                    if modalidade == "milhar_ct" and acerto.faixa == "milhar":
                         # Milhar exata: usar multiplicador de milhar_ct
                         multiplicador = get_multiplicador_platform(
                             platform_id, "milhar_ct",
-                            float(aposta.get("multiplicador", 0) or 0),
+                            plano.multiplicador,
                             dynamic_odds
                         )
-                    else:
+                    elif modalidade == "milhar_ct":
                         # Só centena (consolação): usar multiplicador de centena, ignorar o da aposta
                         multiplicador = get_multiplicador_platform(
                             platform_id, "centena", 0, dynamic_odds
                         )
-                else:
-                    multiplicador = get_multiplicador_platform(
-                        platform_id, modalidade,
-                        float(aposta.get("multiplicador", 0) or 0),
-                        dynamic_odds
-                    )
-                valor_premio = valor_aposta * multiplicador
-                ganhou += 1
-                print(f"  Aposta {aposta['id'][:8]} GANHOU! Premio: R${valor_premio:.2f} (mult={multiplicador}, valor={valor_aposta})")
-                if user_id and valor_premio > 0:
-                    try:
-                        premio_arredondado = round(float(valor_premio), 2)
-                        # 1. Creditar saldo via RPC atômico (FOR UPDATE + ledger)
-                        rpc_result = supabase.rpc("fn_change_balance", {
-                            "p_user_id": user_id,
-                            "p_amount": premio_arredondado,
-                            "p_type": "premio",
-                            "p_wallet": "saldo",
-                            "p_reference_id": aposta["id"],
-                            "p_description": f"Premio {modalidade} aposta {aposta['id'][:8]}",
-                        }).execute()
-                        rpc_data = getattr(rpc_result, "data", None)
-                        if isinstance(rpc_data, dict) and rpc_data.get("error"):
-                            raise Exception(f"fn_change_balance error: {rpc_data['error']}")
-                        novo_saldo = rpc_data.get("balance_after", 0) if isinstance(rpc_data, dict) else 0
-                        print(f"  Saldo creditado via RPC para {aposta['id'][:8]}, novo saldo: R${novo_saldo:.2f}")
-                        # 2. SÓ DEPOIS do crédito: marcar aposta como premiada
-                        supabase.table("apostas").update({
-                            "status": "premiada",
-                            "premio_valor": premio_arredondado
-                        }).eq("id", aposta["id"]).execute()
-                        # 3. Registrar transação
-                        supabase.table("transactions").insert({
+                    else:
+                        multiplicador = get_multiplicador_platform(
+                            platform_id, modalidade,
+                            plano.multiplicador,
+                            dynamic_odds
+                        )
+                    valor_premio = valor_aposta * multiplicador
+                    ganhou += 1
+                    print(f"  Aposta {plano.id[:8]} GANHOU na {acerto.loteria} ({acerto.descricao()})! Premio: R${valor_premio:.2f} (mult={multiplicador}, valor={valor_aposta})")
+                    if user_id and valor_premio > 0:
+                        # Pagamento em lote no fim da página (fn_process_payouts_batch)
+                        pagamentos_lote.append({
+                            "bet_id": plano.id,
+                            "amount": round(float(valor_premio), 2),
+                            "modalidade": modalidade,
                             "user_id": user_id,
                             "platform_id": platform_id,
-                            "tipo": "prize",
-                            "amount": premio_arredondado,
-                            "status": "completed",
-                            "external_id": f"payout_{aposta['id']}",
-                            "metadata": {"modalidade": modalidade, "description": f"Premio de aposta: {aposta['id']}"},
-                        }).execute()
-                        print(f"  Aposta {aposta['id'][:8]} PAGA! Novo saldo: R${novo_saldo:.2f}")
-                        # 4. Notificar premio (sem dados pessoais nos logs)
-                        try:
-                            app_url = os.environ.get("APP_URL", "https://ultrabanca.app")
-                            internal_secret = os.environ.get("INTERNAL_API_SECRET", "")
-                            if internal_secret:
-                                import requests
-                                profile_resp = supabase.table("profiles").select("nome, telefone").eq("id", user_id).single().execute()
-                                requests.post(
-                                    f"{app_url}/api/internal/triggers",
-                                    json={
-                                        "triggerType": "premio",
-                                        "userData": {
-                                            "nome": (profile_resp.data or {}).get("nome", "Cliente"),
-                                            "telefone": (profile_resp.data or {}).get("telefone"),
-                                            "premio": valor_premio,
-                                            "modalidade": modalidade,
-                                            "saldo": novo_saldo
-                                        }
-                                    },
-                                    headers={"x-internal-secret": internal_secret},
-                                    timeout=5
-                                )
-                        except Exception as trigger_err:
-                            print(f"  [Erro Gatilho] {trigger_err}")
-                    except Exception as e:
-                        print(f"  ERRO payout {aposta['id'][:8]}: {type(e).__name__}: {e}")
-                        import traceback
-                        traceback.print_exc()
-
-            elif todos_resultados_saiu:
-                ids_perdeu_batch.append(aposta["id"])
-                perdeu += 1
-                print(f"  Aposta {aposta['id'][:8]} perdeu")
-            else:
-                todas_expiraram = True
-                for lot_id, banca, horario in loterias_sem_resultado:
-                    if not horario_expirou(data_verificar, horario, horas_limite=12):
-                        todas_expiraram = False
-                        break
-                if todas_expiraram and loterias_sem_resultado:
-                    # Reembolso atômico via RPC
-                    try:
-                        loterias_str = ", ".join([f"{lid} ({banca} {h})" for lid, banca, h in loterias_sem_resultado])
-                        valor_reembolso = float(aposta.get("valor_total", 0) or 0)
-                        if not user_id:
-                            print(f"  ERRO reembolso {aposta['id'][:8]}: user_id ausente, pulando")
-                            ainda_pendente += 1
-                            continue
-                        if valor_reembolso > 0:
-                            # 1. Creditar saldo via RPC atômico
-                            rpc_result = supabase.rpc("fn_change_balance", {
-                                "p_user_id": user_id,
-                                "p_amount": valor_reembolso,
-                                "p_type": "reembolso",
-                                "p_wallet": "saldo",
-                                "p_reference_id": aposta["id"],
-                                "p_description": f"Reembolso: resultado indisponivel apos 12h",
-                            }).execute()
-                            rpc_data = getattr(rpc_result, "data", None)
-                            if isinstance(rpc_data, dict) and rpc_data.get("error"):
-                                raise Exception(f"fn_change_balance error: {rpc_data['error']}")
-                            # 2. Registrar transação
-                            supabase.table("transactions").insert({
-                                "user_id": user_id,
-                                "platform_id": platform_id,
-                                "tipo": "refund",
-                                "amount": valor_reembolso,
-                                "status": "completed",
-                                "external_id": f"refund_{aposta['id']}",
-                                "metadata": {"reason": f"Resultado indisponivel apos 12h: {loterias_str}", "bet_id": aposta["id"]},
-                            }).execute()
-                            # 3. SÓ DEPOIS do crédito: marcar aposta como reembolsada
-                            supabase.table("apostas").update({
-                                "status": "reembolsado"
-                            }).eq("id", aposta["id"]).execute()
-                            reembolsado += 1
-                            print(f"  Aposta {aposta['id'][:8]} REEMBOLSADA (R${valor_reembolso:.2f})")
-                        else:
-                            # valor_reembolso == 0, marcar como reembolsado sem crédito
-                            supabase.table("apostas").update({
-                                "status": "reembolsado"
-                            }).eq("id", aposta["id"]).execute()
-                            reembolsado += 1
-                            print(f"  Aposta {aposta['id'][:8]} REEMBOLSADA (valor=R$0, sem crédito)")
-                    except Exception as e:
-                        print(f"  Erro ao reembolsar {aposta['id'][:8]}: {e}")
+                            "valor_premio": valor_premio,
+                            "acerto": acerto.como_dict(),
+                        })
+
+                elif status == "perdeu":
+                    ids_perdeu_batch.append(plano.id)
+                    perdeu += 1
+                    print(f"  Aposta {plano.id[:8]} perdeu")
+                elif avaliacao["expiradas"]:
+                    if not user_id:
+                        print(f"  ERRO reembolso {plano.id[:8]}: user_id ausente, pulando")
                         ainda_pendente += 1
+                        continue
+                    # Reembolso em lote no fim da página (fn_process_refunds_batch)
+                    loterias_str = ", ".join([f"{lid} ({banca} {h})" for lid, banca, h in avaliacao["loterias_sem_resultado"]])
+                    reembolsos_lote.append({
+                        "bet_id": plano.id,
+                        "reason": f"Resultado indisponivel apos {HORAS_LIMITE_REEMBOLSO}h: {loterias_str}",
+                        "user_id": user_id,
+                        "platform_id": platform_id,
+                        "valor": plano.valor_total,
+                    })
                 else:
                     ainda_pendente += 1
-                    print(f"  Aposta {aposta['id'][:8]} ainda pendente (aguardando resultado)")
+                    print(f"  Aposta {plano.id[:8]} ainda pendente (aguardando resultado)")
+
+            # Reembolsos da página em lote
+            for status in _reembolsar_apostas_lote(supabase, reembolsos_lote):
+                if status.get("status") == "refunded":
+                    reembolsado += 1
+                elif status.get("status") == "error":
+                    ainda_pendente += 1
+                else:
+                    # skipped/not_found: outra execução já resolveu a aposta (ou ela sumiu)
+                    reembolso_ignorado += 1
+
+            # Pagar prêmios da página em lote; notificações dos pagos vão para o outbox
+            notificacoes = []
+            for item, status in zip(pagamentos_lote, _pagar_premios_lote(supabase, pagamentos_lote)):
+                if status.get("status") == "paid":
+                    notificacoes.append(_notificacao_premio(item, status.get("balance_after") or 0))
+            notificacoes_enfileiradas += _enfileirar_notificacoes(supabase, notificacoes)
+
+            # Marcar como perdeu em lote (evita N updates) - por página, memória constante
+            _marcar_apostas_perdeu(supabase, ids_perdeu_batch)
 
-        # Marcar como perdeu em lote (evita N updates)
-        if ids_perdeu_batch:
+        print(f"  Total pendentes no dia: {total_verificadas}")
+
+        # Entrega das notificações fica com o worker do outbox (não bloqueia a verificação)
+        if notificacoes_enfileiradas:
             try:
-                rpc = supabase.rpc("fn_mark_bets_lost", {"p_bet_ids": ids_perdeu_batch}).execute()
-                raw = getattr(rpc, "data", None)
-                res = (raw[0] if isinstance(raw, list) and raw else raw) or {}
-                n = res.get("updated", 0) if isinstance(res, dict) else 0
-                print(f"  Batch perdeu: {len(ids_perdeu_batch)} IDs enviados, {n} atualizados")
+                drenar_notificacoes.spawn()
             except Exception as e:
-                print(f"  [AVISO] Batch perdeu falhou: {e}; marcando uma a uma")
-                for bid in ids_perdeu_batch:
-                    try:
-                        supabase.table("apostas").update({"status": "perdeu"}).eq("id", bid).execute()
-                    except Exception:
-                        pass
+                print(f"  [AVISO] Não foi possível disparar o dreno do outbox agora (cron cobre): {e}")
 
         resultado_final = {
             "data": data_verificar,
@@ -2781,9 +3822,11 @@ def verificar_premios_v2(data: Optional[str] = None) -> dict:
             "ganhou": ganhou,
             "perdeu": perdeu,
             "reembolsado": reembolsado,
+            "reembolso_ignorado": reembolso_ignorado,
             "pendente": ainda_pendente,
         }
         print(f"=== Verificacao concluida: {resultado_final} ===")
+        print(f"  Formas distintas: {len(avaliacoes_forma)} | Pico de RSS: {pico_rss_mb():.1f} MB")
         return resultado_final
     except Exception as e:
         _enviar_alerta_scraper("Erro na verificacao de premios", f"data={data_verificar}. Processo interrompido.", e)
@@ -2793,95 +3836,349 @@ def verificar_premios_v2(data: Optional[str] = None) -> dict:
             "ganhou": ganhou,
             "perdeu": perdeu,
             "reembolsado": reembolsado,
+            "reembolso_ignorado": reembolso_ignorado,
             "pendente": ainda_pendente,
             "error": str(e),
         }
 
 
 # =============================================================================
-# CLI
+# OUTBOX DE NOTIFICACOES (gatilhos do app fora do caminho da verificação)
 # =============================================================================
 
-@app.function(image=image, secrets=[supabase_secret], timeout=1800)
-def scrape_ultimos_dias(dias: int = 7) -> dict:
+# Notificações reivindicadas por rodada do dreno e envios simultâneos
+LOTE_DRENO_NOTIFICACOES = 100
+CONCORRENCIA_NOTIFICACOES = 8
+# Reivindicação expira e a notificação volta para a fila se o worker morrer
+LEASE_NOTIFICACAO_S = 120
+# Backoff entre tentativas de envio (s); o último valor é o teto
+BACKOFF_NOTIFICACAO_S = (30, 60, 120, 300, 900, 1800)
+MAX_TENTATIVAS_NOTIFICACAO = 8
+
+
+def _notificacao_premio(item: dict, novo_saldo: float) -> dict:
+    """Linha do outbox para um prêmio pago (nome/telefone são resolvidos no envio)"""
+    return {
+        "trigger_type": "premio",
+        "user_id": item["user_id"],
+        "reference_id": item["bet_id"],
+        "payload": {"premio": item["valor_premio"], "modalidade": item["modalidade"], "saldo": novo_saldo},
+    }
+
+
+def _enfileirar_notificacoes(supabase, notificacoes: list) -> int:
+    """Um insert por página; sem INTERNAL_API_SECRET não há gatilho (mesmo comportamento de antes)"""
+    if not notificacoes or not os.environ.get("INTERNAL_API_SECRET", ""):
+        return 0
+    try:
+        supabase.table("notification_outbox").insert(notificacoes).execute()
+        return len(notificacoes)
+    except Exception as e:
+        print(f"  [Erro Gatilho] Falha ao enfileirar {len(notificacoes)} notificações: {e}")
+        return 0
+
+
+def _enviar_notificacao(notificacao: dict, perfil: dict, app_url: str, internal_secret: str) -> Optional[str]:
+    """POST em /api/internal/triggers; retorna None em sucesso ou a mensagem de erro"""
+    try:
+        resp = sessao_http().post(
+            f"{app_url}/api/internal/triggers",
+            json={
+                "triggerType": notificacao["trigger_type"],
+                "userData": {
+                    "nome": perfil.get("nome") or "Cliente",
+                    "telefone": perfil.get("telefone"),
+                    **(notificacao.get("payload") or {}),
+                },
+            },
+            headers={"x-internal-secret": internal_secret},
+            timeout=5,
+        )
+        if resp.status_code >= 400:
+            return f"HTTP {resp.status_code}"
+        return None
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def drenar_outbox_notificacoes(supabase, max_rodadas: int = 20) -> dict:
     """
-    Scrape dos últimos N dias para todos os estados (v4 - requests primeiro)
+    Entrega notificações do outbox: reivindica lotes via fn_claim_notifications
+    (FOR UPDATE SKIP LOCKED), busca os perfis do lote numa query só e envia em paralelo.
+    Falhas voltam para a fila com backoff; após MAX_TENTATIVAS_NOTIFICACAO ficam 'falhou'.
     """
-    from supabase import create_client
-    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    app_url = os.environ.get("APP_URL", "https://ultrabanca.app")
+    internal_secret = os.environ.get("INTERNAL_API_SECRET", "")
+    resumo = {"enviadas": 0, "reagendadas": 0, "falhou": 0}
+    if not internal_secret:
+        print("  [Outbox] INTERNAL_API_SECRET ausente - nada a enviar")
+        return resumo
+
+    for _ in range(max_rodadas):
+        rpc = supabase.rpc("fn_claim_notifications", {
+            "p_limit": LOTE_DRENO_NOTIFICACOES,
+            "p_lease_seconds": LEASE_NOTIFICACAO_S,
+        }).execute()
+        lote = getattr(rpc, "data", None) or []
+        if not lote:
+            break
+
+        user_ids = list({n["user_id"] for n in lote if n.get("user_id")})
+        perfis = {}
+        try:
+            resp = supabase.table("profiles").select("id, nome, telefone").in_("id", user_ids).execute()
+            perfis = {p["id"]: p for p in resp.data or []}
+        except Exception as e:
+            print(f"  [Outbox] Falha ao buscar perfis ({e}); enviando com nome padrão")
+
+        with ThreadPoolExecutor(max_workers=CONCORRENCIA_NOTIFICACOES) as pool:
+            erros = list(pool.map(
+                lambda n: _enviar_notificacao(n, perfis.get(n.get("user_id"), {}), app_url, internal_secret),
+                lote,
+            ))
+
+        agora = datetime.now(timezone.utc)
+        enviadas = [n["id"] for n, erro in zip(lote, erros) if erro is None]
+        if enviadas:
+            supabase.table("notification_outbox").update({
+                "status": "enviado",
+                "sent_at": agora.isoformat(),
+                "updated_at": agora.isoformat(),
+                "ultimo_erro": None,
+            }).in_("id", enviadas).execute()
+            resumo["enviadas"] += len(enviadas)
+
+        # Falhas agrupadas por nº de tentativas: mesmo backoff = um update
+        falhas = {}
+        for n, erro in zip(lote, erros):
+            if erro is not None:
+                falhas.setdefault(n.get("tentativas", 1), []).append((n["id"], erro))
+        for tentativas, itens in falhas.items():
+            ids = [i for i, _ in itens]
+            if tentativas >= MAX_TENTATIVAS_NOTIFICACAO:
+                atualizacao = {"status": "falhou"}
+                resumo["falhou"] += len(ids)
+            else:
+                espera = BACKOFF_NOTIFICACAO_S[min(tentativas, len(BACKOFF_NOTIFICACAO_S)) - 1]
+                atualizacao = {"status": "pendente", "proxima_tentativa": (agora + timedelta(seconds=espera)).isoformat()}
+                resumo["reagendadas"] += len(ids)
+            atualizacao.update({"ultimo_erro": itens[0][1][:500], "updated_at": agora.isoformat()})
+            supabase.table("notification_outbox").update(atualizacao).in_("id", ids).execute()
+            print(f"  [Outbox] {len(ids)} notificações falharam (tentativa {tentativas}): {itens[0][1]}")
+
+        if len(lote) < LOTE_DRENO_NOTIFICACOES:
+            break
 
-    supabase_url = os.environ["SUPABASE_URL"]
-    supabase_key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-    supabase = create_client(supabase_url, supabase_key)
+    print(f"  [Outbox] {resumo}")
+    return resumo
 
-    hoje = agora_brasilia()
-    resultados_total = []
-    resumo_por_dia = {}
 
-    print(f"\n{'='*70}")
-    print(f"SCRAPE V4 DOS ÚLTIMOS {dias} DIAS")
-    print(f"{'='*70}\n")
+@app.function(
+    image=image,
+    secrets=[supabase_secret],
+    timeout=300,
+    schedule=modal.Cron("*/5 * * * *"),  # Retentativas; a verificação dispara o dreno na hora via spawn
+)
+def drenar_notificacoes() -> dict:
+    """Worker do outbox de notificações (gatilhos de prêmio para o app)"""
+    return drenar_outbox_notificacoes(cliente_supabase())
 
-    total_creditos = 0
 
-    for i in range(dias):
-        data_scrape = (hoje - timedelta(days=i)).strftime("%Y-%m-%d")
-        print(f"\n{'='*70}")
-        print(f"DIA {i+1}/{dias}: {data_scrape}")
-        print(f"{'='*70}")
+# =============================================================================
+# WORKER DE VIDA LONGA (modal.Cls)
+# =============================================================================
 
-        todos_resultados = []
-        erros = []
-        dia_creditos = 0
+# scaledown_window curto: o cron chama o worker sempre que há sorteio devido, então com
+# uma janela longa o container nunca desce e fica cobrado o dia inteiro
+@app.cls(image=image, secrets=[supabase_secret, firecrawl_secret], timeout=600, scaledown_window=60, cpu=CPU_WORKER)
+class ScraperWorker:
+    """
+    Worker com setup por container (@enter): imports pesados, sessão HTTP com pool,
+    cliente Supabase e parser HTML ficam quentes entre invocações.
+    As funções de scrape/verificação rodam como métodos finos sobre ele.
+    rodada: só muda para isolar containers (benchmark); o padrão é o pool normal.
+    """
 
-        for estado in list(ESTADOS_CONFIG.keys()):
-            try:
-                resultado = scrape_estado.remote(estado, data_scrape)
+    rodada: str = modal.parameter(default="")
 
-                if resultado.get("error"):
-                    erros.append(f"{estado}: {resultado['error']}")
-                else:
-                    todos_resultados.extend(resultado.get("resultados", []))
-                    dia_creditos += resultado.get("creditos_firecrawl", 0)
-                    print(f"[{estado}] OK: {len(resultado.get('resultados', []))} resultados via {resultado.get('fonte_utilizada', 'N/A')}")
+    @modal.enter()
+    def setup(self):
+        import time
 
-                # Delay entre estados
-                time.sleep(2)
+        inicio = time.perf_counter()
+        import requests  # noqa: F401
+        import supabase  # noqa: F401
+        from bs4 import BeautifulSoup
 
-            except Exception as e:
-                erros.append(f"{estado}: {str(e)}")
-                print(f"[{estado}] Exceção: {e}")
+        # Aquece o html.parser (primeira chamada carrega tabelas internas do bs4)
+        BeautifulSoup("<table><tr><td>0000</td><td>Vaca</td></tr></table>", "html.parser").find_all("td")
+        self.sessao = sessao_http()
+        self.supabase = cliente_supabase()
+        self.setup_ms = (time.perf_counter() - inicio) * 1000
+        self.chamadas = 0
+        print(f"[worker] setup do container em {self.setup_ms:.0f}ms")
+
+    @modal.method()
+    def scrape_estado(self, estado: str, data: Optional[str] = None, usar_firecrawl: bool = True) -> dict:
+        self.chamadas += 1
+        return scrape_estado(estado, data, usar_firecrawl)
+
+    @modal.method()
+    def scrape_estado_batch(self, estados: list, data: Optional[str] = None) -> list:
+        self.chamadas += 1
+        return scrape_estado_batch(estados, data)
+
+    @modal.method()
+    def verificar_premios_v2(self, data: Optional[str] = None) -> dict:
+        self.chamadas += 1
+        return verificar_premios_v2(data)
 
-        # Salvar no Supabase
-        upserted = _upsert_resultados(supabase, todos_resultados)
+    @modal.method()
+    def medir_chamada(self) -> dict:
+        """Tempo de setup do container e nº de chamadas já atendidas por ele (cold vs warm)"""
+        self.chamadas += 1
+        return {"setup_ms": round(self.setup_ms, 1), "chamadas": self.chamadas}
 
-        resumo_por_dia[data_scrape] = {
-            "scraped": len(todos_resultados),
-            "upserted": upserted,
-            "erros": len(erros),
-            "creditos_firecrawl": dia_creditos,
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+# Checkpoint do backfill: pares (data, estado) já concluídos - permite retomar após timeout
+backfill_state = modal.Dict.from_name("ultra-banca-backfill", create_if_missing=True)
+
+# Pares (data, estado) consultados em paralelo no backfill
+CONCORRENCIA_BACKFILL = 6
+
+
+def _pares_backfill(datas: list, horarios_db: dict, concluidos: set) -> tuple:
+    """
+    Pares (data, estado) que ainda precisam de scrape no backfill.
+
+    Args:
+        datas: dias do backfill (YYYY-MM-DD)
+        horarios_db: {data: {banca: [horarios]}} já salvos em resultados
+        concluidos: chaves "data|estado" do checkpoint
+
+    Returns:
+        (pendentes [(data, estado)], pulados ["estado@data"])
+    """
+    pendentes = []
+    pulados = []
+    for data_scrape in datas:
+        for estado in calendario_do_dia(data_scrape):
+            banca = ESTADOS_CONFIG[estado]["banca"]
+            esperados = HORARIOS_ESPERADOS.get(estado, 0)
+            existentes = len(horarios_db.get(data_scrape, {}).get(banca, []))
+            if f"{data_scrape}|{estado}" in concluidos or (esperados > 0 and existentes >= esperados):
+                pulados.append(f"{estado}@{data_scrape}")
+            else:
+                pendentes.append((data_scrape, estado))
+    return pendentes, pulados
+
+
+@app.function(image=image, secrets=[supabase_secret], timeout=1800)
+def scrape_ultimos_dias(dias: int = 7, concorrencia: int = CONCORRENCIA_BACKFILL, refazer: bool = False) -> dict:
+    """
+    Backfill dos últimos N dias para todos os estados (v4 - requests primeiro)
+    - Fan-out por par (data, estado) com no máximo `concorrencia` chamadas ao ScraperWorker
+    - Cada par salvo entra no checkpoint (backfill_state): uma nova execução retoma de onde parou
+    - Pula pares que já têm todos os resultados esperados em resultados
+    - Verificação de prêmios uma vez no final, só para as datas tocadas
+    refazer=True ignora o checkpoint (o skip por resultados completos continua valendo).
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    supabase = cliente_supabase()
+
+    hoje = agora_brasilia()
+    datas = [(hoje - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(dias)]
+
+    print(f"\n{'='*70}")
+    print(f"BACKFILL V4 DOS ÚLTIMOS {dias} DIAS (concorrência {concorrencia})")
+    print(f"{'='*70}\n")
+
+    horarios_db = {}
+    try:
+        resp = supabase.table("resultados").select("data, banca, horario").in_("data", datas).execute()
+        for row in resp.data or []:
+            por_banca = horarios_db.setdefault(row.get("data"), {})
+            por_banca.setdefault(row.get("banca", ""), []).append(row.get("horario") or "00:00")
+    except Exception as e:
+        print(f"Erro ao consultar resultados existentes (seguindo sem skip por DB): {e}")
+
+    concluidos = set() if refazer else {f"{d}|{e}" for d in datas for e in ESTADOS_CONFIG if f"{d}|{e}" in backfill_state}
+    pares, pulados = _pares_backfill(datas, horarios_db, concluidos)
+    print(f"Pares a processar: {len(pares)} | pulados (checkpoint/DB completo): {len(pulados)}")
+
+    resumo_por_dia = {d: {"scraped": 0, "upserted": 0, "erros": 0, "creditos_firecrawl": 0} for d in datas}
+    datas_tocadas = set()
+
+    def processar_par(data_scrape: str, estado: str) -> dict:
+        resultado = ScraperWorker().scrape_estado.remote(estado, data_scrape)
+        if resultado.get("error"):
+            return resultado
+        resultados = resultado.get("resultados", [])
+        resultado["upserted"] = _upsert_resultados(supabase, resultados)
+        # Checkpoint só depois de salvar: par com erro é refeito na próxima execução
+        backfill_state[f"{data_scrape}|{estado}"] = {
+            "upserted": resultado["upserted"],
+            "fonte": resultado.get("fonte_utilizada"),
+            "em": agora_brasilia().isoformat(),
         }
-        resultados_total.extend(todos_resultados)
-        total_creditos += dia_creditos
+        return resultado
 
-        print(f"\n📊 Resumo {data_scrape}: {len(todos_resultados)} scraped, {upserted} upserted, 💰 {dia_creditos} créditos Firecrawl")
+    with ThreadPoolExecutor(max_workers=max(1, concorrencia)) as pool:
+        futures = {pool.submit(processar_par, data_scrape, estado): (data_scrape, estado) for data_scrape, estado in pares}
+        for future in as_completed(futures):
+            data_scrape, estado = futures[future]
+            stats = resumo_por_dia[data_scrape]
+            try:
+                resultado = future.result()
+            except Exception as e:
+                stats["erros"] += 1
+                print(f"[{estado}] {data_scrape} Exceção: {e}")
+                continue
+            if resultado.get("error"):
+                stats["erros"] += 1
+                print(f"[{estado}] {data_scrape} Erro: {resultado['error']}")
+                continue
+            stats["scraped"] += len(resultado.get("resultados", []))
+            stats["upserted"] += resultado.get("upserted", 0)
+            stats["creditos_firecrawl"] += resultado.get("creditos_firecrawl", 0)
+            if resultado.get("upserted"):
+                datas_tocadas.add(data_scrape)
+            print(f"[{estado}] {data_scrape} OK: {len(resultado.get('resultados', []))} resultados via {resultado.get('fonte_utilizada', 'N/A')}")
+
+    # Verificar apostas uma vez por data que recebeu resultado novo
+    for data_scrape in sorted(datas_tocadas):
+        try:
+            ScraperWorker().verificar_premios_v2.remote(data_scrape)
+        except Exception as e:
+            print(f"Erro na verificação de {data_scrape}: {e}")
 
-        # Verificar apostas do dia
-        verificar_premios_v2.remote(data_scrape)
+    total_resultados = sum(stats["scraped"] for stats in resumo_por_dia.values())
+    total_creditos = sum(stats["creditos_firecrawl"] for stats in resumo_por_dia.values())
 
     print(f"\n{'='*70}")
     print(f"RESUMO FINAL V4 - {dias} DIAS")
     print(f"{'='*70}")
     for data_str, stats in resumo_por_dia.items():
         print(f"  {data_str}: {stats['scraped']} scraped, {stats['upserted']} upserted, {stats['erros']} erros, {stats['creditos_firecrawl']} créditos")
-    print(f"\nTOTAL: {len(resultados_total)} resultados, 💰 {total_creditos} créditos Firecrawl gastos")
+    print(f"\nTOTAL: {total_resultados} resultados, 💰 {total_creditos} créditos Firecrawl gastos")
+    print(f"Verificação executada para: {', '.join(sorted(datas_tocadas)) or 'nenhuma data'}")
 
     return {
         "success": True,
         "dias": dias,
-        "total_resultados": len(resultados_total),
+        "total_resultados": total_resultados,
         "creditos_firecrawl": total_creditos,
         "resumo_por_dia": resumo_por_dia,
+        "pares_processados": len(pares),
+        "pares_pulados": len(pulados),
+        "datas_verificadas": sorted(datas_tocadas),
     }
 
 
@@ -2891,26 +4188,32 @@ def main(
     estado: str = "RJ",
     data: Optional[str] = None,
     dias: int = 7,
+    modo: str = "fanout",
 ):
     """
     Comandos v4 (requests-first, Firecrawl como fallback):
         scrape   - Scrape otimizado de um estado (requests primeiro)
-        todos    - Scrape de todos os estados para uma data
-        historico - Scrape dos últimos N dias (padrão: 7)
+        todos    - Scrape de todos os estados para uma data (--modo fanout|batch)
+        historico - Backfill dos últimos N dias (padrão: 7), retomável via checkpoint
         verificar - Verificar prêmios de apostas pendentes
+        benchmark_worker - Mede cold start vs chamadas quentes do ScraperWorker
+        benchmark_modos  - Compara wall time e custo de fan-out vs batch
 
     Exemplos:
         modal run modal_scraper_v4.py --comando scrape --estado MG --data 2026-01-30
         modal run modal_scraper_v4.py --comando todos --data 2026-01-29
+        modal run modal_scraper_v4.py --comando todos --modo batch
         modal run modal_scraper_v4.py --comando historico --dias 7
         modal run modal_scraper_v4.py --comando verificar --data 2026-01-29
+        modal run modal_scraper_v4.py --comando benchmark_worker --estado MG
+        modal run modal_scraper_v4.py --comando benchmark_modos --data 2026-01-29
     """
     if comando == "scrape":
         print(f"\n{'#'*70}")
         print(f"# SCRAPE V4 (requests-first): {estado} - {data or 'hoje'}")
         print(f"{'#'*70}\n")
 
-        resultado = scrape_estado.remote(estado, data)
+        resultado = ScraperWorker().scrape_estado.remote(estado, data)
 
         print(f"\n{'#'*70}")
         print(f"# RESULTADO FINAL")
@@ -2938,8 +4241,8 @@ def main(
             print(f"\n❌ ERRO: {resultado.get('error')}")
 
     elif comando == "todos":
-        print(f"Scraping V4 todos os estados para {data or 'hoje'}...")
-        resultado = scrape_todos_v4.remote(data)
+        print(f"Scraping V4 todos os estados para {data or 'hoje'} (modo={modo})...")
+        resultado = scrape_todos_v4.remote(data, None, modo)
         print(f"\nResultado: {resultado}")
 
     elif comando == "historico":
@@ -2954,9 +4257,30 @@ def main(
         print(f"\n{'#'*70}")
         print(f"# VERIFICAR PRÊMIOS: {data_verificar}")
         print(f"{'#'*70}\n")
-        resultado = verificar_premios_v2.remote(data_verificar)
+        resultado = ScraperWorker().verificar_premios_v2.remote(data_verificar)
+        print(f"\nResultado: {resultado}")
+
+    elif comando == "benchmark_worker":
+        import time
+
+        print(f"\n{'#'*70}")
+        print(f"# BENCHMARK WORKER: cold start vs warm ({estado})")
+        print(f"{'#'*70}\n")
+        worker = ScraperWorker()
+        for i in range(3):
+            inicio = time.perf_counter()
+            info = worker.medir_chamada.remote()
+            ida_volta_ms = (time.perf_counter() - inicio) * 1000
+            print(f"  ping {i+1}: {ida_volta_ms:.0f}ms (setup do container={info['setup_ms']}ms, chamada nº {info['chamadas']})")
+        for i in range(3):
+            inicio = time.perf_counter()
+            resultado = worker.scrape_estado.remote(estado, data)
+            print(f"  scrape {estado} {i+1}: {(time.perf_counter() - inicio)*1000:.0f}ms ({len(resultado.get('resultados', []))} resultados)")
+
+    elif comando == "benchmark_modos":
+        resultado = benchmark_modos_scrape.remote(data)
         print(f"\nResultado: {resultado}")
 
     else:
         print(f"Comando: {comando}")
-        print("Comandos válidos: scrape, todos, historico, verificar")
+        print("Comandos válidos: scrape, todos, historico, verificar, benchmark_worker, benchmark_modos")
@@ -0,0 +1,140 @@
+-- Migration: Batch refund function
+-- Description: Refunds a batch of bets in one call (e.g. a banca outage leaving thousands of
+-- bets without result after 12h). Same rules as fn_process_refund, but the credit goes through
+-- fn_change_balance (ledger). Idempotent (only 'pendente' bets are refunded), per-item status,
+-- each item in its own savepoint.
+
+CREATE OR REPLACE FUNCTION fn_process_refunds_batch(
+  p_items JSONB -- [{"bet_id": uuid, "reason": text}, ...]
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_item JSONB;
+  v_bet_id UUID;
+  v_reason TEXT;
+  v_user_id UUID;
+  v_platform_id UUID;
+  v_current_status TEXT;
+  v_valor_total DECIMAL;
+  v_balance JSON;
+  v_results JSONB := '[]'::jsonb;
+  v_refunded INT := 0;
+  v_skipped INT := 0;
+  v_errors INT := 0;
+BEGIN
+  IF p_items IS NULL OR jsonb_typeof(p_items) <> 'array' THEN
+    RETURN jsonb_build_object('success', true, 'refunded', 0, 'skipped', 0, 'errors', 0, 'items', v_results);
+  END IF;
+
+  FOR v_item IN SELECT * FROM jsonb_array_elements(p_items) LOOP
+    BEGIN
+      v_bet_id := (v_item->>'bet_id')::uuid;
+      v_reason := COALESCE(v_item->>'reason', 'Resultado não disponível');
+
+      -- 1. Lock bet row and check status
+      SELECT user_id, platform_id, status, valor_total
+      INTO v_user_id, v_platform_id, v_current_status, v_valor_total
+      FROM apostas
+      WHERE id = v_bet_id
+      FOR UPDATE;
+
+      IF NOT FOUND THEN
+        v_skipped := v_skipped + 1;
+        v_results := v_results || jsonb_build_object('bet_id', v_bet_id, 'status', 'not_found');
+        CONTINUE;
+      END IF;
+
+      IF v_current_status != 'pendente' THEN
+        v_skipped := v_skipped + 1;
+        v_results := v_results || jsonb_build_object('bet_id', v_bet_id, 'status', 'skipped', 'bet_status', v_current_status);
+        CONTINUE;
+      END IF;
+
+      IF v_valor_total IS NULL OR v_valor_total <= 0 THEN
+        -- Still mark as refunded even if no value
+        UPDATE apostas
+        SET
+          status = 'reembolsado',
+          updated_at = NOW()
+        WHERE id = v_bet_id;
+
+        v_refunded := v_refunded + 1;
+        v_results := v_results || jsonb_build_object('bet_id', v_bet_id, 'status', 'refunded', 'refund', 0);
+        CONTINUE;
+      END IF;
+
+      -- 2. Credit balance through the ledger
+      v_balance := fn_change_balance(
+        v_user_id,
+        v_valor_total,
+        'reembolso',
+        'saldo',
+        v_bet_id,
+        'Reembolso: resultado indisponivel apos 12h'
+      );
+
+      IF COALESCE((v_balance->>'success')::boolean, false) IS NOT TRUE THEN
+        RAISE EXCEPTION 'fn_change_balance error: %', v_balance->>'error';
+      END IF;
+
+      -- 3. Log Transaction
+      INSERT INTO transactions (
+        user_id,
+        platform_id,
+        tipo,
+        amount,
+        status,
+        external_id,
+        metadata,
+        created_at
+      ) VALUES (
+        v_user_id,
+        v_platform_id,
+        'refund',
+        v_valor_total,
+        'completed',
+        'refund_' || v_bet_id,
+        jsonb_build_object('reason', v_reason, 'bet_id', v_bet_id),
+        NOW()
+      );
+
+      -- 4. Mark bet as refunded (only after the credit)
+      UPDATE apostas
+      SET
+        status = 'reembolsado',
+        updated_at = NOW()
+      WHERE id = v_bet_id;
+
+      v_refunded := v_refunded + 1;
+      v_results := v_results || jsonb_build_object(
+        'bet_id', v_bet_id,
+        'status', 'refunded',
+        'refund', v_valor_total,
+        'balance_after', (v_balance->>'balance_after')::numeric
+      );
+
+    EXCEPTION WHEN OTHERS THEN
+      -- Savepoint rollback: this item is untouched, the rest of the batch goes on
+      v_errors := v_errors + 1;
+      v_results := v_results || jsonb_build_object('bet_id', v_item->>'bet_id', 'status', 'error', 'error', SQLERRM);
+    END;
+  END LOOP;
+
+  RETURN jsonb_build_object(
+    'success', true,
+    'refunded', v_refunded,
+    'skipped', v_skipped,
+    'errors', v_errors,
+    'items', v_results
+  );
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION fn_process_refunds_batch(JSONB) FROM public, anon, authenticated;
+GRANT EXECUTE ON FUNCTION fn_process_refunds_batch(JSONB) TO service_role;
+
+COMMENT ON FUNCTION fn_process_refunds_batch IS 'Batch refund: per item locks bet, credits valor_total via fn_change_balance, logs transaction, marks reembolsado. Idempotent, per-item status.';
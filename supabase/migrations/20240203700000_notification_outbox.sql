@@ -0,0 +1,64 @@
+-- Migration: Notification outbox
+-- Description: Prize notifications are enqueued here by the verifier and delivered to
+-- /api/internal/triggers by a separate drain worker (modal_scraper_v4.drenar_notificacoes),
+-- so verification never waits on the app server.
+
+CREATE TABLE IF NOT EXISTS notification_outbox (
+  id BIGSERIAL PRIMARY KEY,
+  trigger_type TEXT NOT NULL,
+  user_id UUID NOT NULL,
+  payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+  status TEXT NOT NULL DEFAULT 'pendente' CHECK (status IN ('pendente', 'enviando', 'enviado', 'falhou')),
+  tentativas INT NOT NULL DEFAULT 0,
+  proxima_tentativa TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  ultimo_erro TEXT,
+  reference_id UUID,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  sent_at TIMESTAMPTZ
+);
+
+-- Drain query: due rows of pending/in-flight status, oldest first
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_fila
+  ON notification_outbox (proxima_tentativa)
+  WHERE status IN ('pendente', 'enviando');
+
+ALTER TABLE notification_outbox ENABLE ROW LEVEL SECURITY;
+
+-- Claims up to p_limit due notifications for one drain worker.
+-- FOR UPDATE SKIP LOCKED lets concurrent workers claim disjoint rows. Claimed rows go to
+-- 'enviando' with a lease: if the worker dies, they become due again after p_lease_seconds.
+CREATE OR REPLACE FUNCTION fn_claim_notifications(
+  p_limit INT DEFAULT 100,
+  p_lease_seconds INT DEFAULT 120
+)
+RETURNS SETOF notification_outbox
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  RETURN QUERY
+  UPDATE notification_outbox o
+  SET
+    status = 'enviando',
+    tentativas = o.tentativas + 1,
+    proxima_tentativa = NOW() + make_interval(secs => p_lease_seconds),
+    updated_at = NOW()
+  WHERE o.id IN (
+    SELECT id
+    FROM notification_outbox
+    WHERE status IN ('pendente', 'enviando')
+      AND proxima_tentativa <= NOW()
+    ORDER BY proxima_tentativa
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  )
+  RETURNING o.*;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION fn_claim_notifications(INT, INT) FROM public, anon, authenticated;
+GRANT EXECUTE ON FUNCTION fn_claim_notifications(INT, INT) TO service_role;
+
+COMMENT ON TABLE notification_outbox IS 'Outbox of app trigger notifications (prize etc.), drained asynchronously with retry/backoff.';
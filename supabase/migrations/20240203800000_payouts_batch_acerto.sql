@@ -0,0 +1,132 @@
+-- Migration: Match detail on batch payouts
+-- Description: fn_process_payouts_batch accepts an optional "acerto" object per item
+-- (loteria, posicao, premio, faixa of the winning match) and stores it in the prize
+-- transaction metadata for audits. Everything else is unchanged.
+
+CREATE OR REPLACE FUNCTION fn_process_payouts_batch(
+  p_items JSONB -- [{"bet_id": uuid, "amount": numeric, "modalidade": text, "acerto": jsonb|null}, ...]
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_item JSONB;
+  v_bet_id UUID;
+  v_amount NUMERIC;
+  v_modalidade TEXT;
+  v_user_id UUID;
+  v_platform_id UUID;
+  v_current_status TEXT;
+  v_balance JSON;
+  v_results JSONB := '[]'::jsonb;
+  v_paid INT := 0;
+  v_skipped INT := 0;
+  v_errors INT := 0;
+BEGIN
+  IF p_items IS NULL OR jsonb_typeof(p_items) <> 'array' THEN
+    RETURN jsonb_build_object('success', true, 'paid', 0, 'skipped', 0, 'errors', 0, 'items', v_results);
+  END IF;
+
+  FOR v_item IN SELECT * FROM jsonb_array_elements(p_items) LOOP
+    BEGIN
+      v_bet_id := (v_item->>'bet_id')::uuid;
+      v_amount := round((v_item->>'amount')::numeric, 2);
+      v_modalidade := COALESCE(v_item->>'modalidade', '');
+
+      -- 1. Lock bet row and check status
+      SELECT user_id, platform_id, status
+      INTO v_user_id, v_platform_id, v_current_status
+      FROM apostas
+      WHERE id = v_bet_id
+      FOR UPDATE;
+
+      IF NOT FOUND THEN
+        v_skipped := v_skipped + 1;
+        v_results := v_results || jsonb_build_object('bet_id', v_bet_id, 'status', 'not_found');
+        CONTINUE;
+      END IF;
+
+      IF v_current_status != 'pendente' THEN
+        v_skipped := v_skipped + 1;
+        v_results := v_results || jsonb_build_object('bet_id', v_bet_id, 'status', 'skipped', 'bet_status', v_current_status);
+        CONTINUE;
+      END IF;
+
+      IF v_amount IS NULL OR v_amount <= 0 THEN
+        RAISE EXCEPTION 'Invalid amount: %', v_item->>'amount';
+      END IF;
+
+      -- 2. Credit balance through the ledger
+      v_balance := fn_change_balance(
+        v_user_id,
+        v_amount,
+        'premio',
+        'saldo',
+        v_bet_id,
+        'Premio ' || v_modalidade || ' aposta ' || left(v_bet_id::text, 8)
+      );
+
+      IF COALESCE((v_balance->>'success')::boolean, false) IS NOT TRUE THEN
+        RAISE EXCEPTION 'fn_change_balance error: %', v_balance->>'error';
+      END IF;
+
+      -- 3. Mark bet as paid (only after the credit)
+      UPDATE apostas
+      SET
+        status = 'premiada',
+        premio_valor = v_amount,
+        updated_at = NOW()
+      WHERE id = v_bet_id;
+
+      -- 4. Log Transaction
+      INSERT INTO transactions (
+        user_id,
+        platform_id,
+        tipo,
+        amount,
+        status,
+        external_id,
+        metadata,
+        created_at
+      ) VALUES (
+        v_user_id,
+        v_platform_id,
+        'prize',
+        v_amount,
+        'completed',
+        'payout_' || v_bet_id,
+        jsonb_build_object('modalidade', v_modalidade, 'description', 'Premio de aposta: ' || v_bet_id, 'acerto', v_item->'acerto'),
+        NOW()
+      );
+
+      v_paid := v_paid + 1;
+      v_results := v_results || jsonb_build_object(
+        'bet_id', v_bet_id,
+        'status', 'paid',
+        'amount', v_amount,
+        'balance_after', (v_balance->>'balance_after')::numeric
+      );
+
+    EXCEPTION WHEN OTHERS THEN
+      -- Savepoint rollback: this item is untouched, the rest of the batch goes on
+      v_errors := v_errors + 1;
+      v_results := v_results || jsonb_build_object('bet_id', v_item->>'bet_id', 'status', 'error', 'error', SQLERRM);
+    END;
+  END LOOP;
+
+  RETURN jsonb_build_object(
+    'success', true,
+    'paid', v_paid,
+    'skipped', v_skipped,
+    'errors', v_errors,
+    'items', v_results
+  );
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION fn_process_payouts_batch(JSONB) FROM public, anon, authenticated;
+GRANT EXECUTE ON FUNCTION fn_process_payouts_batch(JSONB) TO service_role;
+
+COMMENT ON FUNCTION fn_process_payouts_batch IS 'Batch payout: per item locks bet, credits via fn_change_balance, marks premiada, logs transaction (with match detail). Idempotent, per-item status.';
@@ -0,0 +1,48 @@
+-- Migration: Pending bets in columnar shape for the prize verifier
+-- Description: Returns one keyset page (id > p_apos_id, ordered by id) of the day's pending
+-- bets with only the columns the verifier reads, as parallel arrays
+-- {"id": [...], "user_id": [...], ...} instead of one object per row.
+-- Same filter and order as the projected select fallback in modal_scraper_v4.py.
+
+CREATE INDEX IF NOT EXISTS idx_apostas_data_status_id ON apostas(data_jogo, status, id);
+
+CREATE OR REPLACE FUNCTION fn_apostas_pendentes_colunar(
+  p_data DATE,
+  p_apos_id UUID DEFAULT NULL,
+  p_limite INT DEFAULT 1000
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+  WITH pagina AS (
+    SELECT id, user_id, platform_id, modalidade, palpites, colocacao, loterias,
+           valor_unitario, valor_total, multiplicador
+    FROM apostas
+    WHERE data_jogo = p_data
+      AND status = 'pendente'
+      AND (p_apos_id IS NULL OR id > p_apos_id)
+    ORDER BY id
+    LIMIT p_limite
+  )
+  SELECT jsonb_build_object(
+    'id', COALESCE(jsonb_agg(id ORDER BY id), '[]'::jsonb),
+    'user_id', COALESCE(jsonb_agg(user_id ORDER BY id), '[]'::jsonb),
+    'platform_id', COALESCE(jsonb_agg(platform_id ORDER BY id), '[]'::jsonb),
+    'modalidade', COALESCE(jsonb_agg(modalidade ORDER BY id), '[]'::jsonb),
+    'palpites', COALESCE(jsonb_agg(palpites ORDER BY id), '[]'::jsonb),
+    'colocacao', COALESCE(jsonb_agg(colocacao ORDER BY id), '[]'::jsonb),
+    'loterias', COALESCE(jsonb_agg(loterias ORDER BY id), '[]'::jsonb),
+    'valor_unitario', COALESCE(jsonb_agg(valor_unitario ORDER BY id), '[]'::jsonb),
+    'valor_total', COALESCE(jsonb_agg(valor_total ORDER BY id), '[]'::jsonb),
+    'multiplicador', COALESCE(jsonb_agg(multiplicador ORDER BY id), '[]'::jsonb)
+  )
+  FROM pagina;
+$$;
+
+REVOKE EXECUTE ON FUNCTION fn_apostas_pendentes_colunar(DATE, UUID, INT) FROM public, anon, authenticated;
+GRANT EXECUTE ON FUNCTION fn_apostas_pendentes_colunar(DATE, UUID, INT) TO service_role;
+
+COMMENT ON FUNCTION fn_apostas_pendentes_colunar IS 'Prize verifier: keyset page of pending bets for a day, projected columns as parallel arrays.';
@@ -0,0 +1,5 @@
+# Os testes importam modal_scraper_v4 direto da raiz do repositório
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
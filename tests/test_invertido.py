@@ -0,0 +1,68 @@
+"""
+Prova de equivalência do invertido por assinatura contra a versão antiga por permutações.
+
+Para cada prêmio 0000-9999 e cada recorte (milhar, centena direita, centena esquerda),
+o conjunto de palpites 0000-9999 aceitos pela assinatura tem de ser exatamente o conjunto
+aceito pelas permutações - isso cobre os 10.000 × 10.000 pares. Pares aleatórios com
+strings fora do formato (curtas, longas, não numéricas) completam a conferência.
+"""
+import random
+from itertools import permutations
+
+import pytest
+
+pytest.importorskip("modal")
+
+import modal_scraper_v4 as v4  # noqa: E402
+
+MILHARES = [f"{i:04d}" for i in range(10000)]
+
+
+def invertido_permutacoes(palpite: str, premio: str, n_digitos: int, esquerda: bool) -> bool:
+    # Referência: implementação original (gera todas as permutações dos dígitos do prêmio)
+    if esquerda:
+        palpite_digits = palpite[:n_digitos].zfill(n_digitos)
+        premio_digits = premio[:n_digitos].zfill(n_digitos)
+    else:
+        palpite_digits = palpite[-n_digitos:].zfill(n_digitos)
+        premio_digits = premio[-n_digitos:].zfill(n_digitos)
+    for perm in permutations(premio_digits):
+        if ''.join(perm) == palpite_digits:
+            return True
+    return False
+
+
+@pytest.mark.parametrize("n_digitos, esquerda", [(4, False), (3, False), (3, True)])
+def test_assinatura_igual_permutacoes_exaustivo(n_digitos, esquerda):
+    recorte = (lambda s: s[:n_digitos].zfill(n_digitos)) if esquerda else (lambda s: s[-n_digitos:].zfill(n_digitos))
+    novo = v4.is_invertido_esq if esquerda else v4.is_invertido
+    por_recorte, por_assinatura = {}, {}
+    for palpite in MILHARES:
+        por_recorte.setdefault(recorte(palpite), set()).add(palpite)
+        por_assinatura.setdefault(v4.assinatura_digitos(recorte(palpite)), set()).add(palpite)
+
+    divergencias = []
+    for premio in MILHARES:
+        aceitos_permutacoes = set()
+        for perm in set(permutations(recorte(premio))):
+            aceitos_permutacoes |= por_recorte.get("".join(perm), set())
+        aceitos_assinatura = por_assinatura[v4.assinatura_digitos(recorte(premio))]
+        # A função nova aceita exatamente os palpites da assinatura do prêmio
+        if aceitos_permutacoes != aceitos_assinatura or not all(novo(p, premio, n_digitos) for p in aceitos_assinatura):
+            divergencias.append(premio)
+    assert divergencias == []
+
+
+def test_assinatura_igual_permutacoes_fora_do_formato():
+    rnd = random.Random(7)
+    alfabeto = "0123456789" * 3 + "ab -٥"
+    divergencias = []
+    for _ in range(200000):
+        palpite = "".join(rnd.choice(alfabeto) for _ in range(rnd.randint(0, 6)))
+        premio = "".join(rnd.choice(alfabeto) for _ in range(rnd.randint(0, 6)))
+        n_digitos = rnd.choice((3, 4))
+        esquerda = n_digitos == 3 and rnd.random() < 0.5
+        novo = v4.is_invertido_esq if esquerda else v4.is_invertido
+        if novo(palpite, premio, n_digitos) != invertido_permutacoes(palpite, premio, n_digitos, esquerda):
+            divergencias.append((n_digitos, esquerda, palpite, premio))
+    assert divergencias[:5] == []
@@ -0,0 +1,156 @@
+"""
+Teste diferencial do motor em lote (NumPy) contra a referência (verificar_modalidade):
+apostas sintéticas aleatórias e, com DIFERENCIAL_DATA=AAAA-MM-DD e credenciais do Supabase,
+as apostas gravadas daquele dia.
+"""
+import contextlib
+import io
+import os
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("modal")
+
+import modal_scraper_v4 as v4  # noqa: E402
+
+
+def _referencia_par(plano, loteria_id: str, resultados_map: dict):
+    """
+    Decisão de verificar_modalidade para um par (aposta, loteria), como no loop da verificação:
+    False se a loteria não tem resultado, senão o Acerto (ou None)
+    """
+    destino = v4.destino_loteria(loteria_id)
+    if not destino:
+        return False
+    resultado = resultados_map.get(destino[3])
+    if not resultado:
+        return False
+    if destino[4] is not None:
+        resultado = v4._resultado_maluca(resultado, destino[4] == "lotece")
+    with contextlib.redirect_stdout(io.StringIO()):
+        acerto = v4.verificar_modalidade(plano.modalidade, plano.palpites, resultado, plano.posicoes)
+    if acerto is not None:
+        acerto.loteria = loteria_id
+    return acerto
+
+
+def _casos_aleatorios_lote(n_apostas: int, semente: int) -> tuple:
+    """Resultados e apostas sintéticos cobrindo todas as famílias, formatos de colocação e MALUCA"""
+    rnd = random.Random(semente)
+    resultados = []
+    for banca, horario, loteria in sorted(set(v4.LOTERIA_TO_BANCA.values())):
+        if rnd.random() < 0.2:
+            continue  # loteria ainda sem resultado
+        resultado = {"banca": banca, "horario": horario, "loteria": loteria}
+        for i in range(1, 11):
+            sorteio = rnd.random()
+            if sorteio < 0.85:
+                resultado[f"premio_{i}"] = f"{rnd.randrange(10000):04d}"
+            else:
+                resultado[f"premio_{i}"] = rnd.choice([None, "", "7", "12", "123", " 0042 ", "12345", "ab12"])
+        resultados.append(resultado)
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultados_map = v4.montar_resultados_map(resultados)
+
+    loteria_ids = list(v4.LOTERIA_TO_BANCA)
+    modalidades = list(v4._CHAVES_PALPITE) + ["palpitao", "centena_esquerda", "milhar_inv_24", "centena_inv_esq", " Milhar ", "duque_gp"]
+    colocacoes = ["1_premio", "geral", "1_ao_5_premio", "1_5_premio", "2_ao_7_premio", "1_e_1_5_premio", "10_premio", "0_3_premio", "x"]
+    apostas = []
+    for n in range(n_apostas):
+        loterias = rnd.sample(loteria_ids, rnd.randint(1, 3))
+        palpites = []
+        for _ in range(rnd.choice([1, 1, 2, 3, 5])):
+            sorteio = rnd.random()
+            if sorteio < 0.5:
+                # Parte de um prêmio real (às vezes embaralhada): garante vitórias
+                lid = rnd.choice(loterias)
+                banca, horario, loteria = v4.LOTERIA_TO_BANCA[lid]
+                premio = str((resultados_map.get(f"{horario}_{banca}_{loteria}") or {}).get(f"premio_{rnd.randint(1, 10)}") or "0000").strip()
+                trecho = premio[-rnd.randint(1, 4):]
+                if rnd.random() < 0.3:
+                    trecho = "".join(rnd.sample(trecho, len(trecho)))
+                if rnd.random() < 0.15:
+                    # Zeros à esquerda além de 4 dígitos ("01234"): não podem virar o prêmio "1234"
+                    trecho = "0" * rnd.randint(1, 4) + trecho
+                palpites.append(trecho)
+            elif sorteio < 0.9:
+                palpites.append(str(rnd.randrange(10 ** rnd.randint(1, 5))).zfill(rnd.randint(1, v4.MAX_DIGITOS_PALPITE_LOTE)))
+            else:
+                palpites.append(rnd.choice(["", " 7", "+5", "٥", "7a", "12345678901", None]))
+        apostas.append({
+            "id": f"sintetica-{n}",
+            "modalidade": rnd.choice(modalidades),
+            "palpites": palpites,
+            "colocacao": rnd.choice(colocacoes),
+            "loterias": loterias,
+        })
+    return resultados_map, apostas
+
+
+def diferencial_motor_lote(resultados_map: dict, apostas: list) -> dict:
+    """
+    Compara o motor NumPy com verificar_modalidade em todos os pares que o motor decidiu
+    (vitória e detalhe do acerto: posição, prêmio e faixa)
+    """
+    planos = [v4.BetPlan(a) for a in apostas]
+    decisoes = v4._decidir_pagina_lote(planos, resultados_map, v4.MatrizResultadosLote())
+    divergencias = []
+    for (indice_aposta, loteria_id), acerto in decisoes.items():
+        referencia = _referencia_par(planos[indice_aposta], loteria_id, resultados_map)
+        motor = acerto and acerto.como_dict()
+        esperado = referencia and referencia.como_dict()
+        if motor != esperado:
+            divergencias.append({"aposta": apostas[indice_aposta], "loteria": loteria_id, "motor": motor, "referencia": esperado})
+    return {
+        "decididos_motor": len(decisoes),
+        "vitorias": sum(acerto is not None for acerto in decisoes.values()),
+        "divergencias": divergencias,
+    }
+
+
+@pytest.mark.parametrize("semente", [1, 2, 3, 7])
+def test_motor_igual_referencia_aleatorias(semente):
+    relatorio = diferencial_motor_lote(*_casos_aleatorios_lote(10000, semente))
+    assert relatorio["decididos_motor"] > 0 and relatorio["vitorias"] > 0
+    assert relatorio["divergencias"] == []
+
+
+@pytest.mark.parametrize("modalidade", ["milhar", "palpitao", "milhar_ct"])
+def test_zeros_a_esquerda_alem_da_milhar_nao_viram_a_milhar(modalidade):
+    # "01234" não é a milhar "1234": a referência compara strings, o motor não pode usar int()
+    loteria_id = next(lid for lid in v4.LOTERIA_TO_BANCA if v4.destino_loteria(lid)[4] is None)
+    banca, horario, loteria = v4.LOTERIA_TO_BANCA[loteria_id]
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultados_map = v4.montar_resultados_map([{"banca": banca, "horario": horario, "loteria": loteria, "premio_1": "1234"}])
+    plano = v4.BetPlan({"id": "a", "modalidade": modalidade, "palpites": ["01234"], "colocacao": "1_premio", "loterias": [loteria_id]})
+
+    decisoes = v4._decidir_pagina_lote([plano], resultados_map, v4.MatrizResultadosLote())
+    assert (0, loteria_id) not in decisoes
+    referencia = _referencia_par(plano, loteria_id, resultados_map)
+    if modalidade == "milhar_ct":
+        assert referencia.faixa == "centena"
+    else:
+        assert referencia is None
+
+
+@pytest.mark.skipif(not os.environ.get("DIFERENCIAL_DATA"), reason="DIFERENCIAL_DATA não informada (apostas gravadas)")
+def test_motor_igual_referencia_gravadas():
+    data = os.environ["DIFERENCIAL_DATA"]
+    supabase = v4.cliente_supabase()
+    colunas = ", ".join(v4.COLUNAS_RESULTADOS_VERIFICACAO)
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultados_map = v4.montar_resultados_map(supabase.table("resultados").select(colunas).eq("data", data).execute().data or [])
+    apostas = []
+    ultimo_id = None
+    while True:
+        consulta = supabase.table("apostas").select("id, modalidade, palpites, colocacao, loterias").eq("data_jogo", data)
+        if ultimo_id:
+            consulta = consulta.gt("id", ultimo_id)
+        pagina = consulta.order("id").limit(v4.TAMANHO_PAGINA_APOSTAS).execute().data or []
+        if not pagina:
+            break
+        apostas.extend(pagina)
+        ultimo_id = pagina[-1]["id"]
+    assert diferencial_motor_lote(resultados_map, apostas)["divergencias"] == []